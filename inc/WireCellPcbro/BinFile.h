@@ -6,7 +6,16 @@
 #include <fstream>
 // #include <iostream>             // testing
 
+#include <array>
 #include <vector>
+#include <string>
+#include <algorithm>
+#include <stdexcept>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 /// not until GCC 8.1
 // #include <filesystem>
 
@@ -69,15 +78,96 @@ namespace pcbro {
     }
 
 
+    /// Convert nwords big-endian 2-byte words at src to host order
+    /// words at dst.  The src and dst may be the same memory.  This
+    /// is written so the compiler may vectorize it.
+    void swap_words(const unsigned char* src, size_t nwords, uint16_t* dst) {
+        for (size_t ind = 0; ind < nwords; ++ind) {
+            dst[ind] = (uint16_t)((src[2*ind] << 8) | src[2*ind+1]);
+        }
+    }
+
+    // Number of bytes read at a time from streams of unknown size.
+    const size_t raw_read_chunk = 1<<20;
+
+    /// Set the last word of rd given nbytes were read into it.
+    ///
+    /// This reproduces what reading one word at a time until the
+    /// stream fails always gave: an odd final byte makes the high
+    /// byte of a last word, else one extra zero word is appended.
+    void finish_raw_data(raw_data_t& rd, size_t nbytes, unsigned char last) {
+        rd.resize(nbytes/2 + 1);
+        rd.back() = (nbytes % 2) ? (uint16_t)(last << 8) : 0;
+    }
+
+    /// Convert nbytes of big-endian raw data at src to raw data.
+    raw_data_t raw_data_from_bytes(const unsigned char* src, size_t nbytes) {
+        raw_data_t rd(nbytes/2 + 1);
+        swap_words(src, nbytes/2, rd.data());
+        finish_raw_data(rd, nbytes, nbytes ? src[nbytes-1] : 0);
+        return rd;
+    }
+
     /// Slurp in all raw data from a stream.
+    ///
+    /// If the stream size can be found, all of it is read at once
+    /// directly into the raw data, otherwise it is read in large
+    /// chunks.  Words are then swapped from big-endian in place.
     raw_data_t read_raw_data(std::istream& stream) {
         raw_data_t rd;
-        while (stream) {
-            char buf[2] = {0};
-            stream.read(buf, 2);
-            // raw data stream is big endian.
-            rd.emplace_back( 0xffff&(((0xff & buf[0]) <<8) | (0xff & buf[1])) );
+        size_t nbytes = 0;
+
+        auto here = stream.tellg();
+        if (here >= 0 and stream.seekg(0, std::ios::end)) {
+            auto there = stream.tellg();
+            stream.seekg(here);
+            size_t want = there > here ? (size_t)(there - here) : 0;
+            rd.resize(want/2 + 1);
+            stream.read((char*)rd.data(), want);
+            nbytes = stream.gcount();
+        }
+        else {                  // not seekable
+            stream.clear();
+            while (stream) {
+                rd.resize((nbytes + raw_read_chunk)/2 + 1);
+                stream.read((char*)rd.data() + nbytes, raw_read_chunk);
+                nbytes += stream.gcount();
+            }
         }
+        const unsigned char* bytes = (const unsigned char*)rd.data();
+        unsigned char last = nbytes ? bytes[nbytes-1] : 0;
+        swap_words(bytes, nbytes/2, rd.data());
+        finish_raw_data(rd, nbytes, last);
+        return rd;
+    }
+
+    /// Slurp in all raw data from a file.
+    ///
+    /// The file is memory mapped and its words swapped directly into
+    /// the raw data.  Files which can not be mapped are read as a
+    /// stream.
+    raw_data_t read_raw_data(const std::string& filename) {
+        int fd = ::open(filename.c_str(), O_RDONLY);
+        if (fd < 0) {
+            throw std::runtime_error("pcbro: failed to open file: " + filename);
+        }
+        struct stat st;
+        void* mem = MAP_FAILED;
+        if (::fstat(fd, &st) == 0 and S_ISREG(st.st_mode) and st.st_size > 0) {
+            mem = ::mmap(nullptr, st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+        }
+        if (mem == MAP_FAILED) {
+            ::close(fd);
+            std::ifstream fstr(filename, std::ios_base::in | std::ios_base::binary);
+            if (!fstr) {
+                throw std::runtime_error("pcbro: failed to open file: " + filename);
+            }
+            return read_raw_data(fstr);
+        }
+        ::madvise(mem, st.st_size, MADV_SEQUENTIAL);
+        auto rd = raw_data_from_bytes((const unsigned char*)mem, st.st_size);
+        ::munmap(mem, st.st_size);
+        ::close(fd);
         return rd;
     }
         
@@ -89,13 +179,16 @@ namespace pcbro {
     /// end.  Throws runtime_error if data is corrupt.  Returns end if
     /// no next package is found.
     raw_data_itr seek_package(raw_data_itr beg, raw_data_itr end) {
+        if (std::distance(beg, end) < 4) {
+            return end;
+        }
         auto pkg_cnt0 = word(beg);
         auto pkg_res0 = word(beg+2);
         if (pkg_res0 != 0) {
             throw std::runtime_error("corruption on seek package");
         }
         beg += 4;
-        while (beg < end) {
+        while (beg + 4 <= end) {
             auto pkg_cnt1 = word(beg);
             auto pkg_res1 = word(beg+2);
             if (pkg_cnt1 == pkg_cnt0 + 1 and pkg_res1 == 0) {
@@ -236,13 +329,384 @@ namespace pcbro {
             beg = next;
 
             size_t nticks = ld.size() / 25;
-            if (nticks > (size_t)block.rows()) {
-                block.resize(nticks, Eigen::NoChange);
+            const size_t nrows = block.rows();
+            if (nticks > nrows) {
+                // rows of earlier, shorter links are zero
+                block.conservativeResize(nticks, Eigen::NoChange);
+                block.bottomRows(nticks - nrows).setZero();
+            }
+            else if (nticks < nrows) {
+                block.block(nticks, ilink*32, nrows - nticks, 32).setZero();
             }
             unpack_link(block.block(0, ilink*32, nticks, 32), ld.begin(), ld.end());
         }
         return beg;
     }
+
+    // The link data of one trigger.  Kept between triggers so their
+    // memory is reused.
+    using trigger_links_t = std::array<link_data_t, 4>;
+
+    /// Collect the four links of the trigger starting at beg into
+    /// links, reusing their memory.  Return the start of the next
+    /// package or end.  Throws range_error as make_trigger().
+    raw_data_itr gather_trigger(trigger_links_t& links,
+                                raw_data_itr beg, raw_data_itr end,
+                                size_t package_size = default_package_size) {
+        for (int ilink=0; ilink < 4; ++ilink) {
+            links[ilink].clear();
+            auto next = make_link(beg, end, std::back_inserter(links[ilink]), package_size);
+            if (next == end and ilink < 3) {
+                throw std::range_error("short read");
+            }
+            beg = next;
+        }
+        return beg;
+    }
+
+    /// Number of ticks in a gathered trigger, that of its longest link.
+    size_t trigger_ticks(const trigger_links_t& links) {
+        size_t nticks = 0;
+        for (const auto& ld : links) {
+            nticks = std::max(nticks, ld.size() / 25);
+        }
+        return nticks;
+    }
+
+    /// Unpack ticks [t0,t1) of a gathered trigger directly to out.
+    ///
+    /// The sample of electronics channel ec at tick t is written to
+    /// out[t*tstride + coff[ec]] so any layout and channel order may
+    /// be had without a further copy.  Ticks past the end of a
+    /// shorter link are zero as with make_trigger().  The output is
+    /// written one tick at a time.
+    template <typename T>
+    void unpack_trigger(const trigger_links_t& links, size_t t0, size_t t1,
+                        T* out, size_t tstride, const int* coff) {
+        // Start channel of each group of 4 in a 32 channel sample.
+        static const int segs[8] = {4, 0, 12, 8, 20, 16, 28, 24};
+        for (size_t tick = t0; tick < t1; ++tick) {
+            T* row = out + tick*tstride;
+            for (int ilink=0; ilink < 4; ++ilink) {
+                const int* lcoff = coff + ilink*32;
+                const auto& ld = links[ilink];
+                if ((tick+1)*25 > ld.size()) {
+                    for (int ind=0; ind < 32; ++ind) {
+                        row[lcoff[ind]] = 0;
+                    }
+                    continue;
+                }
+                const int* beg = ld.data() + tick*25 + 1;
+                for (int igrp=0; igrp < 8; ++igrp, beg += 3) {
+                    const int* c = lcoff + segs[igrp];
+                    row[c[3]] = 0x0fff & beg[0];
+                    row[c[2]] = 0x0fff & (((beg[1] & 0x00FF)<<4) + ((beg[0] & 0xF000) >> 12));
+                    row[c[1]] = 0x0fff & (((beg[2] & 0x000F)<<8) + ((beg[1] & 0xFF00) >> 8));
+                    row[c[0]] = 0x0fff & ((beg[2] & 0xFFF0)>>4);
+                }
+            }
+        }
+    }
+
+    /// Return the start of the package following the trigger which
+    /// starts at beg, or end, without unpacking it.  This finds the
+    /// same trigger boundaries as make_trigger() including throwing
+    /// range_error if the data ends before a fourth link.
+    raw_data_itr seek_trigger(raw_data_itr beg, raw_data_itr end,
+                              size_t package_size = default_package_size) {
+        for (int ilink=0; ilink < 4; ++ilink) {
+            while (true) {
+                auto next = seek_package(beg, end);
+                if (next == end) {
+                    if (ilink < 3) {
+                        throw std::range_error("short read");
+                    }
+                    return end;
+                }
+                size_t psize = std::distance(beg, next);
+                beg = next;
+                if (psize < package_size) {
+                    break;
+                }
+            }
+        }
+        return beg;
+    }
+
+    /// Location of one package in raw data as word offsets.
+    struct PackageIndex {
+        size_t offset;          // of the package header
+        size_t size;            // number of words up to next header
+        uint32_t count;         // the package count from the header
+    };
+
+    /// Location of one trigger in raw data as word offsets.
+    struct TriggerIndex {
+        size_t begin;           // header of first package
+        size_t end;             // header of the next trigger or end of data
+        size_t npackages;       // number of packages holding the 4 links
+    };
+
+    /// An index of packages and triggers in raw data.
+    struct RawIndex {
+        size_t nwords{0};       // size of raw data indexed
+        size_t package_size{default_package_size};
+        std::vector<PackageIndex> packages;
+        std::vector<TriggerIndex> triggers;
+        /// Word offsets where the package sequence could not be
+        /// continued: a corrupt header or a package count missing
+        /// before the end of the data.
+        std::vector<size_t> breaks;
+
+        /// If the sequence was resynchronized after breaks.  Then,
+        /// for each break, the word offset of the trigger where
+        /// indexing resumed, or nwords if none, and the number of
+        /// triggers dropped in total, wholly or in part.
+        bool resync{false};
+        std::vector<size_t> resumes;
+        size_t dropped{0};
+
+        // File level information, used to validate a sidecar file.
+        size_t file_size{0};
+        long file_mtime{0};
+    };
+
+    /// Return the start of the first package at or after beg which
+    /// may continue a package sequence broken by bad data, or end.
+    ///
+    /// The header must have a zero reserved word and a package count
+    /// greater than count.  With a period, the count must also be a
+    /// whole number of periods past ref so that, as packages per
+    /// trigger do not change, the package starts a trigger as the one
+    /// of count ref did.  A header with the next count must follow
+    /// within one package.
+    raw_data_itr resync_package(raw_data_itr beg, raw_data_itr end,
+                                uint32_t count, uint32_t ref, size_t period,
+                                size_t package_size = default_package_size) {
+        for (auto cur = beg; std::distance(cur, end) >= 4; ++cur) {
+            if (*(cur+2) != 0 or *(cur+3) != 0) {
+                continue;
+            }
+            const uint32_t cnt = word(cur);
+            if (cnt <= count or (period and (cnt - ref) % period)) {
+                continue;
+            }
+            auto stop = cur + std::min<size_t>(package_size, std::distance(cur, end) - 4);
+            for (auto nxt = cur + 4; nxt <= stop; ++nxt) {
+                if (word(nxt) == cnt + 1 and word(nxt+2) == 0) {
+                    return cur;
+                }
+            }
+        }
+        return end;
+    }
+
+    /// Index all packages and triggers of raw data in one pass.
+    ///
+    /// Triggers are recorded only if make_trigger() would decode them
+    /// without error, so make_trigger(block, beg + trig.begin, end)
+    /// gives the same result as reaching it sequentially.
+    ///
+    /// Indexing stops at the first break in the package sequence
+    /// unless resync is true.  Then, if a trigger was completed
+    /// before the break, the trigger in which it happened is dropped
+    /// and indexing resumes at the first trigger found after it by
+    /// resync_package() with the package count and number of packages
+    /// of the last complete trigger.
+    RawIndex index_raw_data(raw_data_itr beg, raw_data_itr end,
+                            size_t package_size = default_package_size,
+                            bool resync = false) {
+        RawIndex ri;
+        ri.nwords = std::distance(beg, end);
+        ri.package_size = package_size;
+        ri.resync = resync;
+
+        size_t tbeg = 0, tpkgs = 0;
+        int nlinks = 0;
+        // The first package count and number of packages of the
+        // last complete trigger, period is 0 if none.
+        uint32_t ref = 0;
+        size_t period = 0;
+        auto cur = beg;
+        while (std::distance(cur, end) >= 4) {
+            const size_t offset = std::distance(beg, cur);
+            raw_data_itr next = end;
+            bool corrupt = false;
+            try {
+                next = seek_package(cur, end);
+            }
+            catch (const std::runtime_error& err) {
+                corrupt = true;
+            }
+            // a lost package count well before the end
+            const bool lost = !corrupt and next == end
+                and ri.nwords - offset > 2*package_size;
+            if ((corrupt or lost) and resync and period) {
+                ri.breaks.push_back(offset);
+                const uint32_t tcount = word(beg + tbeg);
+                auto res = resync_package(cur + 4, end, ri.packages.back().count,
+                                          ref, period, package_size);
+                if (res == end) {
+                    ri.resumes.push_back(ri.nwords);
+                    ++ri.dropped;
+                    break;
+                }
+                ri.resumes.push_back(std::distance(beg, res));
+                ri.dropped += (word(res) - tcount) / period;
+                tbeg = ri.resumes.back();
+                tpkgs = 0;
+                nlinks = 0;
+                cur = res;
+                continue;
+            }
+            if (corrupt) {
+                ri.breaks.push_back(offset);
+                break;
+            }
+            if (next == end) {
+                // make_link() drops a last package without a
+                // following header, but it still ends a 4th link.
+                if (nlinks == 3) {
+                    ri.triggers.push_back({tbeg, ri.nwords, tpkgs});
+                }
+                if (lost) {
+                    ri.breaks.push_back(offset);
+                }
+                break;
+            }
+            const size_t psize = std::distance(cur, next);
+            ri.packages.push_back({offset, psize, word(cur)});
+            ++tpkgs;
+            if (psize < package_size) {
+                ++nlinks;
+                if (nlinks == 4) {
+                    const size_t noff = std::distance(beg, next);
+                    ri.triggers.push_back({tbeg, noff, tpkgs});
+                    ref = word(beg + tbeg);
+                    period = tpkgs;
+                    tbeg = noff;
+                    tpkgs = 0;
+                    nlinks = 0;
+                }
+            }
+            cur = next;
+        }
+        return ri;
+    }
+
+    // First line of an index sidecar file.
+    const std::string raw_index_magic = "# pcbro raw index 2";
+
+    /// Return the name of the sidecar index file for a .bin file.
+    std::string raw_index_path(const std::string& filename) {
+        return filename + ".idx";
+    }
+
+    /// Write index as text.
+    void write_raw_index(std::ostream& out, const RawIndex& ri) {
+        out << raw_index_magic << "\n"
+            << "nwords " << ri.nwords << " package_size " << ri.package_size
+            << " file_size " << ri.file_size << " file_mtime " << ri.file_mtime
+            << " resync " << ri.resync << " dropped " << ri.dropped << "\n"
+            << "packages " << ri.packages.size() << "\n";
+        for (const auto& p : ri.packages) {
+            out << p.offset << " " << p.size << " " << p.count << "\n";
+        }
+        out << "triggers " << ri.triggers.size() << "\n";
+        for (const auto& t : ri.triggers) {
+            out << t.begin << " " << t.end << " " << t.npackages << "\n";
+        }
+        out << "breaks " << ri.breaks.size() << "\n";
+        for (auto b : ri.breaks) {
+            out << b << "\n";
+        }
+        out << "resumes " << ri.resumes.size() << "\n";
+        for (auto r : ri.resumes) {
+            out << r << "\n";
+        }
+    }
+
+    /// Read index as written by write_raw_index().  Throws
+    /// runtime_error if the input is not an index.
+    RawIndex read_raw_index(std::istream& in) {
+        RawIndex ri;
+        std::string line, key;
+        std::getline(in, line);
+        if (line != raw_index_magic) {
+            throw std::runtime_error("not a pcbro raw index");
+        }
+        size_t num = 0;
+        in >> key >> ri.nwords >> key >> ri.package_size
+           >> key >> ri.file_size >> key >> ri.file_mtime
+           >> key >> ri.resync >> key >> ri.dropped;
+        in >> key >> num;
+        ri.packages.resize(num);
+        for (auto& p : ri.packages) {
+            in >> p.offset >> p.size >> p.count;
+        }
+        in >> key >> num;
+        ri.triggers.resize(num);
+        for (auto& t : ri.triggers) {
+            in >> t.begin >> t.end >> t.npackages;
+        }
+        in >> key >> num;
+        ri.breaks.resize(num);
+        for (auto& b : ri.breaks) {
+            in >> b;
+        }
+        in >> key >> num;
+        ri.resumes.resize(num);
+        for (auto& r : ri.resumes) {
+            in >> r;
+        }
+        if (!in) {
+            throw std::runtime_error("truncated pcbro raw index");
+        }
+        return ri;
+    }
+
+    /// Return an index of the raw data rd read from filename.
+    ///
+    /// If a sidecar index file exists and matches the size and
+    /// modification time of filename, the package size and resync,
+    /// it is used.  Otherwise the raw data is indexed and, if write
+    /// is true, the sidecar is (re)written.
+    RawIndex sidecar_raw_index(const std::string& filename, raw_data_t& rd,
+                               bool write = true,
+                               size_t package_size = default_package_size,
+                               bool resync = false) {
+        struct stat st;
+        if (::stat(filename.c_str(), &st) != 0) {
+            throw std::runtime_error("pcbro: failed to stat file: " + filename);
+        }
+        const std::string ipath = raw_index_path(filename);
+        {
+            std::ifstream in(ipath);
+            if (in) {
+                try {
+                    auto ri = read_raw_index(in);
+                    if (ri.file_size == (size_t)st.st_size
+                        and ri.file_mtime == (long)st.st_mtime
+                        and ri.package_size == package_size
+                        and ri.resync == resync
+                        and ri.nwords == rd.size()) {
+                        return ri;
+                    }
+                }
+                catch (const std::runtime_error& err) {
+                    // stale or foreign, remake it
+                }
+            }
+        }
+        auto ri = index_raw_data(rd.begin(), rd.end(), package_size, resync);
+        ri.file_size = st.st_size;
+        ri.file_mtime = st.st_mtime;
+        if (write) {
+            std::ofstream out(ipath);
+            write_raw_index(out, ri);
+        }
+        return ri;
+    }
 }
 
 #endif
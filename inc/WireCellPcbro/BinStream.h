@@ -3,17 +3,22 @@
 #ifndef PCBRO_BINSTREAM_H_SEEN
 #define PCBRO_BINSTREAM_H_SEEN
 
+#include "WireCellPcbro/BinFile.h"
+
 #include <Eigen/Core>
 
 #include <iostream>
 #include <istream>
+#include <fstream>
+#include <memory>
 #include <vector>
+#include <cstring>
 
 namespace pcbro {
 
     // Many N samples (rows) across 32 contiguous channels (columns).
+    // Triggers of 128 channels use block128_t from BinFile.h.
     using block32_t = Eigen::Array<uint16_t, Eigen::Dynamic, 32>;
-    using block128_t = Eigen::Array<uint16_t, Eigen::Dynamic, 128>;
 
 
     inline uint32_t toint(char* dat) {
@@ -35,7 +40,7 @@ namespace pcbro {
         return 0xffff&(((0xff & buf[0]) <<8) | (0xff & buf[1]));
     }
     inline void read_nshorts(std::istream& s, size_t n, uint16_t buf[]) {
-        for (size_t ind=0; ind<n; ++n) {
+        for (size_t ind=0; ind<n; ++ind) {
             buf[ind] = read_short(s);
         }
     }
@@ -90,28 +95,25 @@ namespace pcbro {
         return in;
     }
 
-    inline Eigen::Index fill4(block32_t& block, Eigen::Index irow, Eigen::Index icol, char* buf) {
-        block(irow, icol+3) = 0x0fff&((0x0f00&(buf[1]<<8))|(0xff&(buf[0]<<0)));
-        block(irow, icol+2) = 0x0fff&((0x0ff0&(buf[2]<<4))|(0x0f&(buf[1]>>4)));
-
-        block(irow, icol+1) = 0x0fff&((0x0f00&(buf[4]<<8))|(0xff&(buf[3]<<0)));
-        block(irow, icol+0) = 0x0fff&((0x0ff0&(buf[5]<<4))|(0x0f&(buf[4]>>4)));
-
+    /// Unpack four 12 bit samples from 6 big-endian bytes into
+    /// columns icol to icol+3 of row irow.  This gives what
+    /// unpack_sample4() of BinFile.h gives for the same bytes.
+    template <typename Block>
+    inline Eigen::Index fill4(Block& block, Eigen::Index irow, Eigen::Index icol, const char* buf) {
+        const unsigned char* b = (const unsigned char*)buf;
+        block(irow, icol+3) = ((b[0]&0x0f)<<8) | b[1];
+        block(irow, icol+2) = (b[3]<<4) | (b[0]>>4);
+        block(irow, icol+1) = ((b[5]&0x0f)<<8) | b[2];
+        block(irow, icol+0) = (b[4]<<4) | (b[5]>>4);
         return icol+4;
     };
 
-    inline void append_sample(char buf[], block32_t& block) {
-        Eigen::Index irow = block.rows();
-        block.resize(irow+1, Eigen::NoChange);
-
-        // std::cerr << "appending: " << irow << std::endl;
-        // for (int ind=0; ind<48; ++ind) {
-        //     std::cerr << std::hex << " " << (int)(0xff&buf[ind]);
-        // }
-        // std::cerr << std::endl;
-
-        Eigen::Index icol = 0;
-        
+    /// Unpack one sample of 48 bytes (following its marker) into row
+    /// irow across the 32 columns starting at icol.  The block must
+    /// already have the row.
+    template <typename Block>
+    inline void append_sample(const char buf[], Block& block,
+                              Eigen::Index irow, Eigen::Index icol = 0) {
         icol = fill4(block, irow, icol, &buf[6]);
         icol = fill4(block, irow, icol, &buf[0]);
         
@@ -123,26 +125,38 @@ namespace pcbro {
         
         icol = fill4(block, irow, icol, &buf[42]);
         icol = fill4(block, irow, icol, &buf[36]);
+    }
 
-        assert(icol == 32);
-        for (int ind=0; ind<icol; ++ind) {
-            uint16_t sample = block(irow, ind);
-            assert((sample&0xf000) == 0);
-            //std::cerr << std::hex << " " << block(irow,ind);
+    /// Make block hold at least nrows rows, growing geometrically
+    /// and keeping its first keep rows.
+    template <typename Block>
+    inline void reserve_rows(Block& block, Eigen::Index nrows, Eigen::Index keep) {
+        if (nrows <= block.rows()) {
+            return;
+        }
+        nrows = std::max(nrows, 2*block.rows());
+        if (keep == 0) {
+            block.resize(nrows, Eigen::NoChange);
+        }
+        else {
+            block.conservativeResize(nrows, Eigen::NoChange);
         }
-        //std::cerr << std::endl;
     }
-    
-    /// Read in and append one package of samples to a block.  Reading
-    /// continues until a non-sample marker is found.  This is assumed
-    /// to start a new header, which is read in and returned.
-    inline Header read_package(std::istream& in, block32_t& block, size_t max_rows = 153) {
+
+    /// Read in and append one package of samples to a block at row
+    /// nrows, which is advanced.  The block grows geometrically and
+    /// may have rows past nrows.  Reading continues until a
+    /// non-sample marker is found.  This is assumed to start a new
+    /// header, which is read in and returned.
+    inline Header read_package(std::istream& in, block32_t& block, Eigen::Index& nrows,
+                               size_t max_rows = 153) {
         char buf[48];
+        reserve_rows(block, nrows + max_rows, nrows);
         uint16_t first = read_short(in);
-        size_t nrows = 0;
+        size_t npkg = 0;
         while (first == 0xface or first == 0xfeed) {
-            ++nrows;
-            if (nrows > max_rows) {
+            ++npkg;
+            if (npkg > max_rows) {
                 // It seems the DAQ can start saving without breaking
                 // up data into packages.
                 throw std::range_error("exceed max row");
@@ -151,7 +165,7 @@ namespace pcbro {
 
             uint16_t second = read_short(in); // either face/feed or seq.
             if (second == 0xface or second == 0xfeed) {
-                append_sample(buf, block);
+                append_sample(buf, block, nrows++);
                 first = second;
                 continue;
             }
@@ -173,30 +187,51 @@ namespace pcbro {
                 buf[46] = 0xff&(ph.cont>>8);
                 buf[47] = 0xff&ph.cont;
             }
-            append_sample(buf, block);
+            append_sample(buf, block, nrows++);
             return ph;
         }
         return Header{};
     }
 
+    /// Read in and append one package of samples to a block which
+    /// is then sized to the samples it holds.
+    inline Header read_package(std::istream& in, block32_t& block, size_t max_rows = 153) {
+        Eigen::Index nrows = block.rows();
+        try {
+            auto head = read_package(in, block, nrows, max_rows);
+            block.conservativeResize(nrows, Eigen::NoChange);
+            return head;
+        }
+        catch (...) {
+            block.conservativeResize(nrows, Eigen::NoChange);
+            throw;
+        }
+    }
+
     // fixme: maybe return some summary of headers consumed?
     inline void read_link(std::istream& in, block32_t& block, size_t max_rows = 153) {
-        size_t nrows=0;
-        while (true) {
+        Eigen::Index nrows = block.rows();
+        try {
+            while (true) {
 
-            //Header nhead =
-            read_package(in, block);
+                //Header nhead =
+                const Eigen::Index before = nrows;
+                read_package(in, block, nrows, max_rows);
 
-            const size_t drows = block.rows() - nrows;
-            nrows = block.rows();
+                const size_t drows = nrows - before;
 
-            // std::cerr << "link: nrows: " << nrows << " drows: " << drows << std::endl;
+                // std::cerr << "link: nrows: " << nrows << " drows: " << drows << std::endl;
 
-            if (drows < max_rows) {
-                return;
+                if (drows < max_rows) {
+                    break;
+                }
             }
-
         }
+        catch (...) {
+            block.conservativeResize(nrows, Eigen::NoChange);
+            throw;
+        }
+        block.conservativeResize(nrows, Eigen::NoChange);
     }
 
     void read_trigger(std::istream& in, block128_t& block) {
@@ -209,15 +244,219 @@ namespace pcbro {
             size_t nrows = link.rows();
             // std::cerr << "trigger: link:" << ilink << " nrows:" << nrows << " nrowsin:" << nrowsin << std::endl;
             if (nrows > nrowshere) {
+                block.conservativeResize(nrowsin + nrows, Eigen::NoChange);
+                block.bottomRows(nrows - nrowshere).setZero();
                 nrowshere = nrows;
-                block.resize(nrowsin + nrowshere, Eigen::NoChange);
             }
             // block.block(r,c,nr,nc)
-            block.block(nrowsin, ilink*32, nrows, 32) = link;
+            block.block(nrowsin, ilink*32, nrows, 32) = link.cast<adc_t>();
         }        
     }
 
 
+    /// Decode triggers from a stream of raw .bin data.
+    ///
+    /// This is a second decoder to make_trigger() on slurped data.
+    /// Raw bytes are read in chunks and only the current package is
+    /// kept.  Each sample is unpacked from its 48 raw bytes as soon
+    /// as they are read and a trigger block starts with the size of
+    /// the last one, growing geometrically if needed.  Packages,
+    /// links and triggers are found as by make_trigger() so that the
+    /// blocks are identical.
+    class BinStreamDecoder {
+    public:
+
+        /// Decode from the stream which must outlive this.
+        explicit BinStreamDecoder(std::istream& in,
+                                  size_t package_size = default_package_size,
+                                  size_t chunk_bytes = raw_read_chunk)
+            : m_in(in), m_package_size(package_size), m_chunk(chunk_bytes)
+        {
+        }
+
+        /// Decode from the file.
+        explicit BinStreamDecoder(const std::string& filename,
+                                  size_t package_size = default_package_size,
+                                  size_t chunk_bytes = raw_read_chunk)
+            : m_own(new std::ifstream(filename, std::ios_base::in | std::ios_base::binary))
+            , m_in(*m_own), m_package_size(package_size), m_chunk(chunk_bytes)
+        {
+            if (!m_in) {
+                throw std::runtime_error("pcbro: failed to open file: " + filename);
+            }
+        }
+
+        /// Decode the next trigger into block.  Return false if no
+        /// more triggers.  Throws runtime_error on corrupt data.
+        bool next(block128_t& block) { return decode(&block); }
+
+        /// Move past the next trigger without unpacking it.  Return
+        /// false if no more triggers.
+        bool skip() { return decode(nullptr); }
+
+        /// Read the first chunk, if not yet read, without decoding.
+        void prime() {
+            if (m_buf.empty()) {
+                fill();
+            }
+        }
+
+        /// Ticks of each link of the last trigger from next().
+        const std::array<Eigen::Index, 4>& link_ticks() const { return m_nrows; }
+
+        /// Total number of bytes read from the stream so far.
+        size_t bytes_read() const { return m_nread; }
+
+    private:
+
+        std::unique_ptr<std::istream> m_own;
+        std::istream& m_in;
+        size_t m_package_size, m_chunk;
+        std::vector<unsigned char> m_buf;
+        size_t m_pos{0};        // start of current package in m_buf
+        bool m_eof{false};
+        size_t m_nread{0};
+        Eigen::Index m_hint{0}; // ticks of the last trigger
+        std::array<Eigen::Index, 4> m_nrows{}; // and of its links
+
+        // A sample split between packages.
+        unsigned char m_carry[50];
+        size_t m_ncarry{0};
+
+        static const size_t npos = (size_t)-1;
+
+        uint16_t word16(size_t off) const {
+            return (m_buf[off] << 8) | m_buf[off+1];
+        }
+        uint32_t word32(size_t off) const {
+            return ((uint32_t)word16(off) << 16) | word16(off+2);
+        }
+
+        // Append a chunk, return false if at end of stream.
+        bool fill() {
+            if (m_eof) {
+                return false;
+            }
+            const size_t size = m_buf.size();
+            m_buf.resize(size + m_chunk);
+            m_in.read((char*)m_buf.data() + size, m_chunk);
+            const size_t nbytes = m_in.gcount();
+            m_nread += nbytes;
+            m_buf.resize(size + nbytes);
+            if (nbytes < m_chunk) {
+                // Same trailing word as read_raw_data() makes.
+                m_eof = true;
+                m_buf.resize(m_buf.size() + ((m_nread % 2) ? 1 : 2), 0);
+            }
+            return true;
+        }
+
+        // As seek_package() for the package at byte offset pos.
+        size_t find_next(size_t pos) {
+            while (m_buf.size() - pos < 8) {
+                if (! fill()) {
+                    return npos;
+                }
+            }
+            const uint32_t cnt0 = word32(pos);
+            if (word32(pos+4) != 0) {
+                throw std::runtime_error("corruption on seek package");
+            }
+            size_t off = pos + 8;
+            while (true) {
+                for (; off + 8 <= m_buf.size(); off += 2) {
+                    if (word32(off) == cnt0 + 1 and word32(off+4) == 0) {
+                        return off;
+                    }
+                }
+                if (! fill()) {
+                    return npos;
+                }
+            }
+        }
+
+        // Unpack whole samples of link payload bytes [beg,end).
+        void payload(block128_t& block, int ilink, Eigen::Index& irow,
+                     size_t beg, size_t end) {
+            const unsigned char* ptr = m_buf.data() + beg;
+            size_t left = end - beg;
+            auto one = [&](const unsigned char* sample) {
+                reserve_rows(block, irow+1, block.rows());
+                append_sample((const char*)sample + 2, block, irow, ilink*32);
+                ++irow;
+            };
+            if (m_ncarry) {
+                const size_t take = std::min(50 - m_ncarry, left);
+                std::memcpy(m_carry + m_ncarry, ptr, take);
+                m_ncarry += take;
+                ptr += take;
+                left -= take;
+                if (m_ncarry < 50) {
+                    return;
+                }
+                one(m_carry);
+                m_ncarry = 0;
+            }
+            for (; left >= 50; ptr += 50, left -= 50) {
+                one(ptr);
+            }
+            std::memcpy(m_carry, ptr, left);
+            m_ncarry = left;
+        }
+
+        bool decode(block128_t* block) {
+            if (m_pos >= m_chunk) {
+                m_buf.erase(m_buf.begin(), m_buf.begin() + m_pos);
+                m_pos = 0;
+            }
+            if (block) {
+                block->resize(std::max<Eigen::Index>(m_hint, 1), Eigen::NoChange);
+            }
+            auto& nrows = m_nrows;
+            nrows.fill(0);
+            for (int ilink=0; ilink < 4; ++ilink) {
+                m_ncarry = 0;
+                while (true) {
+                    const size_t next = find_next(m_pos);
+                    if (next == npos) {
+                        m_pos = m_buf.size();
+                        if (ilink < 3) {
+                            return false;
+                        }
+                        break;
+                    }
+                    if (block and next > m_pos + 16) {
+                        size_t start = m_pos + 16;
+                        const uint16_t second = word16(start+2);
+                        if (word16(start) == 0 and (second == 0xface or second == 0xfeed)) {
+                            start += 2;
+                        }
+                        payload(*block, ilink, nrows[ilink], start, next);
+                    }
+                    const size_t psize = (next - m_pos)/2;
+                    m_pos = next;
+                    if (psize < m_package_size) {
+                        break;
+                    }
+                }
+            }
+            if (! block) {
+                return true;
+            }
+            const Eigen::Index nticks = *std::max_element(nrows.begin(), nrows.end());
+            if (block->rows() != nticks) {
+                block->conservativeResize(nticks, Eigen::NoChange);
+            }
+            for (int ilink=0; ilink < 4; ++ilink) {
+                if (nrows[ilink] < nticks) {
+                    block->block(nrows[ilink], ilink*32, nticks - nrows[ilink], 32).setZero();
+                }
+            }
+            m_hint = nticks;
+            return true;
+        }
+    };
+
 } // namespace pcbro
 
 #endif
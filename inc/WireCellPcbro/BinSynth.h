@@ -0,0 +1,238 @@
+// Synthesize raw .bin data with known content.
+
+#ifndef PCBRO_BINSYNTH_H_SEEN
+#define PCBRO_BINSYNTH_H_SEEN
+
+#include "WireCellPcbro/BinFile.h"
+
+#include <fstream>
+#include <random>
+#include <string>
+#include <vector>
+
+namespace pcbro {
+
+    /// What raw data to synthesize.
+    struct SynthConfig {
+        size_t triggers{10};
+        // Samples in each link.  Link ilink has nticks -
+        // ilink*short_ticks of them so later links may be shorter.
+        size_t nticks{600};
+        size_t short_ticks{0};
+        size_t package_size{default_package_size};
+        // If true, a package whose data starts on a sample has a 0
+        // word before its marker, as seen in DAQ files.
+        bool zero_pad{true};
+        // Probability that a package header is damaged.
+        double corrupt_rate{0};
+        // If above 0, every trigger whose index is a multiple of this
+        // has pulse_adc added to all channels for pulse_ticks ticks
+        // from a quarter of the way in, as from a track.
+        size_t pulse_every{0};
+        size_t pulse_ticks{20};
+        uint16_t pulse_adc{1000};
+        uint32_t seed{1234};
+    };
+
+    /// Where things were put in synthesized raw data, as word offsets.
+    struct SynthTruth {
+        std::vector<size_t> triggers; // the first package of each
+        std::vector<size_t> damaged;  // package headers
+        std::vector<size_t> damaged_triggers; // holding a damaged header
+        size_t nwords{0};
+    };
+
+    /// The ADC of electronics channel ichan in [0,128) at a tick of
+    /// trigger itrig.  It is a baseline per channel plus a few bits
+    /// of hashed noise.
+    inline uint16_t synth_adc(uint32_t seed, size_t itrig, size_t itick, size_t ichan) {
+        uint32_t h = seed*0x9e3779b1u ^ (uint32_t)itrig*0x85ebca77u
+            ^ (uint32_t)itick*0xc2b2ae3du ^ (uint32_t)ichan*0x27d4eb2fu;
+        h ^= h >> 15;
+        h *= 0x2c1b3c6du;
+        h ^= h >> 12;
+        return 0x200 + 0x10*(ichan%64) + (h & 0x3f);
+    }
+
+    /// The ADC of a sample of trigger itrig, with any pulse.
+    inline uint16_t synth_sample(const SynthConfig& cfg, size_t itrig, size_t itick, size_t ichan) {
+        uint16_t adc = synth_adc(cfg.seed, itrig, itick, ichan);
+        if (cfg.pulse_every and itrig % cfg.pulse_every == 0
+            and itick >= cfg.nticks/4 and itick < cfg.nticks/4 + cfg.pulse_ticks) {
+            adc += cfg.pulse_adc;
+        }
+        return adc;
+    }
+
+    /// Pack 32 channels of one sample to the 24 words following its
+    /// marker.  This is the inverse of unpack_sample32().
+    inline void pack_sample32(const uint16_t adc[32], uint16_t* words) {
+        // Start channel of each group of 4, as unpack_trigger().
+        static const int segs[8] = {4, 0, 12, 8, 20, 16, 28, 24};
+        for (int igrp=0; igrp < 8; ++igrp, words += 3) {
+            const uint16_t* c = adc + segs[igrp];
+            words[0] = (c[3] & 0x0fff) | ((c[2] & 0x000f) << 12);
+            words[1] = ((c[2] & 0x0ff0) >> 4) | ((c[1] & 0x00ff) << 8);
+            words[2] = ((c[1] & 0x0f00) >> 8) | ((c[0] & 0x0fff) << 4);
+        }
+    }
+
+    /// Make raw data, as held in a file, one trigger at a time.
+    ///
+    /// Each trigger is four links of samples and each link is split
+    /// over packages of package_size words, the last shorter.  A
+    /// package has an 8 word header of a 32 bit count, a 32 bit
+    /// reserved word of 0 and four constant words.  A sample is a
+    /// marker, 0xfeed for the first of a link and 0xface after, and
+    /// 24 words of 32 channels of synth_sample().  The data ends with
+    /// the header of a package which would start another trigger.
+    class RawSynth {
+    public:
+
+        explicit RawSynth(const SynthConfig& cfg)
+            : m_cfg(cfg), m_rng(cfg.seed) { }
+
+        /// Append the next trigger to rd.  Return false if all were
+        /// made.
+        bool next(raw_data_t& rd) {
+            if (m_itrig >= m_cfg.triggers) {
+                return false;
+            }
+            m_start = rd.size();
+            m_truth.triggers.push_back(m_truth.nwords);
+            bool damaged = false;
+            for (size_t ilink=0; ilink<4; ++ilink) {
+                damaged = link(rd, ilink) or damaged;
+            }
+            if (damaged) {
+                m_truth.damaged_triggers.push_back(m_itrig);
+            }
+            ++m_itrig;
+            if (m_itrig == m_cfg.triggers) {
+                // The data of a package counts once the header of
+                // the next is seen, so end as if cut off after it.
+                header(rd);
+            }
+            m_truth.nwords += rd.size() - m_start;
+            return true;
+        }
+
+        const SynthTruth& truth() const { return m_truth; }
+
+    private:
+
+        SynthConfig m_cfg;
+        std::mt19937 m_rng;
+        SynthTruth m_truth;
+        size_t m_itrig{0}, m_start{0};
+        uint32_t m_count{1};
+        raw_data_t m_link;
+
+        void header(raw_data_t& rd) {
+            rd.insert(rd.end(), {(uint16_t)(m_count>>16), (uint16_t)(m_count&0xffff),
+                    0, 0, 0x1234, 0x5678, 0x9abc, 0});
+            ++m_count;
+        }
+
+        // Append a link, return true if a header was damaged.
+        bool link(raw_data_t& rd, size_t ilink) {
+            const size_t nticks = m_cfg.nticks - std::min(m_cfg.nticks, ilink*m_cfg.short_ticks);
+            m_link.resize(25*nticks);
+            uint16_t adc[32];
+            for (size_t itick=0; itick<nticks; ++itick) {
+                uint16_t* sample = m_link.data() + 25*itick;
+                sample[0] = itick ? 0xface : 0xfeed;
+                for (size_t ich=0; ich<32; ++ich) {
+                    adc[ich] = synth_sample(m_cfg, m_itrig, itick, ilink*32 + ich);
+                }
+                pack_sample32(adc, sample+1);
+            }
+
+            // Fill packages.  A link ending on a full package gets
+            // one more with no data as a short package ends a link.
+            std::uniform_real_distribution<double> uni(0, 1);
+            const size_t payload = m_cfg.package_size - 8;
+            bool damaged = false;
+            size_t beg = 0;
+            while (true) {
+                const size_t hdr = rd.size();
+                header(rd);
+                if (m_cfg.corrupt_rate > 0 and uni(m_rng) < m_cfg.corrupt_rate) {
+                    rd[hdr+3] = 0xdead;
+                    m_truth.damaged.push_back(m_truth.nwords + hdr - m_start);
+                    damaged = true;
+                }
+                size_t room = payload;
+                if (m_cfg.zero_pad and beg < m_link.size() and beg % 25 == 0) {
+                    rd.push_back(0);
+                    --room;
+                }
+                const size_t end = std::min(beg + room, m_link.size());
+                rd.insert(rd.end(), m_link.begin() + beg, m_link.begin() + end);
+                beg = end;
+                if (rd.size() - hdr < m_cfg.package_size) {
+                    return damaged;
+                }
+            }
+        }
+    };
+
+    /// Return synthesized raw data as held in a file.  Note
+    /// read_raw_data() appends a word to this.
+    inline raw_data_t synth_raw_data(const SynthConfig& cfg, SynthTruth* truth = nullptr) {
+        RawSynth synth(cfg);
+        raw_data_t rd;
+        while (synth.next(rd)) { }
+        if (truth) {
+            *truth = synth.truth();
+        }
+        return rd;
+    }
+
+    /// Write raw data as big-endian words.
+    inline void write_raw_data(std::ostream& out, raw_data_itr beg, raw_data_itr end) {
+        std::vector<char> buf;
+        buf.reserve(2*std::distance(beg, end));
+        for (; beg != end; ++beg) {
+            buf.push_back((char)(*beg >> 8));
+            buf.push_back((char)(*beg & 0xff));
+        }
+        out.write(buf.data(), buf.size());
+    }
+
+    /// Write synthesized raw data to a .bin file a trigger at a time
+    /// so that any size may be made.  Throws runtime_error if the
+    /// file can not be written.
+    inline SynthTruth synth_file(const std::string& filename, const SynthConfig& cfg) {
+        std::ofstream out(filename, std::ios_base::out | std::ios_base::binary);
+        if (!out) {
+            throw std::runtime_error("pcbro: failed to open file: " + filename);
+        }
+        RawSynth synth(cfg);
+        raw_data_t rd;
+        while (synth.next(rd)) {
+            write_raw_data(out, rd.begin(), rd.end());
+            rd.clear();
+        }
+        if (!out) {
+            throw std::runtime_error("pcbro: failed to write file: " + filename);
+        }
+        return synth.truth();
+    }
+
+    /// The block make_trigger() gives for trigger itrig.
+    inline block128_t synth_block(const SynthConfig& cfg, size_t itrig) {
+        block128_t block = block128_t::Zero(cfg.nticks, 128);
+        for (size_t ilink=0; ilink<4; ++ilink) {
+            const size_t nticks = cfg.nticks - std::min(cfg.nticks, ilink*cfg.short_ticks);
+            for (size_t itick=0; itick<nticks; ++itick) {
+                for (size_t ich=0; ich<32; ++ich) {
+                    block(itick, ilink*32 + ich) = synth_sample(cfg, itrig, itick, ilink*32 + ich);
+                }
+            }
+        }
+        return block;
+    }
+}
+
+#endif
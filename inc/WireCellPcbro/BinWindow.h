@@ -0,0 +1,205 @@
+#ifndef PCBRO_BINWINDOW_H_SEEN
+#define PCBRO_BINWINDOW_H_SEEN
+
+#include "WireCellPcbro/BinFile.h"
+
+#include <fstream>
+#include <string>
+#include <vector>
+#include <stdexcept>
+
+namespace pcbro {
+
+    // Default bound on the raw data held in memory by a BinWindow.
+    const size_t default_window_bytes = 32<<20;
+
+    /// Read triggers from a .bin file through a sliding window.
+    ///
+    /// Raw data is read in chunks and a trigger is decoded as soon as
+    /// its four links and the header of the package following them
+    /// are in the window.  Consumed data is then dropped.  Triggers
+    /// decode identically to make_trigger() on the whole slurped file
+    /// but memory use is bounded by the window size, not file size.
+    class BinWindow {
+    public:
+
+        BinWindow(const std::string& filename,
+                  size_t window_bytes = default_window_bytes,
+                  size_t chunk_bytes = raw_read_chunk,
+                  size_t package_size = default_package_size)
+            : m_in(filename, std::ios_base::in | std::ios_base::binary)
+            , m_max(window_bytes/2)
+            , m_chunk(chunk_bytes)
+            , m_package_size(package_size)
+        {
+            if (!m_in) {
+                throw std::runtime_error("pcbro: failed to open file: " + filename);
+            }
+            if (m_chunk % 2 or m_max < m_chunk) {
+                throw std::runtime_error("pcbro: window must hold two even sized read chunks");
+            }
+            m_win.reserve(m_max + m_chunk/2 + 1);
+            m_bytes.resize(m_chunk);
+        }
+
+        /// Decode the next trigger into block.  Return false if no
+        /// more triggers.  Throws runtime_error on corrupt data or if
+        /// a trigger does not fit in the window.
+        bool next(block128_t& block) {
+            if (! find()) {
+                return false;
+            }
+            auto beg = m_win.begin();
+            auto next = make_trigger(block, beg + m_head, m_win.end(), m_package_size);
+            consume(std::distance(beg, next));
+            return true;
+        }
+
+        /// Copy the raw data of the next trigger to out, without
+        /// unpacking it.  Return false if no more triggers.  The copy
+        /// includes the header following the trigger so that
+        /// make_trigger(block, out.begin(), out.end()) decodes it.
+        bool next_raw(raw_data_t& out) {
+            if (! find()) {
+                return false;
+            }
+            auto beg = m_win.begin();
+            size_t stop = m_win.size();
+            if (m_nlinks == 4) {
+                stop = std::min(stop, m_scan + 4);
+            }
+            out.assign(beg + m_head, beg + stop);
+            if (m_nlinks == 4) {
+                consume(m_scan);
+            }
+            else {
+                m_head = m_scan = m_win.size();
+                m_nlinks = 0;
+            }
+            return true;
+        }
+
+        /// Move past the next trigger without unpacking it.  Return
+        /// false if no more triggers.
+        bool skip() {
+            if (! find()) {
+                return false;
+            }
+            if (m_nlinks == 4) {
+                consume(m_scan);
+                return true;
+            }
+            // At the tail, fall back to decoding to learn the end.
+            block128_t block;
+            auto beg = m_win.begin();
+            auto next = make_trigger(block, beg + m_head, m_win.end(), m_package_size);
+            consume(std::distance(beg, next));
+            return true;
+        }
+
+        /// Read ahead until the next trigger is in the window, as
+        /// next() would, without consuming it.  Errors in the data
+        /// are left for next() or skip() to throw.
+        void prime() {
+            try {
+                find();
+            }
+            catch (const std::runtime_error& err) {
+            }
+        }
+
+        /// The largest number of raw data words held at once.
+        size_t peak_words() const { return m_peak; }
+
+        /// Total number of bytes read from the file so far.
+        size_t bytes_read() const { return m_nread; }
+
+    private:
+
+        std::ifstream m_in;
+        size_t m_max, m_chunk, m_package_size;
+        raw_data_t m_win;
+        std::vector<char> m_bytes;
+        size_t m_head{0};       // start of the next trigger
+        size_t m_scan{0};       // next package header to examine
+        int m_nlinks{0};        // links completed since m_head
+        bool m_eof{false};
+        size_t m_peak{0}, m_nread{0};
+
+        // Make sure the window holds the next trigger, return false
+        // if there is none.  On return either m_nlinks is 4 and
+        // m_scan is the header following the trigger, or the end of
+        // file is reached and the trigger is whatever remains.
+        bool find() {
+            while (true) {
+                auto beg = m_win.begin();
+                auto end = m_win.end();
+                while (m_nlinks < 4 and m_scan < m_win.size()) {
+                    auto cur = beg + m_scan;
+                    auto nxt = seek_package(cur, end);
+                    if (nxt == end) {
+                        break;
+                    }
+                    const size_t psize = std::distance(cur, nxt);
+                    m_scan += psize;
+                    if (psize < m_package_size) {
+                        ++m_nlinks;
+                    }
+                }
+                if (m_nlinks == 4) {
+                    return true;
+                }
+                if (m_eof) {
+                    if (m_head >= m_win.size()) {
+                        return false;
+                    }
+                    // Let make_trigger() decide on the tail, as
+                    // when the whole file is slurped.
+                    block128_t block;
+                    try {
+                        make_trigger(block, beg + m_head, end, m_package_size);
+                    }
+                    catch (const std::range_error& err) {
+                        m_head = m_scan = m_win.size();
+                        return false;
+                    }
+                    return true;
+                }
+                if (m_win.size() - m_head >= m_max) {
+                    throw std::runtime_error("pcbro: trigger does not fit in window");
+                }
+                fill();
+            }
+        }
+
+        // Drop data before offset which becomes the new trigger start.
+        void consume(size_t offset) {
+            m_head = m_scan = offset;
+            m_nlinks = 0;
+            if (m_head >= m_chunk/2) {
+                m_win.erase(m_win.begin(), m_win.begin() + m_head);
+                m_scan -= m_head;
+                m_head = 0;
+            }
+        }
+
+        // Append one chunk to the window.
+        void fill() {
+            m_in.read(m_bytes.data(), m_chunk);
+            const size_t nbytes = m_in.gcount();
+            m_nread += nbytes;
+            const size_t nwords = nbytes/2;
+            const size_t size = m_win.size();
+            m_win.resize(size + nwords);
+            swap_words((const unsigned char*)m_bytes.data(), nwords, m_win.data() + size);
+            if (nbytes < m_chunk) {
+                // Same trailing word as read_raw_data() makes.
+                m_eof = true;
+                m_win.push_back((nbytes % 2) ? (uint16_t)((0xff & m_bytes[nbytes-1]) << 8) : 0);
+            }
+            m_peak = std::max(m_peak, m_win.size());
+        }
+    };
+}
+
+#endif
@@ -0,0 +1,67 @@
+// Estimate activity in raw frames before any signal processing.
+
+#ifndef PCBRO_RAWACTIVITY_H_SEEN
+#define PCBRO_RAWACTIVITY_H_SEEN
+
+#include <algorithm>
+#include <cmath>
+#include <utility>
+#include <vector>
+
+namespace pcbro {
+
+    /// A range [first, last) of frame rows, eg the channels of a plane.
+    using row_range_t = std::pair<size_t, size_t>;
+
+    /// Return the activity of each group of rows of a raw frame of
+    /// nticks ticks of nrows rows, rows fastest, as RawSource makes.
+    ///
+    /// Each row has its median over ticks subtracted as a baseline
+    /// and the activity of a group is the sum of the absolute
+    /// differences which are above minimum.  Raw induction signals
+    /// are bipolar so both signs count.  Rows past the frame are
+    /// ignored.
+    template <typename T>
+    std::vector<double> raw_activity(const T* frame, size_t nticks, size_t nrows,
+                                     double minimum, const std::vector<row_range_t>& groups)
+    {
+        std::vector<double> ret(groups.size(), 0);
+        if (! nticks) {
+            return ret;
+        }
+        std::vector<float> wave(nticks), sorted(nticks);
+        for (size_t igrp = 0; igrp < groups.size(); ++igrp) {
+            const size_t last = std::min(groups[igrp].second, nrows);
+            for (size_t row = groups[igrp].first; row < last; ++row) {
+                for (size_t tick = 0; tick < nticks; ++tick) {
+                    wave[tick] = frame[tick*nrows + row];
+                }
+                sorted = wave;
+                // the median as numpy.median() takes it
+                auto mid = sorted.begin() + nticks/2;
+                std::nth_element(sorted.begin(), mid, sorted.end());
+                float base = *mid;
+                if (nticks % 2 == 0) {
+                    base = 0.5f*(base + *std::max_element(sorted.begin(), mid));
+                }
+                double sum = 0;
+                for (float val : wave) {
+                    const float dev = std::abs(val - base);
+                    if (dev > minimum) {
+                        sum += dev;
+                    }
+                }
+                ret[igrp] += sum;
+            }
+        }
+        return ret;
+    }
+
+    /// True if each activity reaches threshold.
+    inline bool raw_active(const std::vector<double>& activity, double threshold) {
+        return std::all_of(activity.begin(), activity.end(),
+                           [&](double one) { return one >= threshold; });
+    }
+}
+
+#endif
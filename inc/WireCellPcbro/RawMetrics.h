@@ -0,0 +1,101 @@
+#ifndef PCBRO_RAWMETRICS_H_SEEN
+#define PCBRO_RAWMETRICS_H_SEEN
+
+#include <chrono>
+#include <mutex>
+#include <string>
+#include <vector>
+
+namespace pcbro {
+
+    /// Counters and timers of reading raw data, per input file.
+    ///
+    /// Files are updated from decoding threads as well as the thread
+    /// driving the source, so all access is through update(),
+    /// files() and total() which lock.
+    class RawMetrics {
+    public:
+
+        using clock_type = std::chrono::steady_clock;
+
+        struct File {
+            std::string filename;
+            size_t bytes{0};    // read from the file
+            size_t triggers{0}; // located, wanted or not
+            size_t skipped{0};  // located but not wanted
+            size_t decoded{0};  // unpacked to frames
+            size_t short_triggers{0}; // with a link shorter than others
+            size_t corrupt{0};  // bad data found
+            size_t dropped{0};  // triggers lost to bad data on resync
+            size_t quiet{0};    // decoded but below activity threshold
+            // Seconds spent to open and read or index the file, that
+            // waited for it if opened ahead, to locate triggers, to
+            // unpack them, that waited for them if unpacked ahead and
+            // to make the output.
+            double open{0}, open_wait{0}, locate{0};
+            double decode{0}, decode_wait{0}, output{0};
+        };
+
+        explicit RawMetrics(const std::vector<std::string>& filenames = {})
+            : m_start(clock_type::now())
+        {
+            for (const auto& fname : filenames) {
+                m_files.emplace_back();
+                m_files.back().filename = fname;
+            }
+        }
+
+        /// Call func(file) with the file numbered filenum locked.
+        template<typename Func>
+        void update(size_t filenum, Func func) {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            func(m_files.at(filenum));
+        }
+
+        /// A copy of the metrics of all files.
+        std::vector<File> files() const {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            return m_files;
+        }
+
+        /// The sums over all files.
+        File total() const {
+            std::lock_guard<std::mutex> lock(m_mutex);
+            File tot;
+            tot.filename = "total";
+            for (const auto& one : m_files) {
+                tot.bytes += one.bytes;
+                tot.triggers += one.triggers;
+                tot.skipped += one.skipped;
+                tot.decoded += one.decoded;
+                tot.short_triggers += one.short_triggers;
+                tot.corrupt += one.corrupt;
+                tot.dropped += one.dropped;
+                tot.quiet += one.quiet;
+                tot.open += one.open;
+                tot.open_wait += one.open_wait;
+                tot.locate += one.locate;
+                tot.decode += one.decode;
+                tot.decode_wait += one.decode_wait;
+                tot.output += one.output;
+            }
+            return tot;
+        }
+
+        /// Seconds since construction.
+        double elapsed() const { return since(m_start); }
+
+        /// Seconds since t0.
+        static double since(clock_type::time_point t0) {
+            return std::chrono::duration<double>(clock_type::now() - t0).count();
+        }
+
+    private:
+
+        clock_type::time_point m_start;
+        std::vector<File> m_files;
+        mutable std::mutex m_mutex;
+    };
+}
+
+#endif
@@ -0,0 +1,75 @@
+#ifndef PCBRO_RAWNPZSINK_H_SEEN
+#define PCBRO_RAWNPZSINK_H_SEEN
+
+#include "WireCellIface/IConfigurable.h"
+#include "WireCellIface/ITensorSetSink.h"
+
+#include <cstdint>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+namespace pcbro {
+
+    /// Pack n 12 bit samples, n even, two to three bytes: the low
+    /// byte of the first, its high nibble with the low nibble of the
+    /// second above it and the high byte of the second.  Throws
+    /// runtime_error if a sample is outside of [0,4096).
+    template <typename T>
+    void pack12(const T* in, size_t n, uint8_t* out) {
+        for (size_t ind = 0; ind < n; ind += 2, out += 3) {
+            const int a = in[ind], b = in[ind+1];
+            if (a < 0 or a > 0xfff or b < 0 or b > 0xfff) {
+                throw std::runtime_error("pcbro: sample outside of 12 bits");
+            }
+            out[0] = a & 0xff;
+            out[1] = (a >> 8) | ((b & 0xf) << 4);
+            out[2] = b >> 4;
+        }
+    }
+
+    /// Unpack n samples packed by pack12().
+    inline void unpack12(const uint8_t* in, size_t n, int16_t* out) {
+        for (size_t ind = 0; ind < n; ind += 2, in += 3) {
+            out[ind] = in[0] | ((in[1] & 0xf) << 8);
+            out[ind+1] = (in[1] >> 4) | (in[2] << 4);
+        }
+    }
+
+    /// Write raw frame tensor sets from RawSource to an NPZ file.
+    ///
+    /// Each set gives frame_<tag>_<ident>, channels_<tag>_<ident> and
+    /// tickinfo_<tag>_<ident> arrays like WCT's NumpyFrameSaver does
+    /// for the frames made of them, without going through float.  A
+    /// frame is (nticks, nrows) int16 or, packed to 12 bits, a uint8
+    /// array of (nticks, 3*nrows/2).  Rows given as an "alias" in the
+    /// frame metadata are not stored but are described by an
+    /// alias_<tag>_<ident> int32 array of (first, source, count)
+    /// rows.  See npzio.py for reading them back.
+    class RawNpzSink : public WireCell::ITensorSetSink, public WireCell::IConfigurable {
+    public:
+        RawNpzSink();
+        virtual ~RawNpzSink();
+
+        // IConfigurable interface
+        WireCell::Configuration default_configuration() const;
+        void configure(const WireCell::Configuration& cfg);
+
+        // ITensorSetSink interface
+        virtual bool operator()(const WireCell::ITensorSet::pointer& ts);
+
+    private:
+
+        std::string m_filename{""};
+        std::string m_format{"int16"};
+        // Arrays written so far, the first truncates the file.
+        size_t m_narrays{0};
+
+        template <typename T>
+        void save(const std::string& name, const T* data,
+                  const std::vector<size_t>& shape);
+    };
+
+}
+
+#endif // PCBRO_RAWNPZSINK_H_SEEN
@@ -2,6 +2,11 @@
 #define PCBRO_RAWSOURCE_H_SEEN
 
 #include "WireCellPcbro/BinFile.h"
+#include "WireCellPcbro/BinWindow.h"
+#include "WireCellPcbro/BinStream.h"
+#include "WireCellPcbro/TaskPool.h"
+#include "WireCellPcbro/RawMetrics.h"
+#include "WireCellPcbro/RawActivity.h"
 
 #include "WireCellUtil/Units.h"
 
@@ -9,6 +14,9 @@
 #include "WireCellIface/ITensorSetSource.h"
 
 #include <string>
+#include <memory>
+#include <deque>
+#include <future>
 
 namespace pcbro {
 
@@ -27,16 +35,59 @@ namespace pcbro {
 
     private:
 
+        // A located but not yet decoded trigger.  The data is shared
+        // so that a file may be released while its triggers decode.
+        // The "binstream" engine instead gives the decoded block.
+        struct RawTrigger {
+            int ident{0};
+            size_t filenum{0};
+            pcbro::FilePathData fpd;
+            std::shared_ptr<pcbro::raw_data_t> data;
+            size_t begin{0}, end{0};
+            std::shared_ptr<pcbro::block128_t> block;
+            bool short_link{false}; // of the block
+        };
+
+        // A trigger being decoded to its frame tensor, in order of ident.
+        struct Pending {
+            RawTrigger raw;
+            std::future<WireCell::ITensor::pointer> frame;
+        };
+
+        // A file opened and read, ahead of its use if prefetching.
+        struct OpenFile {
+            pcbro::FilePathData fpd;
+            std::shared_ptr<pcbro::raw_data_t> rd;
+            pcbro::RawIndex ri;
+            std::unique_ptr<pcbro::BinWindow> bw;
+            std::unique_ptr<pcbro::BinStreamDecoder> bs;
+            size_t bytes{0};
+            double seconds{0};
+        };
+
         // info about current .bin file
-        pcbro::raw_data_t m_rd;
-        pcbro::raw_data_itr m_cur;
+        std::shared_ptr<pcbro::raw_data_t> m_rd;
+        size_t m_cur{0};
+        bool m_infile{false};
         pcbro::FilePathData m_fpd;
+        pcbro::RawIndex m_ri;
+        std::string m_index{"none"};
+        bool m_resync{false};
+
+        // or, read through a window
+        std::unique_ptr<pcbro::BinWindow> m_bw;
+        // or, decode as read with the "binstream" engine
+        std::unique_ptr<pcbro::BinStreamDecoder> m_bs;
+        std::string m_engine{"binfile"};
+        bool m_stream{false};
+        size_t m_window{pcbro::default_window_bytes};
 
         // We can handle one or many files.
         std::vector<std::string> m_filenames;
         size_t m_filenum;
 
         bool m_eos{false}, m_dupind{false};
+        std::string m_dtype{"float"};
         int m_ident{0};
         double m_tick{0.5*WireCell::units::us};
         std::string m_tag{""};
@@ -45,8 +96,65 @@ namespace pcbro {
         std::string m_triggers_string{"50"};
         int m_start_trigger{0};
         int m_triggers{50};
+        // or, only these trigger idents, sorted
+        std::vector<int> m_trigger_list;
+
+        // Raw activity of groups of frame rows, if threshold > 0, and
+        // whether to "drop" or "tag" quiet triggers.
+        double m_activity_threshold{0}, m_activity_minimum{20};
+        std::vector<pcbro::row_range_t> m_activity_groups{{0, 64}, {64, 128}};
+        std::string m_quiet{"drop"};
+
+        // Counters and timers, written to a JSON file if named.
+        // Decoding threads update it.
+        std::shared_ptr<pcbro::RawMetrics> m_metrics;
+        std::string m_metrics_file{""};
+
+        // Decode ahead with this many threads and pending triggers.
+        size_t m_workers{0}, m_queue{0};
+        std::unique_ptr<pcbro::TaskPool> m_pool;
+        std::deque<Pending> m_pending;
+        bool m_nomore{false};
+
+        // The channels tensor, shared by all tensor sets.
+        WireCell::ITensor::pointer m_channels;
+
+        // Open at most this many files following the current one on
+        // a reader thread.  Declared last so that its thread is
+        // joined before any member it uses is destroyed.
+        size_t m_prefetch{0};
+        std::unique_ptr<pcbro::TaskPool> m_reader;
+        std::deque<std::future<std::shared_ptr<OpenFile>>> m_opening;
 
         bool init_file();
+        // Release the current file and count what was read of it.
+        void close_file();
+        // Open and read a file.  Thread safe.
+        std::shared_ptr<OpenFile> open_file(size_t filenum) const;
+        // Start opening files which follow the current one.
+        void prefetch();
+        // Locate next trigger of current file, range_error at end.
+        // If not wanted, the trigger is skipped and has no data.
+        void locate(RawTrigger& rt, bool want);
+        // Locate next trigger over all files, false when exhausted.
+        bool next_raw(RawTrigger& rt);
+        // Locate and submit wanted triggers to fill the queue.
+        void fill_queue();
+        // Unpack a trigger to its frame tensor.  Thread safe.
+        WireCell::ITensor::pointer decode(const RawTrigger& rt) const;
+        // Forget the rest of a file after bad data in one trigger and
+        // read on from the next file.
+        void drop_file(const RawTrigger& bad);
+        // Jump over unwanted triggers using the index.
+        void skip_indexed();
+        // With resync, move past triggers dropped at breaks.
+        void resume_indexed();
+        // True if trigger ident is to be output.
+        bool wanted(int ident) const;
+        // Smallest wanted ident not less than ident, -1 if none.
+        int next_wanted(int ident) const;
+        // Log a summary of the metrics and write any metrics file.
+        void report_metrics();
     };
 
 }
@@ -0,0 +1,81 @@
+#ifndef PCBRO_SPARSEFRAMESAVER_H_SEEN
+#define PCBRO_SPARSEFRAMESAVER_H_SEEN
+
+#include "WireCellIface/IConfigurable.h"
+#include "WireCellIface/IFrameFilter.h"
+
+#include <cmath>
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace pcbro {
+
+    /// A region of interest: a run of count ticks of one frame
+    /// column starting at tick first.
+    struct roi_t {
+        int32_t column, first, count;
+    };
+    static_assert(sizeof(roi_t) == 3*sizeof(int32_t), "roi_t is saved as an int32 array");
+
+    /// Append to rois and samples the runs of n samples of wave
+    /// whose magnitude is above threshold.  The wave is of the given
+    /// column and starts at tick first.
+    template <typename T>
+    void add_rois(std::vector<roi_t>& rois, std::vector<float>& samples,
+                  int32_t column, int32_t first, const T* wave, size_t n,
+                  double threshold)
+    {
+        for (size_t ind = 0; ind < n; ++ind) {
+            if (std::abs(wave[ind]) <= threshold) {
+                continue;
+            }
+            roi_t roi{column, first + (int32_t)ind, 0};
+            for (; ind < n and std::abs(wave[ind]) > threshold; ++ind) {
+                samples.push_back(wave[ind]);
+                ++roi.count;
+            }
+            rois.push_back(roi);
+        }
+    }
+
+    /// Save tagged traces of frames to an NPZ file as regions of
+    /// interest, passing frames on unchanged.
+    ///
+    /// Like WCT's NumpyFrameSaver, each tag of each frame gives
+    /// frame_<tag>_<ident>, channels_<tag>_<ident> and
+    /// tickinfo_<tag>_<ident> arrays but the frame array is 1D and
+    /// holds only the samples of its regions of interest which are
+    /// described by a roi_<tag>_<ident> int32 array of (nroi+1, 3).
+    /// See sparsify() in npzio.py for the format and for reading them
+    /// back.
+    class SparseFrameSaver : public WireCell::IFrameFilter, public WireCell::IConfigurable {
+    public:
+        SparseFrameSaver();
+        virtual ~SparseFrameSaver();
+
+        // IConfigurable interface
+        WireCell::Configuration default_configuration() const;
+        void configure(const WireCell::Configuration& cfg);
+
+        // IFrameFilter interface
+        virtual bool operator()(const input_pointer& in, output_pointer& out);
+
+    private:
+
+        std::string m_filename{""};
+        std::vector<std::string> m_tags;
+        double m_threshold{0};
+        // Arrays written so far, the first truncates the file.
+        size_t m_narrays{0};
+
+        void save_tag(const WireCell::IFrame::pointer& frame, const std::string& tag);
+
+        template <typename T>
+        void save(const std::string& name, const T* data,
+                  const std::vector<size_t>& shape);
+    };
+
+}
+
+#endif // PCBRO_SPARSEFRAMESAVER_H_SEEN
@@ -0,0 +1,81 @@
+#ifndef PCBRO_TASKPOOL_H_SEEN
+#define PCBRO_TASKPOOL_H_SEEN
+
+#include <condition_variable>
+#include <deque>
+#include <functional>
+#include <future>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+namespace pcbro {
+
+    /// A fixed set of threads running submitted tasks in the order
+    /// submitted.  Results are returned through futures.
+    class TaskPool {
+    public:
+
+        explicit TaskPool(size_t nthreads) {
+            for (size_t ind = 0; ind < nthreads; ++ind) {
+                m_threads.emplace_back([this]() { this->work(); });
+            }
+        }
+
+        ~TaskPool() {
+            {
+                std::lock_guard<std::mutex> lock(m_mutex);
+                m_done = true;
+            }
+            m_cond.notify_all();
+            for (auto& th : m_threads) {
+                th.join();
+            }
+        }
+
+        TaskPool(const TaskPool&) = delete;
+        TaskPool& operator=(const TaskPool&) = delete;
+
+        size_t size() const { return m_threads.size(); }
+
+        /// Queue func to run on a pool thread, return future result.
+        template<typename Func>
+        auto submit(Func func) -> std::future<decltype(func())> {
+            using result_t = decltype(func());
+            auto task = std::make_shared<std::packaged_task<result_t()>>(std::move(func));
+            auto fut = task->get_future();
+            {
+                std::lock_guard<std::mutex> lock(m_mutex);
+                m_tasks.emplace_back([task]() { (*task)(); });
+            }
+            m_cond.notify_one();
+            return fut;
+        }
+
+    private:
+
+        std::vector<std::thread> m_threads;
+        std::deque<std::function<void()>> m_tasks;
+        std::mutex m_mutex;
+        std::condition_variable m_cond;
+        bool m_done{false};
+
+        void work() {
+            while (true) {
+                std::function<void()> task;
+                {
+                    std::unique_lock<std::mutex> lock(m_mutex);
+                    m_cond.wait(lock, [this]() { return m_done or !m_tasks.empty(); });
+                    if (m_tasks.empty()) {
+                        return;
+                    }
+                    task = std::move(m_tasks.front());
+                    m_tasks.pop_front();
+                }
+                task();
+            }
+        }
+    };
+}
+
+#endif
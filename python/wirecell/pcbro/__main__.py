@@ -6,17 +6,11 @@ import os.path as osp
 import sys
 import json
 import click
-from wirecell import units
-import numpy
-import zipfile
-import tarfile
 
-import wirecell.pcbro.garfield as pcbgf
-import wirecell.pcbro.draw as pcbdraw
-import wirecell.pcbro.holes as pcbholes
-import wirecell.sigproc.garfield as wctgf
+# Anything heavier than the above (numpy, matplotlib, wirecell.sigproc
+# and the modules here using them) is imported by the commands which
+# need it so that startup and --help stay fast.
 
-from wirecell.util.fileio import load as source_loader
 # def sourceme(source):
 #     '''
 #     Convert a tar file or directory path into a source
@@ -52,6 +46,8 @@ def fpstrips_fp_npz(infile, npzname):
     The third spans number of samples and differs in general between the two.
 
     '''
+    import numpy
+    from wirecell.util.fileio import load as source_loader
     from .fpstrips import fpzip2arrs
 
     af = source_loader(infile)
@@ -75,6 +71,8 @@ def fpstrips_trio_npz(ind1, ind2, col, npzname):
     ncolumns are FP's 10 data columns
 
     '''
+    import numpy
+    from wirecell.util.fileio import load as source_loader
     from .fpstrips import fpzip2arrs
 
     out = dict()
@@ -101,6 +99,8 @@ def draw_fp(method, start, output, npzname):
     '''
     Make some drawings from the untouched npz file
     '''
+    import numpy
+    from wirecell import units
     start = eval(start, units.__dict__)
 
     from . import fpstrips
@@ -119,6 +119,7 @@ def fpstrips_wct_npz(fpnpz, wctnpz):
     '''
     Convert FP NPZ file to WCT NPZ file
     '''
+    import numpy
     from .fpstrips import fp2wct
     fp = numpy.load(fpnpz)
     wct = fp2wct(fp)
@@ -129,6 +130,7 @@ def load_sidecar(filename):
     '''
     Load a JSON "sidecar" to the given fpfile.
     '''
+    from wirecell import units
     for ext in ('.json','.npz','.zip', '.tar', '.tgz', '.tar.gz'):
         if filename.endswith(ext):
             fname = filename.replace(ext,'.json')
@@ -166,9 +168,11 @@ def convert_fpstrips(tshift, nticks, output, filename):
         location.insert(0, location[0])
     print(f'loading {name}')
 
+    import numpy
     import wirecell.sigproc.response.persist as per
     from wirecell.sigproc.response.schema import (
         FieldResponse, PlaneResponse)
+    from wirecell.util.fileio import load as source_loader
     from .fpstrips import fpzip2arrs, fp2wct, arrs2pr, fp2meta
 
     rebin = 20
@@ -231,6 +235,8 @@ def convert_garfield(origin, speed, normalization,
 
     See also same subcommand from wirecell-sigproc
     '''
+    from wirecell import units
+    from wirecell.util.fileio import load as source_loader
     import wirecell.pcbro.garfield as gar
     from wirecell.sigproc.response import rf1dtoschema
     import wirecell.sigproc.response.persist as per
@@ -274,6 +280,7 @@ def convert_garfield_npz(output, datfile):
     '''
     if not output:
         output = os.path.splitext(os.path.basename(datfile))[0] + ".npz"
+    import wirecell.pcbro.garfield as pcbgf
     pcbgf.dat2npz(datfile, output)    
 
 
@@ -281,6 +288,7 @@ def convert_garfield_npz(output, datfile):
 @click.option("-o","--output", default="garfield-micro-wires.pdf", help="Output PDF file")
 @click.argument("source")
 def plot_garfield_micro_wires(output, source):
+    import wirecell.pcbro.garfield as pcbgf
     pcbgf.draw_file(source, output)
 
 @cli.command("plot-garfield")
@@ -293,6 +301,8 @@ def plot_garfield(output, source):
     convert-garfield.
 
     '''
+    from wirecell.util.fileio import load as source_loader
+    import wirecell.pcbro.garfield as pcbgf
     source = source_loader(source, pattern="*.dat")
     pcbgf.plots(source, output)
 
@@ -304,6 +314,8 @@ def plot_holes(strips, plane,output):
     '''
     Make some artwork which "obviously" shows the integration map is correct.
     '''
+    import wirecell.pcbro.holes as pcbholes
+    import wirecell.pcbro.draw as pcbdraw
     if plane=="ind":
         pg = pcbholes.Induction()
     elif plane=="col":
@@ -321,6 +333,7 @@ def list_holes(strips, slices, planes, output):
     '''
     Make some artwork which "obviously" shows the integration map is correct.
     '''
+    import wirecell.pcbro.holes as pcbholes
     slices = list(map(int,slices.split(',')))
     strips = list(range(-strips, strips+1))
     strips.reverse()
@@ -377,13 +390,41 @@ def gen_wires(detector, output, config):
     open(output,"wb").write(text.encode('ascii'))
 
 
+def parse_triggers(triggers, available):
+    '''Return list of trigger numbers from a specification string.
+
+    The specification is "all" or a comma-separated list of trigger
+    numbers or half-open "first:last" ranges, eg "0:10,31".  Only
+    triggers found in the available list are returned.
+    '''
+    available = sorted(available)
+    if triggers.strip() == "all":
+        return available
+    want = list()
+    for one in triggers.split(","):
+        one = one.strip()
+        if not one:
+            continue
+        if ":" in one:
+            first, last = one.split(":")
+            first = int(first) if first else available[0]
+            last = int(last) if last else available[-1]+1
+            want += [t for t in available if first <= t < last]
+        else:
+            want.append(int(one))
+    missing = set(want).difference(available)
+    if missing:
+        raise click.BadParameter(f'no such triggers: {sorted(missing)}')
+    return want
+
+
 @cli.command("evd2d")
 @click.option("--baseline-subtract", type=click.Choice(['median','']), default='',
              help="Apply baseline subtraction method")
 @click.option("-T", "--tag", default="",
              help="Tag name")
-@click.option("-t", "--trigger", default=31,
-             help="Trigger number")
+@click.option("-t", "--trigger", default="31",
+             help="Trigger numbers as comma-separated list of numbers or 'first:last' ranges or 'all'")
 @click.option("-a","--aspect", default="auto", type=str,
               help="Aspect ratio")
 @click.option("--title", default="Signals",
@@ -393,7 +434,7 @@ def gen_wires(detector, output, config):
 @click.option("--color-unit", default="ionization electrons",
               help="Set name for unit of color scale")
 @click.option("--color-map", default="bwr",
-              help="Set color map name")
+              help="Set color map name or a comma-separated list of names")
 @click.option("--cnames", default="collection,induction",
               help="Comma-separated list channel group names")
 @click.option("--channels", default="0:64,64:128",
@@ -404,71 +445,163 @@ def gen_wires(detector, output, config):
               help="Colon-separated range of ticks")
 @click.option("--mask-min", default=None,
               help="Mask any values less than this value, if given")
-@click.option("-o","--output",default="plot.pdf",
-              help="Output file")
+@click.option("--fast", is_flag=True, default=False,
+              help="Write PNG directly with NumPy, bypassing matplotlib figures")
+@click.option("-o","--output",default=(), multiple=True,
+              help="Output file name template, may use {trigger}, {cmap} and {tag}, may repeat, default is plot.pdf or with --fast plot.png")
 @click.argument("npzfile")
 def evd2d(baseline_subtract, tag, trigger, aspect,
           title, color_range, color_unit, color_map,
           cnames, channels, tshift, ticks, mask_min,
-          output, npzfile):
-    '''
-    Plot waveforms of a trigger from file
+          fast, output, npzfile):
+    '''Plot waveforms of triggers from file
+
+    All triggers, color maps and outputs are made from one load of
+    the file and, unless --fast, one matplotlib figure.  When more
+    than one trigger or color map is given the output names must be
+    templated on them, eg -o 'evd-{trigger}-{cmap}.png'.
     '''
-    title = title.format(**locals())
+    params = dict(locals())
+    output = output or ["plot.png" if fast else "plot.pdf"]
+    if fast:
+        fast_outputs(output)
 
     import numpy
-    import matplotlib.pyplot as plt 
-    import matplotlib as mpl
-    fp = numpy.load(npzfile)
-    a = fp[f'frame_{tag}_{trigger}']
-
-    rows, cols = a.shape;
-    print (rows,cols)
-
-    cnames = cnames.split(',')
+    from .framestore import load
+    fp = load(npzfile)
+    want = f'frame_{tag}_'
+    available = [int(k[len(want):]) for k in fp.keys()
+                 if k.startswith(want) and k[len(want):].isdigit()]
+    trigs = parse_triggers(trigger, available)
+    cmaps = [c.strip() for c in color_map.split(",") if c.strip()]
 
-    if baseline_subtract == 'median':
-        a = a - numpy.median(a, axis=0)
+    for tmpl, key, vals in [(o, 'trigger', trigs) for o in output] \
+                         + [(o, 'cmap', cmaps) for o in output]:
+        if len(vals) > 1 and '{'+key+'}' not in tmpl:
+            raise click.BadParameter(f'output "{tmpl}" must include "{{{key}}}"')
 
-    if color_range is None:
-        color_range = [numpy.min(a), numpy.max(a)]
-    else:
-        color_range = [float(v) for v in color_range.split(',')]
+    def outnames(trig, cmap):
+        return [o.format(trigger=trig, cmap=cmap, tag=tag) for o in output]
 
-    Normer = mpl.colors.TwoSlopeNorm
-    if len(color_range) == 2:
-        color_range.insert(1, 0.5*numpy.sum(color_range))
-    norm = Normer(vmin=color_range[0],
-                  vcenter=color_range[1],
-                  vmax=color_range[2])
+    def titled(trig, cmap):
+        return title.format(**dict(params, trigger=trig, color_map=cmap, cmap=cmap))
 
+    cnames = cnames.split(',')
     if mask_min is not None:
         mask_min = float(mask_min)
 
     tt = list(map(int, ticks.split(":")))
     channels = [list(map(int, ss.strip().split(":"))) for ss in channels.split(",")]
     nplanes = len(channels)
-    fig, axes = plt.subplots(1, nplanes, sharey=True, figsize=(10.5, 8.0))
-    for pind in range(nplanes):
-        cc = channels[pind]
-        ax = axes[pind]
-        sa = a[tt[0]-tshift:tt[1]-tshift, cc[0]:cc[1]]
-        if mask_min is not None:
-            sa = numpy.ma.masked_where(sa <= mask_min, sa)
-        im = ax.imshow(sa, cmap=color_map, aspect=aspect, interpolation='none',
-                       norm=norm, extent=[cc[0],cc[1],tt[1],tt[0]])
-        ax.set_xlabel(f'{cnames[pind]} channels [IDs]')
-        # ax.set_xticks
-    axes[0].set_ylabel('sample period [count]')
-    c = fig.colorbar(im)
-    c.set_label(color_unit)
-    plt.gca().invert_yaxis()
-    plt.tight_layout()
-    plt.suptitle(title, fontsize=14)
-    fig.subplots_adjust(top=0.95)
-    plt.savefig(output, bbox_inches='tight')
 
-    
+    if fast:
+        from .evd import Dataset50L, Main
+        disp = Main(Dataset50L(fp),
+                    baseline_subtract=baseline_subtract, tag=tag,
+                    color_range=color_range, color_unit=color_unit,
+                    cnames=cnames, channels=channels,
+                    planes=list(range(nplanes)),
+                    tshift=tshift, ticks=tt, mask_min=mask_min)
+        for trig in trigs:
+            disp.trignum = trig
+            frame = disp.frame
+            for cmap in cmaps:
+                disp.set_option('color_map', cmap)
+                ttl = titled(trig, cmap)
+                disp.set_option('title', ttl.replace('{','{{').replace('}','}}'))
+                for fname in outnames(trig, cmap):
+                    disp.save_fast(fname, frame=frame)
+                    print (fname)
+        return
+
+    import matplotlib.pyplot as plt 
+    import matplotlib as mpl
+    Normer = mpl.colors.TwoSlopeNorm
+
+    fig, axes = plt.subplots(1, nplanes, sharey=True, figsize=(10.5, 8.0),
+                             squeeze=False)
+    axes = axes[0]
+    ims = list()
+    cb = None
+    for trig in trigs:
+        a = fp[f'frame_{tag}_{trig}']
+
+        rows, cols = a.shape;
+        print (trig, rows, cols)
+
+        if baseline_subtract == 'median':
+            a = a - numpy.median(a, axis=0)
+
+        if color_range is None:
+            cr = [numpy.min(a), numpy.max(a)]
+        else:
+            cr = [float(v) for v in color_range.split(',')]
+        if len(cr) == 2:
+            cr.insert(1, 0.5*numpy.sum(cr))
+        norm = Normer(vmin=cr[0], vcenter=cr[1], vmax=cr[2])
+
+        for pind in range(nplanes):
+            cc = channels[pind]
+            ax = axes[pind]
+            sa = a[tt[0]-tshift:tt[1]-tshift, cc[0]:cc[1]]
+            if mask_min is not None:
+                sa = numpy.ma.masked_where(sa <= mask_min, sa)
+            if len(ims) < nplanes:
+                im = ax.imshow(sa, cmap=cmaps[0], aspect=aspect, interpolation='none',
+                               norm=norm, extent=[cc[0],cc[1],tt[1],tt[0]])
+                ims.append(im)
+                ax.set_xlabel(f'{cnames[pind]} channels [IDs]')
+                # ax.set_xticks
+            else:
+                ims[pind].set_data(sa)
+                ims[pind].set_norm(norm)
+
+        if cb is None:
+            axes[0].set_ylabel('sample period [count]')
+            cb = fig.colorbar(ims[-1])
+            cb.set_label(color_unit)
+            plt.gca().invert_yaxis()
+            plt.tight_layout()
+            fig.subplots_adjust(top=0.95)
+        cb.update_normal(ims[-1])
+
+        for cmap in cmaps:
+            for im in ims:
+                im.set_cmap(cmap)
+            cb.update_normal(ims[-1])
+            plt.suptitle(titled(trig, cmap), fontsize=14)
+            for fname in outnames(trig, cmap):
+                plt.savefig(fname, bbox_inches='tight')
+                print (fname)
+    plt.close(fig)
+
+
+def fast_outputs(outputs):
+    '''Raise BadParameter unless all outputs name PNG files, as
+    --fast writes.
+    '''
+    for one in outputs:
+        if not one.lower().endswith(".png"):
+            raise click.BadParameter(f'--fast writes PNG, output must end in .png: {one}')
+
+
+def fast_display(npzfile, **opts):
+    '''Return an evd.Main showing whole frames of an NPZ file.
+
+    This mimics the plot-one and plot-many layout for use with their
+    --fast option.
+    '''
+    from .evd import ds_from_50l_npz, Main
+    ds = ds_from_50l_npz(npzfile, name=osp.basename(npzfile))
+    key = next(k for k in ds.dat if k.startswith("frame_"))
+    rows, cols = ds.dat[key].shape
+    nplanes = max(1, cols//64)
+    opts = dict(dict(color_map='viridis', ticks=(0,rows),
+                     planes=list(range(nplanes)),
+                     cnames=["collection","induction","induction"],
+                     title='{name} {tag} trigger:{trignum}'), **opts)
+    return Main(ds, **opts)
+
 
 @cli.command("plot-one")
 @click.option("--baseline-subtract", type=click.Choice(['median','']), default='',
@@ -479,16 +612,28 @@ def evd2d(baseline_subtract, tag, trigger, aspect,
              help="Trigger number")
 @click.option("-a","--aspect", default="1.0", type=str,
               help="Aspect ratio")
-@click.option("-o","--output",default="plot.pdf",
-              help="Output file")
+@click.option("--fast", is_flag=True, default=False,
+              help="Write PNG directly with NumPy, bypassing matplotlib figures")
+@click.option("-o","--output",default=None,
+              help="Output file, default is plot.pdf or with --fast plot.png")
 @click.argument("npzfile")
-def plot_one(baseline_subtract, tag, trigger, aspect, output, npzfile):
+def plot_one(baseline_subtract, tag, trigger, aspect, fast, output, npzfile):
     '''
     Plot waveforms of a trigger from file
     '''
+    output = output or ("plot.png" if fast else "plot.pdf")
+    if fast:
+        fast_outputs([output])
+        disp = fast_display(npzfile, tag=tag,
+                            baseline_subtract=baseline_subtract)
+        disp.trignum = trigger
+        disp.save_fast(output)
+        return
+
     import numpy
     import matplotlib.pyplot as plt 
-    fp = numpy.load(npzfile)
+    from .framestore import load
+    fp = load(npzfile)
     a = fp[f'frame_{tag}_{trigger}']
     rows, cols = a.shape;
     print (rows,cols)
@@ -509,17 +654,35 @@ def plot_one(baseline_subtract, tag, trigger, aspect, output, npzfile):
 @cli.command("plot-many")
 @click.option("-a","--aspect", default=1.0,
               help="Aspect ratio")
+@click.option("--fast", is_flag=True, default=False,
+              help="Write one PNG per frame directly with NumPy, output is a pattern")
 @click.option("-o","--output",default="plot.pdf",
-              help="Output file")
+              help="Output file, with --fast a pattern which may use {key}, {tag} and {trigger}")
 @click.argument("npzfile")
-def plot_many(aspect, output, npzfile):
+def plot_many(aspect, fast, output, npzfile):
     '''
     Plot waveforms of a trigger from file
     '''
-    import numpy
+    if fast:
+        if '{' not in output:
+            output = osp.splitext(output)[0] + '-{key}.png'
+        fast_outputs([output])
+        disp = fast_display(npzfile)
+        for k in disp.ds.dat:
+            if not k.startswith("frame_"):
+                continue
+            tag, trig = k[len("frame_"):].rsplit('_', 1)
+            disp.set_option('tag', tag)
+            disp.trignum = int(trig)
+            fname = output.format(key=k, tag=tag, trigger=trig)
+            disp.save_fast(fname)
+            print (fname)
+        return
+
     import matplotlib.pyplot as plt 
     from matplotlib.backends.backend_pdf import PdfPages
-    fp = numpy.load(npzfile)
+    from .framestore import load
+    fp = load(npzfile)
     print (list(fp.keys()))
 
     with PdfPages(output) as pdf:
@@ -542,70 +705,581 @@ def plot_many(aspect, output, npzfile):
             plt.close()
 
 
+def catalog_select(catalog, **kwds):
+    '''Return records selected from an existing catalog database.
+    '''
+    from .catalog import Catalog
+    try:
+        with Catalog(catalog, create=False) as cat:
+            return cat.select(**kwds)
+    except FileNotFoundError as err:
+        raise click.BadParameter(str(err))
+
+
 @cli.command("activity")
-@click.option("-t", "--threshold", default=5000,
+@click.option("-t", "--threshold", default=5000.0,
              help="Threshold on the sum of values above minimum")
 @click.option("-m", "--minimum", default=5,
              help="Minimum sample value to be included in sum")
-@click.argument("npzfile")
-@click.argument("npzout")
-def activity(threshold, minimum, npzfile, npzout):
+@click.option("-T", "--tag", default=None,
+             help="Only consider frames with this tag, default is all")
+@click.option("--select", default="0:32,32:64",
+              help="Channel ranges which must each pass threshold for a trigger to be selected")
+@click.option("--planes", default="0:64,64:128,128:192",
+              help="Channel ranges of planes for which the table gives activity")
+@click.option("--max-trigger", default=49, type=int,
+              help="Skip triggers numbered this or larger, 0 to skip none")
+@click.option("-b", "--batch", default=16,
+              help="Number of triggers to process at once")
+@click.option("-j", "--workers", default=4,
+              help="Number of threads reading frames")
+@click.option("-p", "--pattern", default="sig-*.npz",
+              help="File name pattern to use for directory inputs")
+@click.option("-c", "--catalog", default=None,
+              help="Take frames from this catalog, limited to any inputs given")
+@click.option("-w", "--where", default=None,
+              help="With --catalog, an SQL condition on members, eg 'm.max > 1e5'")
+@click.option("--table", default=None,
+              help="Write per-trigger activity table to this file (.npz or text)")
+@click.option("-o", "--output", default=None,
+              help="Write selected frames to this NPZ file")
+@click.argument("inputs", nargs=-1, type=click.Path(exists=True))
+def activity(threshold, minimum, tag, select, planes, max_trigger,
+             batch, workers, pattern, catalog, where, table, output, inputs):
+    '''Select triggers with activity from NPZ files or directories of them.
+
+    Each channel has its median subtracted and samples above minimum
+    are summed.  A trigger is selected if the sum in each of the
+    --select channel ranges reaches threshold.  Selected frames may be
+    copied to an output NPZ and a table of per-plane sums, counts and
+    peaks for all triggers may be written.
+
+    Frames from more than one file are saved with their trigger
+    numbers prefixed by their file's timestamp in seconds, as npzjoin
+    does, eg frame_gauss0_7 of sig-...-159048405892.npz is saved as
+    frame_gauss0_159048405807.
+    '''
+    import zipfile
     import numpy
-    fp = numpy.load(npzfile)
-    arrays = dict()
-    for k in fp.keys():
-        if not k.startswith("frame_"):
-            continue
-        trignum = int(k.split("_")[-1])
-        if trignum >= 49:
-            continue
+    from . import activity as act
+    from .npzio import key_prefixes, prefixed_key
+
+    npzfiles = act.npz_files(inputs, pattern)
+    max_trigger = max_trigger or None
+    items = list()
+    if catalog:
+        recs = catalog_select(catalog, tag=tag, paths=npzfiles or None, where=where)
+        items = [(r.path, r.name, r.tag, r.trigger) for r in recs
+                 if max_trigger is None or r.trigger < max_trigger]
+        npzfiles = sorted(set([r.path for r in recs]))
+    for npzfile in npzfiles if not catalog else []:
+        items += act.frame_items(npzfile, tag, max_trigger)
+
+    zout = None
+    if output:
+        if os.path.exists(output):
+            raise click.BadParameter(f'will not overwrite existing file: {output}')
+        zout = zipfile.ZipFile(output, "w", allowZip64=True)
+    prefixes = key_prefixes(npzfiles)
+
+    rows = list()
+    saved = set()
+    try:
+        for item, row, ind, stack in act.activity(items, threshold, minimum,
+                                                  select, planes, batch, workers):
+            rows.append((item, row))
+            if not row['selected']:
+                continue
+            print (f'select {item[0]} {item[1]}')
+            if zout is None:
+                continue
+            key = prefixed_key(item[1], prefixes[item[0]])
+            if key in saved:
+                raise click.BadParameter(f'duplicate frame {key} from {item[0]}')
+            saved.add(key)
+            with zout.open(key + ".npy", "w", force_zip64=True) as fp:
+                numpy.lib.format.write_array(fp, stack[ind])
+    except BaseException:
+        if zout is not None:
+            zout.close()
+            os.remove(output)
+        raise
+
+    if zout is not None:
+        zout.close()
+    if table:
+        act.write_table(table, rows)
+    nsel = sum([r['selected'] for _,r in rows])
+    print (f'selected {nsel} of {len(rows)} triggers from {len(npzfiles)} files')
 
-        a = fp[k]
-        c = a[:,:64]
-        cn = numpy.array(c - numpy.median(c, axis=0))
-        col = cn[:,0:32]
-        tcol = numpy.sum(col[col>minimum])
-        if tcol < threshold:
-            continue
-        ind = cn[:,32:64]
-        tind = numpy.sum(ind[ind>minimum])
-        if tind < threshold:
-            continue
-        arrays[k] = a
-        print (f'save {k}')
-    numpy.savez(npzout, **arrays)
         
 @cli.command("npzjoin")
 @click.option("-t","--tag", default="gauss0",
               help="Which tag to select")
+@click.option("-j","--workers", default=0,
+              help="Number of threads reading ahead, default streams serially")
+@click.option("-c", "--catalog", default=None,
+              help="Take frames from this catalog, limited to any files given")
+@click.option("-w", "--where", default=None,
+              help="With --catalog, an SQL condition on members, eg 'm.max > 1e5'")
 @click.option("-o","--output", default="joined.npz",
               type=click.Path(exists=False),
               help="Give output NPZ file name")
 @click.argument("npzfiles", nargs=-1)
-def npzjoin(output, tag, npzfiles):
+def npzjoin(output, tag, workers, catalog, where, npzfiles):
     '''Join frames across set of npz files to one.  Rewrite trigger
     numbers.
+
+    Array data is copied as-is between the files without being
+    decoded so memory use does not grow with the output.  Frame store
+    (.pfs) inputs are decoded one frame at a time.
     '''
+    from .npzio import members, copy_members, companion_keys
+    from .framestore import FrameStore, is_framestore
+
+    if not output.endswith(".npz"):
+        output += ".npz"        # as numpy.savez() does
     if os.path.exists(output):
         raise RuntimeError(f'will not overwrite existing file: {output}')
 
     want = f"frame_{tag}_"
-    newtrig=0
-    arrays = dict()
-    for npzfile in npzfiles:
-        print(npzfile)
-        ts = os.path.splitext(npzfile)[0].split("-")[-1]
-        ts = ts[:-2]
-        fp = numpy.load(npzfile)
-        for k,arr in fp.items():
-            if not k.startswith(want):
-                continue
-            _, tag,trig = k.split('_')
-            arrays[f'frame_{tag}_{ts}{newtrig:02d}'] = arr
-            newtrig += 1
-    numpy.savez(output, **arrays)
+    selected = None
+    if catalog:
+        recs = catalog_select(catalog, tag=tag, paths=npzfiles or None, where=where)
+        selected = set([(r.path, r.name) for r in recs])
+        npzfiles = sorted(set([r.path for r in recs]))
+
+    def items():
+        newtrig=0
+        for npzfile in npzfiles:
+            print(npzfile)
+            ts = os.path.splitext(npzfile)[0].split("-")[-1]
+            ts = ts[:-2]
+            if is_framestore(npzfile):
+                with FrameStore(npzfile) as fs:
+                    srcs = [(k, k) for k in fs.keys()]
+            else:
+                srcs = [(z.filename, z) for z in members(npzfile)]
+            byname = dict(srcs)
+            for k, zinfo in srcs:
+                if k.endswith(".npy"):
+                    k = k[:-4]
+                if not k.startswith(want):
+                    continue
+                if selected is not None and (npzfile, k) not in selected:
+                    continue
+                _, tag,trig = k.split('_')
+                yield (npzfile, zinfo, f'frame_{tag}_{ts}{newtrig:02d}.npy')
+                # an aliased or sparse frame is useless without these
+                for ckey in companion_keys(k):
+                    extra = byname.get(ckey + ".npy")
+                    if extra is not None:
+                        kind = ckey.split('_')[0]
+                        yield (npzfile, extra, f'{kind}_{tag}_{ts}{newtrig:02d}.npy')
+                newtrig += 1
+    copy_members(output, items(), workers)
     
 
+@cli.command("decode")
+@click.option("-T", "--tag", default="",
+              help="Frame tag, as the tag of PcbroRawSource")
+@click.option("-n", "--nplanes", default=3, type=click.Choice(["2", "3"]),
+              help="With 3, induction channels are duplicated as a third plane")
+@click.option("-s", "--start", default=1,
+              help="First trigger to write, counting from 1 across files")
+@click.option("-t", "--triggers", default=0,
+              help="Number of triggers to write, default is all")
+@click.option("-l", "--trigger-list", default=None,
+              help="Comma separated triggers to write instead of a range")
+@click.option("-f", "--format", "fmt", default="int16",
+              type=click.Choice(["int16", "packed12"]),
+              help="Store frames as int16 or packed to 12 bits per sample")
+@click.option("--alias", is_flag=True, default=False,
+              help="Store the duplicated induction plane as an alias, not its samples")
+@click.option("-a", "--activity", default=0.0,
+              help="Skip triggers with raw activity below this, default keeps all")
+@click.option("--activity-minimum", default=20.0,
+              help="Minimum ADC from baseline counted in raw activity")
+@click.option("--activity-groups", default="0:64,64:128",
+              help="Channel ranges which must each reach the activity threshold")
+@click.option("-o", "--output", required=True,
+              type=click.Path(exists=False),
+              help="Output NPZ file")
+@click.argument("binfiles", nargs=-1)
+def decode(tag, nplanes, start, triggers, trigger_list, fmt, alias,
+           activity, activity_minimum, activity_groups, output, binfiles):
+    '''Decode .bin files to an NPZ file without WCT.
+
+    Triggers are numbered and decoded as PcbroRawSource does and are
+    written as frame_<tag>_<trigger> int16 arrays of shape (nticks,
+    nchans) with channels_ and tickinfo_ arrays as WCT's
+    NumpyFrameSaver writes them.  A file with corrupt data is ended
+    and decoding goes on with the next.
+
+    With "-f packed12" frames are stored as uint8 arrays of 12 bit
+    samples and with --alias the third plane is given by an alias_
+    array.  Either is read back by pcbro's readers, see npzio.
+
+    With --activity, triggers quiet in the raw data are not written,
+    as with the activity_threshold of PcbroRawSource.  See
+    activity-check for choosing a threshold.
+    '''
+    import zipfile
+    import numpy
+    from .binfile import read_words, trigger_slices, unpack_trigger, dupind_alias
+    from .npzio import write_array, pack12
+    from .activity import measure_raw, parse_ranges
+    groups = parse_ranges(activity_groups)
+
+    if not output.endswith(".npz"):
+        output += ".npz"
+    if os.path.exists(output):
+        raise RuntimeError(f'will not overwrite existing file: {output}')
+
+    if trigger_list:
+        wanted = set([int(t) for t in trigger_list.split(",") if t.strip()])
+        last = max(wanted)
+    else:
+        last = start + triggers - 1 if triggers > 0 else None
+        wanted = None
+
+    dupind = nplanes == "3"
+    tick = 0.5e3                # WCT units, 0.5 us
+    ident = 0
+    with zipfile.ZipFile(output, "w") as zout:
+        for binfile in binfiles:
+            try:
+                words = read_words(binfile)
+                slices = trigger_slices(words)
+            except ValueError as err:
+                print(f'{binfile}: {err}')
+                continue
+            nwrote = nquiet = 0
+            for links in slices:
+                ident += 1
+                if last is not None and ident > last:
+                    break
+                if wanted is not None and ident not in wanted:
+                    continue
+                if wanted is None and ident < start:
+                    continue
+                frame = unpack_trigger(words, links, dupind and not alias)
+                if activity > 0:
+                    meas = measure_raw(frame[None,:,:], activity_minimum, groups)
+                    if min([m[0] for m in meas]) < activity:
+                        nquiet += 1
+                        continue
+                nchans = 192 if dupind else 128
+                chans = numpy.arange(1, nchans+1, dtype=numpy.int32)
+                tickinfo = numpy.array([ident*1e6, tick, 0.0])
+                if fmt == "packed12":
+                    frame = pack12(frame)
+                write_array(zout, f'frame_{tag}_{ident}.npy', frame)
+                if dupind and alias:
+                    write_array(zout, f'alias_{tag}_{ident}.npy', dupind_alias)
+                write_array(zout, f'channels_{tag}_{ident}.npy', chans)
+                write_array(zout, f'tickinfo_{tag}_{ident}.npy', tickinfo)
+                nwrote += 1
+            print(f'{binfile}: {len(slices)} triggers, {nwrote} written, {nquiet} quiet')
+            if last is not None and ident >= last:
+                break
+
+
+@cli.command("activity-check")
+@click.option("-r", "--raw", "rawfiles", multiple=True, required=True,
+              help="Raw NPZ file, give once for each --sig file in the same order")
+@click.option("-s", "--sig", "sigfiles", multiple=True, required=True,
+              help="Sig NPZ file made from the raw data of the matching --raw file")
+@click.option("-t", "--threshold", default=5000.0,
+              help="Sig selection threshold, as activity")
+@click.option("-m", "--minimum", default=5,
+              help="Sig selection minimum sample value, as activity")
+@click.option("-T", "--tag", default="gauss0",
+              help="Sig frame tag")
+@click.option("--select", default="0:32,32:64",
+              help="Sig selection channel ranges, as activity")
+@click.option("--raw-tag", default="",
+              help="Raw frame tag")
+@click.option("--activity-minimum", default=20.0,
+              help="Minimum ADC from baseline counted in raw activity")
+@click.option("--activity-groups", default="0:64,64:128",
+              help="Channel ranges which must each reach the raw activity threshold")
+@click.option("-e", "--efficiency", default=0.99,
+              help="Fraction of sig selected triggers the raw threshold must keep")
+@click.option("-b", "--batch", default=16,
+              help="Number of triggers to process at once")
+@click.option("-j", "--workers", default=4,
+              help="Number of threads reading frames")
+def activity_check(rawfiles, sigfiles, threshold, minimum, tag, select, raw_tag,
+                   activity_minimum, activity_groups, efficiency, batch, workers):
+    '''Validate raw activity thresholds against the sig selection.
+
+    Triggers are selected from the sig files as the activity command
+    does and the raw activity of each, as PcbroRawSource and decode
+    measure it, is found from the raw files.  The largest raw
+    threshold keeping the --efficiency fraction of selected triggers
+    is printed with the fraction of all triggers it keeps, which is
+    the fraction of the sigproc cost still spent.  A table for other
+    efficiencies follows.
+    '''
+    from . import activity as act
+
+    if len(rawfiles) != len(sigfiles):
+        raise click.BadParameter("give one --raw file for each --sig file")
+
+    selected = dict()
+    raw = dict()
+    for pair, (rawfile, sigfile) in enumerate(zip(rawfiles, sigfiles)):
+        items = act.frame_items(sigfile, tag)
+        for item, row, _, _ in act.activity(items, threshold, minimum, select,
+                                            batch=batch, workers=workers):
+            selected[(pair, item[3])] = row['selected']
+        items = act.frame_items(rawfile, raw_tag)
+        for item, meas in act.raw_activity(items, activity_minimum, activity_groups,
+                                           batch, workers):
+            raw[(pair, item[3])] = meas
+
+    keys = sorted(set(selected) & set(raw))
+    if not keys:
+        raise click.BadParameter("no triggers are in both raw and sig files")
+    nsel = sum([selected[k] for k in keys])
+    print(f'{len(keys)} triggers in both, {nsel} selected by sig activity, '
+          f'{len(raw)-len(keys)} raw and {len(selected)-len(keys)} sig unmatched')
+    if not nsel:
+        print('no selected triggers to keep, any raw threshold will do')
+        return
+
+    sel_raw = [raw[k] for k in keys if selected[k]]
+    def kept(cut):
+        return sum([raw[k] >= cut for k in keys]) / len(keys)
+
+    cut = act.raw_threshold(sel_raw, efficiency)
+    eff = sum([one >= cut for one in sel_raw]) / nsel
+    print(f'raw threshold {cut:.6g} keeps {eff:.3f} of selected '
+          f'and {kept(cut):.3f} of all triggers')
+    print('# efficiency threshold kept')
+    for eff in (1.0, 0.999, 0.99, 0.98, 0.95, 0.9):
+        one = act.raw_threshold(sel_raw, eff)
+        print(f'{eff:.3f} {one:.6g} {kept(one):.3f}')
+
+
+@cli.command("sparsify")
+@click.option("-T", "--tag", "tags", multiple=True,
+              help="Only store frames with this tag sparse, default is all")
+@click.option("-t", "--threshold", default=0.0,
+              help="Samples of this magnitude or less are dropped")
+@click.option("-o", "--output", required=True,
+              type=click.Path(exists=False),
+              help="Output NPZ file")
+@click.argument("npzfile")
+def sparsify(tags, threshold, output, npzfile):
+    '''Store the frames of an NPZ file sparse, as regions of interest.
+
+    Each frame is stored as the samples of its regions with a roi_
+    array describing them, as PcbroSparseFrameSaver writes.  All of
+    pcbro's readers densify them again, see npzio.  Other arrays are
+    copied as-is.
+    '''
+    import zipfile
+    import numpy
+    from .npzio import members, read_data, write_data, write_array
+    from .npzio import sparsify as make_sparse
+    from .activity import parse_frame_key
+
+    if not output.endswith(".npz"):
+        output += ".npz"
+    if os.path.exists(output):
+        raise click.BadParameter(f'will not overwrite existing file: {output}')
+
+    nin = nout = 0
+    with zipfile.ZipFile(npzfile) as zin, \
+         zipfile.ZipFile(output, "w", allowZip64=True) as zout:
+        for zinfo in members(npzfile):
+            key = zinfo.filename[:-4]
+            tt = parse_frame_key(key)
+            if tt is None or (tags and tt[0] not in tags):
+                write_data(zout, zinfo.filename, zinfo, read_data(npzfile, zinfo))
+                continue
+            with zin.open(zinfo) as fp:
+                frame = numpy.lib.format.read_array(fp)
+            if frame.ndim != 2 or frame.dtype == numpy.uint8:
+                raise click.BadParameter(f'{key} is not a plain 2D frame')
+            samples, roi = make_sparse(frame, threshold)
+            write_array(zout, key + ".npy", samples)
+            write_array(zout, "roi_" + key[len("frame_"):] + ".npy", roi)
+            nin += frame.nbytes
+            nout += samples.nbytes + roi.nbytes
+    print(f'{npzfile}: frames of {nin} bytes stored in {nout}')
+
+
+@cli.command("convert-npz-pfs")
+@click.option("-z", "--codec", default="zlib",
+              type=click.Choice(["none", "zlib", "bz2", "lzma"]),
+              help="Compression of each chunk")
+@click.option("-l", "--level", default=1,
+              help="Compression level")
+@click.option("--tblock", default=128,
+              help="Number of ticks per chunk")
+@click.option("--planes", default="0:64,64:128,128:192",
+              help="Channel ranges, one chunk column each")
+@click.option("-a", "--append", is_flag=True, default=False,
+              help="Append to an existing frame store")
+@click.option("-o", "--output", required=True,
+              help="Output frame store file (.pfs)")
+@click.argument("npzfiles", nargs=-1)
+def convert_npz_pfs(codec, level, tblock, planes, append, output, npzfiles):
+    '''Convert NPZ files to one chunked frame store.
+
+    Frames are chunked by plane and by blocks of ticks so that a
+    trigger, plane and tick range may be read without decoding the
+    rest.
+
+    Unless a single file is converted to a new store, the trigger
+    numbers of keys are prefixed by their file's timestamp in seconds,
+    as npzjoin does, so that files with the same keys may be combined.
+    The store is written to a temporary file, a copy of the existing
+    one when appending, which replaces output only on success.
+    '''
+    import shutil
+    from .framestore import from_npz
+    from .activity import parse_ranges
+    from .npzio import key_prefixes
+
+    prefixes = key_prefixes(npzfiles, single=append)
+    tmp = f'{output}.{os.getpid()}'
+    mode = 'w'
+    if append and os.path.exists(output):
+        shutil.copyfile(output, tmp)
+        mode = 'a'
+    try:
+        for npzfile in npzfiles:
+            try:
+                keys = from_npz(npzfile, tmp, mode, prefix=prefixes[npzfile],
+                                codec=codec, level=level,
+                                planes=parse_ranges(planes), tblock=tblock)
+            except KeyError as err:
+                raise click.ClickException(f'{npzfile}: {err.args[0]}')
+            print(f'{npzfile}: {len(keys)} arrays')
+            mode = 'a'
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    if os.path.exists(tmp):
+        os.replace(tmp, output)
+
+
+@cli.command("convert-pfs-npz")
+@click.option("-o", "--output", required=True,
+              help="Output NPZ file")
+@click.argument("pfsfile")
+def convert_pfs_npz(output, pfsfile):
+    '''Convert a chunked frame store to an NPZ file.
+    '''
+    from .framestore import to_npz
+    keys = to_npz(pfsfile, output)
+    print(f'{output}: {len(keys)} arrays')
+
+
+@cli.command("catalog")
+@click.option("-c", "--catalog", default="pcbro-catalog.db",
+              help="The catalog database file, created if missing")
+@click.option("-p", "--pattern", default="*.npz",
+              help="File name pattern to use for directory inputs")
+@click.option("--stats/--no-stats", default=True,
+              help="Read frames to make summary statistics")
+@click.option("--prune", is_flag=True, default=False,
+              help="Remove files from the catalog which no longer exist")
+@click.option("-l", "--list", "listing", is_flag=True, default=False,
+              help="List cataloged frames instead of files")
+@click.option("-T", "--tag", default=None,
+              help="With --list, only frames with this tag")
+@click.option("-w", "--where", default=None,
+              help="With --list, an SQL condition on members, eg 'm.max > 1e5'")
+@click.argument("paths", nargs=-1)
+def catalog(catalog, pattern, stats, prune, listing, tag, where, paths):
+    '''Index NPZ or frame store files or directories of them into a catalog.
+
+    Only new or changed files are (re)scanned.  The catalog records
+    for each file its tier, timestamp and CERN time and for each array
+    its tag, trigger, shape, dtype, location and summary statistics.
+    '''
+    from .catalog import Catalog
+    with Catalog(catalog) as cat:
+        for path in cat.update(paths, pattern, stats, prune):
+            print(f'scanned {path}')
+        if listing:
+            for r in cat.select(tag=tag, paths=None, where=where):
+                print(f'{r.path} {r.name} {r.shape} {r.dtype} '
+                      f'[{r.min}, {r.max}] {r.cern_time}')
+            return
+        for path, tier, stamp, cern_time, nmem in cat.files():
+            print(f'{path} {tier} {stamp} "{cern_time}" {nmem}')
+
+
+def parse_tlas(tlas):
+    '''Return a dict from name=value strings.
+    '''
+    ret = dict()
+    for tla in tlas:
+        name, eq, val = tla.partition("=")
+        if not eq:
+            raise click.BadParameter(f'want name=value, got: {tla}')
+        ret[name] = val
+    return ret
+
+
+@cli.command("compile-config")
+@click.option("-c", "--cache", "cachedir", default="pcbro-cfg-cache",
+              help="Directory of compiled configuration, created if missing")
+@click.option("-J", "--jpath", multiple=True,
+              help="Add a directory to search ahead of WIRECELL_PATH")
+@click.option("-f", "--file", "files", multiple=True,
+              help="A file name TLA as name=path")
+@click.option("-F", "--files", "filelists", multiple=True,
+              help="An element of a list of file names TLA as name=path, repeat in order")
+@click.option("-A", "--tla-str", "tla_str", multiple=True,
+              help="Another TLA as name=string")
+@click.option("-C", "--tla-code", "tla_code", multiple=True,
+              help="Another TLA as name=jsonnet code")
+@click.option("--jsonnet", default="jsonnet",
+              help="The jsonnet program to compile with")
+@click.option("-o", "--output", default=None,
+              help="Output JSON file for wire-cell -c, default is stdout")
+@click.argument("template")
+def compile_config(cachedir, jpath, files, filelists, tla_str, tla_code,
+                   jsonnet, output, template):
+    '''Make a wire-cell configuration from a cached compiled template.
+
+    The template is compiled by jsonnet only once for each distinct
+    set of the TLAs other than file names and after any change to the
+    .jsonnet files.  File names are then substituted to make each
+    job's configuration, eg:
+
+      wirecell-pcbro compile-config -o job.json -f infile=a.bin \\
+        -f outfile=a.npz -A activity=1e6 cli-bin-sp-npz.jsonnet
+
+      wire-cell -c job.json
+    '''
+    from .cfgcache import compile_config as compile_one
+    fnames = parse_tlas(files)
+    for tla in filelists:
+        for name, path in parse_tlas([tla]).items():
+            fnames.setdefault(name, list()).append(path)
+    import subprocess
+    try:
+        cfg = compile_one(template, fnames, parse_tlas(tla_str), parse_tlas(tla_code),
+                          jpath, cachedir, jsonnet)
+    except (OSError, subprocess.CalledProcessError) as err:
+        raise click.ClickException(f'can not compile {template}: {err}')
+    text = json.dumps(cfg, indent=1)
+    if output:
+        with open(output, "w") as fp:
+            fp.write(text)
+    else:
+        print(text)
+
+
 def main():
     cli(obj=dict())
 
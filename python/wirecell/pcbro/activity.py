@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+'''
+Find triggers with activity in 50-L frames.
+
+Frames are streamed from NPZ or frame store files in batches of
+triggers.  Members
+are read and decompressed by a pool of threads and each batch is
+stacked to a 3D (trigger, tick, channel) array so that baselines and
+thresholded sums are computed for all triggers of a batch at once.
+Memory use is bounded by the batch size, not the number of triggers.
+
+Raw frames may also be measured, as PcbroRawSource does to drop quiet
+triggers before sigproc, and a raw threshold found which keeps the
+triggers selected after sigproc.
+'''
+import os
+import glob
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+
+from .framestore import FrameStore, is_framestore
+from .npzio import companion_keys, expand_frame
+
+
+def parse_ranges(text):
+    '''Return list of (first,last) channel index pairs from a string
+    like "0:64,64:128".
+    '''
+    return [tuple(map(int, one.strip().split(":")))
+            for one in text.split(",") if one.strip()]
+
+
+def npz_files(paths, pattern="sig-*.npz"):
+    '''Return list of NPZ files from paths which may be files or
+    directories.  Directories are searched for files matching
+    pattern.
+    '''
+    ret = list()
+    for path in paths:
+        if os.path.isdir(path):
+            ret += sorted(glob.glob(os.path.join(path, pattern)))
+        else:
+            ret.append(path)
+    return ret
+
+
+def parse_frame_key(key):
+    '''Return (tag, trignum) from a frame_<tag>_<trignum> key or None
+    if key is not a frame.
+    '''
+    if not key.startswith("frame_"):
+        return None
+    tag, trig = key[len("frame_"):].rsplit("_", 1)
+    if not trig.isdigit():
+        return None
+    return tag, int(trig)
+
+
+def frame_items(npzfile, tag=None, max_trigger=None):
+    '''Return list of (npzfile, key, tag, trignum) for frames in the
+    file in member order, optionally only of given tag and below
+    max_trigger.
+    '''
+    if is_framestore(npzfile):
+        with FrameStore(npzfile) as fs:
+            names = list(fs.keys())
+    else:
+        with zipfile.ZipFile(npzfile) as zf:
+            names = zf.namelist()
+    ret = list()
+    for name in names:
+        key = name[:-4] if name.endswith(".npy") else name
+        tt = parse_frame_key(key)
+        if tt is None:
+            continue
+        if tag is not None and tt[0] != tag:
+            continue
+        if max_trigger is not None and tt[1] >= max_trigger:
+            continue
+        ret.append((npzfile, key) + tt)
+    return ret
+
+
+class MemberReader:
+    '''
+    Read NPZ members or frame store arrays from many threads.
+
+    Each thread keeps its own open file handles.
+    '''
+    def __init__(self):
+        self._local = threading.local()
+
+    def source(self, npzfile):
+        files = getattr(self._local, "files", None)
+        if files is None:
+            files = self._local.files = dict()
+        zf = files.get(npzfile)
+        if zf is None:
+            # keep only the file currently in use open
+            for one in files.values():
+                one.close()
+            files.clear()
+            if is_framestore(npzfile):
+                zf = FrameStore(npzfile)
+            else:
+                zf = zipfile.ZipFile(npzfile)
+            files[npzfile] = zf
+        return zf
+
+    def __call__(self, item):
+        npzfile, key = item[:2]
+        src = self.source(npzfile)
+        if isinstance(src, FrameStore):
+            return src.read(key)
+        arrs = list()
+        for name in (key,) + companion_keys(key):
+            arr = None
+            if name + ".npy" in src.NameToInfo:
+                with src.open(name + ".npy") as fp:
+                    arr = numpy.lib.format.read_array(fp)
+            arrs.append(arr)
+        return expand_frame(*arrs)
+
+
+def batches(items, size):
+    'Yield lists of up to size items'
+    for ind in range(0, len(items), size):
+        yield items[ind:ind+size]
+
+
+def stream_frames(items, batch=16, workers=4):
+    '''Yield (items, stack) for batches of frame items.
+
+    The stack is a 3D array (trigger, tick, channel) of the frames of
+    the items.  Reading of the next batch proceeds in the background
+    while the current one is consumed.  Frames of a batch which
+    differ in shape are yielded as separate stacks.
+    '''
+    reader = MemberReader()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = None
+        for chunk in batches(items, batch):
+            future = (chunk, pool.map(reader, chunk))
+            if pending is not None:
+                yield from _stacked(*pending)
+            pending = future
+        if pending is not None:
+            yield from _stacked(*pending)
+
+
+def _stacked(chunk, arrays):
+    arrays = list(arrays)
+    shapes = list()
+    for arr in arrays:
+        if arr.shape not in shapes:
+            shapes.append(arr.shape)
+    for shape in shapes:
+        inds = [ind for ind, arr in enumerate(arrays) if arr.shape == shape]
+        yield ([chunk[ind] for ind in inds],
+               numpy.stack([arrays[ind] for ind in inds]))
+
+
+def measure(stack, minimum, groups):
+    '''Return activity measures for a (trigger, tick, channel) stack.
+
+    Each channel has its median over ticks subtracted.  For each
+    (first,last) channel range in groups, a tuple of arrays over
+    triggers is returned giving the sum and the count of samples
+    above minimum and the peak sample.
+    '''
+    stack = numpy.asarray(stack, dtype=numpy.float32)
+    base = numpy.median(stack, axis=1, keepdims=True)
+    cn = stack - base
+    above = cn > minimum
+    vals = numpy.where(above, cn, 0)
+    ret = list()
+    for c0, c1 in groups:
+        ret.append((vals[:,:,c0:c1].sum(axis=(1,2), dtype=numpy.float64),
+                    above[:,:,c0:c1].sum(axis=(1,2)),
+                    cn[:,:,c0:c1].max(axis=(1,2))))
+    return ret
+
+
+def activity(items, threshold=5000, minimum=5,
+             select="0:32,32:64", planes="0:64,64:128,128:192",
+             batch=16, workers=4):
+    '''Yield (item, row, stack_index, stack) per frame item.
+
+    The row is a dict of per-plane sum, count and peak measures (see
+    measure()) with the plane index appended to the names and a
+    "selected" flag which is true if the sum above minimum reaches
+    threshold in every group of select channel ranges.  Planes not
+    in the frame are given zeros.  The stack and the index of the
+    item's frame in it are given so callers may save selected frames.
+    '''
+    select = parse_ranges(select) if isinstance(select, str) else select
+    planes = parse_ranges(planes) if isinstance(planes, str) else planes
+
+    for chunk, stack in stream_frames(items, batch, workers):
+        nchans = stack.shape[2]
+        pgroups = [p for p in planes if p[0] < nchans]
+        sgroups = [s for s in select if s[0] < nchans]
+        meas = measure(stack, minimum, pgroups + sgroups)
+        selected = numpy.ones(len(chunk), dtype=bool)
+        for tot, _, _ in meas[len(pgroups):]:
+            selected &= tot >= threshold
+        for ind, item in enumerate(chunk):
+            row = dict(selected=bool(selected[ind]))
+            for pind in range(len(planes)):
+                vals = (0, 0, 0)
+                if pind < len(pgroups):
+                    vals = [arr[ind].item() for arr in meas[pind]]
+                for what, val in zip(("sum", "count", "peak"), vals):
+                    row[f"{what}{pind}"] = val
+            yield item, row, ind, stack
+
+
+def measure_raw(stack, minimum, groups):
+    '''Return raw activity of a (trigger, tick, channel) stack.
+
+    As PcbroRawSource's activity_threshold, each channel has its
+    median over ticks subtracted and, for each (first,last) channel
+    range in groups, an array over triggers of the sum of absolute
+    differences above minimum is returned.  Both signs count as raw
+    induction signals are bipolar.
+    '''
+    stack = numpy.asarray(stack, dtype=numpy.float32)
+    base = numpy.median(stack, axis=1, keepdims=True)
+    dev = numpy.abs(stack - base)
+    vals = numpy.where(dev > minimum, dev, 0)
+    return [vals[:,:,c0:c1].sum(axis=(1,2), dtype=numpy.float64)
+            for c0, c1 in groups]
+
+
+def raw_activity(items, minimum=20, groups="0:64,64:128", batch=16, workers=4):
+    '''Yield (item, activity) per raw frame item.
+
+    The activity is the smallest over groups of measure_raw() so a
+    trigger passes a threshold on every group if it passes on this.
+    '''
+    groups = parse_ranges(groups) if isinstance(groups, str) else groups
+    for chunk, stack in stream_frames(items, batch, workers):
+        meas = numpy.min(measure_raw(stack, minimum, groups), axis=0)
+        for ind, item in enumerate(chunk):
+            yield item, meas[ind].item()
+
+
+def raw_threshold(selected, efficiency=0.99):
+    '''Return the largest raw activity threshold which keeps at least
+    the efficiency fraction of the raw activities of selected triggers.
+    '''
+    selected = numpy.sort(numpy.asarray(selected, dtype=numpy.float64))
+    if not selected.size:
+        return 0.0
+    lose = int(numpy.floor((1 - efficiency) * selected.size + 1e-9))
+    return selected[min(lose, selected.size - 1)].item()
+
+
+table_columns = ("path", "key", "tag", "trigger")
+
+
+def write_table(filename, rows):
+    '''Write activity rows, a list of (item, row), to a file.
+
+    A .npz file receives one array per column, otherwise a
+    whitespace-separated text table with a header line is written.
+    '''
+    if not rows:
+        cols = dict((c, []) for c in table_columns)
+    else:
+        cols = dict((c, [item[ind] for item, _ in rows])
+                    for ind, c in enumerate(table_columns))
+        for name in rows[0][1]:
+            cols[name] = [row[name] for _, row in rows]
+
+    if filename.endswith(".npz"):
+        numpy.savez(filename, **dict((k, numpy.array(v)) for k, v in cols.items()))
+        return
+
+    names = list(cols)
+    with open(filename, "w") as fp:
+        fp.write("# " + " ".join(names) + "\n")
+        for ind in range(len(rows)):
+            vals = list()
+            for name in names:
+                val = cols[name][ind]
+                if isinstance(val, bool):
+                    val = int(val)
+                if isinstance(val, float):
+                    val = f'{val:.6g}'
+                vals.append(str(val) if val != "" else '""')
+            fp.write(" ".join(vals) + "\n")
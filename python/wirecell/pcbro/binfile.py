@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+'''
+Decode PCB anode .bin files with NumPy.
+
+This follows BinFile.h and gives the same triggers as PcbroRawSource
+without needing WCT.  The file is memory mapped as big-endian 16 bit
+words.  Candidate package headers are found for the whole file at
+once, each is matched to the header following it by a sorted search
+and packages are then chained into links and triggers.  The 12 bit
+samples of each link are unpacked with array bit operations and
+placed in "physical" channel order.
+
+Frames are (nticks, nchans) int16 arrays, the layout of frames in the
+NPZ files written by WCT.
+'''
+import os
+import numpy
+
+# A full package, see BinFile.h.  A shorter one ends a link.
+package_size = 0x1df4//2 - 10
+
+# Words in one sample of a link: a marker and 8 groups of 3 words
+# holding 4 channels each.
+sample_words = 25
+
+# Start channel of each group of 4 in a 32 channel sample.
+segments = numpy.array([4, 0, 12, 8, 20, 16, 28, 24])
+
+# Map electronics channel index to 1-based "physical" channel, as
+# RawSource.cxx.
+chan_phy = numpy.array(
+    [65, 66, 67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,
+     85,86,87,88,89,90,91,92,93,94,95,96,113,114,115,116,117,118,119,
+     120,121,122,123,124,125,126,127,128,97,98,99,100,101,102,103,
+     104,105,106,107,108,109,110,111,112,16,15,14,13,12,11,10,9,8,
+     7,6,5,4,3,2,1,32,31,30,29,28,27,26,25,24,23,22,21,20,19,18,17,
+     64,63,62,61,60,59,58,57,56,55,54,53,52,51,50,49,48,47,46,45,44,
+     43,42,41,40,39,38,37,36,35,34,33])
+
+
+def read_words(path):
+    '''Return the file as an array of native uint16 words.
+
+    As read_raw_data() in BinFile.h, one word is appended which holds
+    any odd trailing byte in its high byte, else zero.
+    '''
+    nbytes = os.path.getsize(path)
+    words = numpy.zeros(nbytes//2 + 1, dtype=numpy.uint16)
+    if nbytes >= 2:
+        words[:-1] = numpy.memmap(path, dtype='>u2', mode='r',
+                                  shape=(nbytes//2,))
+    if nbytes % 2:
+        with open(path, 'rb') as fp:
+            fp.seek(-1, 2)
+            words[-1] = fp.read(1)[0] << 8
+    return words
+
+
+def package_chain(words):
+    '''Return array of the starts of consecutive packages from the
+    start of words.
+
+    The last entry is where seek_package() finds no next package.
+    Raise ValueError if the data does not start with a package header.
+    '''
+    nwords = words.size
+    if nwords < 4:
+        return numpy.zeros(0, dtype=numpy.int64)
+    if words[2] or words[3]:
+        raise ValueError("corruption on seek package")
+
+    # A header has a zero 32 bit reserved word two words past its
+    # start and is followed by at least four words.
+    zero = words == 0
+    cand = numpy.flatnonzero(zero[2:-1] & zero[3:])
+    count = (words[cand].astype(numpy.uint64) << 16) | words[cand+1]
+
+    # The next package is the first candidate at least four words on
+    # whose count is one more.  Sort on (count, start) so that is one
+    # search for every candidate.
+    key = (count << 32) | cand.astype(numpy.uint64)
+    order = numpy.argsort(key, kind="stable")
+    skey = key[order]
+    want = (((count + 1) & 0xffffffff) << 32) | (cand + 4).astype(numpy.uint64)
+    ind = numpy.searchsorted(skey, want)
+    found = ind < skey.size
+    found[found] = (skey[ind[found]] >> 32) == (want[found] >> 32)
+    succ = numpy.full(cand.size, -1, dtype=numpy.int64)
+    succ[found] = order[ind[found]]
+
+    chain = [0]                 # cand[0] is 0, checked above
+    icand = 0
+    while succ[icand] >= 0:
+        icand = succ[icand]
+        chain.append(icand)
+    return cand[chain]
+
+
+def payload(words, beg, end):
+    '''Return slice of the link data in the package [beg,end), as
+    append_link().
+    '''
+    start = beg + 8
+    if start + 1 < words.size and words[start] == 0 \
+       and words[start+1] in (0xface, 0xfeed):
+        start += 1
+    return slice(start, max(start, end))
+
+
+def trigger_slices(words, psize=package_size):
+    '''Return list of triggers, each a list of four links, each a list
+    of slices of words holding its link data.
+
+    Trigger boundaries are those of make_trigger(), including that
+    data ending before a fourth link ends the triggers.
+    '''
+    chain = package_chain(words)
+    triggers = list()
+    links = [[]]
+    for beg, end in zip(chain[:-1], chain[1:]):
+        links[-1].append(payload(words, beg, end))
+        if end - beg >= psize:
+            continue
+        if len(links) == 4:
+            triggers.append(links)
+            links = [[]]
+        else:
+            links.append([])
+    # The last package is not followed by one so it is dropped and its
+    # link ends the data.
+    if len(links) == 4:
+        triggers.append(links)
+    return triggers
+
+
+def unpack_link(data):
+    '''Return (nticks, 32) array of samples from link data in
+    electronics channel order.
+    '''
+    nticks = data.size // sample_words
+    grp = data[:nticks*sample_words].reshape(nticks, sample_words)[:, 1:]
+    grp = grp.reshape(nticks, 8, 3)
+    w0, w1, w2 = grp[:,:,0], grp[:,:,1], grp[:,:,2]
+    vals = numpy.empty((nticks, 8, 4), dtype=numpy.uint16)
+    vals[:,:,3] = w0 & 0xfff
+    vals[:,:,2] = ((w1 & 0xff) << 4) | (w0 >> 12)
+    vals[:,:,1] = ((w2 & 0xf) << 8) | (w1 >> 8)
+    vals[:,:,0] = w2 >> 4
+    out = numpy.empty((nticks, 32), dtype=numpy.uint16)
+    out[:, (segments[:,None] + numpy.arange(4)).ravel()] = vals.reshape(nticks, 32)
+    return out
+
+
+# The duplicated induction plane as (first, source, count) columns,
+# see npzio.alias_columns().
+dupind_alias = numpy.array([[128, 64, 64]], dtype=numpy.int32)
+
+
+def unpack_trigger(words, links, dupind=True):
+    '''Return (nticks, nchans) int16 frame of one trigger's links.
+
+    Channels are in physical order, ticks past the end of a shorter
+    link are zero.  With dupind, the induction channels [64,128) are
+    copied to [128,192) as RawSource does.
+    '''
+    datas = [numpy.concatenate([words[s] for s in slices] or [words[:0]])
+             for slices in links]
+    nticks = max([d.size // sample_words for d in datas])
+    nchans = 192 if dupind else 128
+    frame = numpy.zeros((nticks, nchans), dtype=numpy.int16)
+    for ilink, data in enumerate(datas):
+        block = unpack_link(data)
+        cols = chan_phy[ilink*32:(ilink+1)*32] - 1
+        frame[:block.shape[0], cols] = block
+    if dupind:
+        frame[:, 128:] = frame[:, 64:128]
+    return frame
+
+
+def triggers(path, dupind=True, psize=package_size):
+    '''Yield (index, frame) for each trigger in a .bin file in order
+    with 0-based index.
+
+    Raise ValueError on corrupt data, which PcbroRawSource takes to
+    end the file.
+    '''
+    words = read_words(path)
+    for index, links in enumerate(trigger_slices(words, psize)):
+        yield index, unpack_trigger(words, links, dupind)
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+'''
+A catalog of 50-L raw and signal NPZ or frame store files.
+
+The catalog is a local SQLite database holding, for each file, its
+tier, run timestamp and CERN time and, for each member array, its
+tag, trigger, dtype, shape, location in the file and some summary
+statistics.  It is updated incrementally and may be queried to go
+directly to selected triggers without opening every file.
+'''
+import os
+import glob
+import json
+import sqlite3
+import zipfile
+import urllib.parse
+from collections import namedtuple
+import numpy
+
+from .evd import secs_from_centiseconds, cern_time_from_secs
+from .npzio import data_offset, companion_keys, expand_frame
+from .framestore import FrameStore, is_framestore
+
+schema = '''
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    tier TEXT,
+    stamp TEXT,
+    seconds INTEGER,
+    cern_time TEXT
+);
+CREATE TABLE IF NOT EXISTS members (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    kind TEXT,
+    tag TEXT,
+    trigger INTEGER,
+    dtype TEXT,
+    shape TEXT,
+    fortran INTEGER,
+    compress INTEGER,
+    offset INTEGER,
+    array_offset INTEGER,
+    nbytes INTEGER,
+    min REAL,
+    max REAL,
+    mean REAL,
+    std REAL,
+    PRIMARY KEY (file_id, name)
+);
+CREATE INDEX IF NOT EXISTS members_trigger ON members(tag, trigger);
+'''
+
+# One selected member as returned by a query.
+Record = namedtuple("Record", "path tier stamp seconds cern_time name kind tag trigger dtype shape fortran compress offset array_offset nbytes min max mean std")
+
+record_columns = ("f.path, f.tier, f.stamp, f.seconds, f.cern_time, "
+                  "m.name, m.kind, m.tag, m.trigger, m.dtype, m.shape, "
+                  "m.fortran, m.compress, m.offset, m.array_offset, "
+                  "m.nbytes, m.min, m.max, m.mean, m.std")
+
+
+def file_info(path):
+    '''Return dict of file level information parsed from a path named
+    like <tier>-...-<centiseconds>.npz.
+    '''
+    base = os.path.splitext(os.path.basename(path))[0]
+    tier = None
+    for one in ("raw", "sig"):
+        if base.startswith(one + "-"):
+            tier = one
+    stamp = base.split("-")[-1]
+    seconds = cern_time = None
+    if stamp.isdigit() and len(stamp) > 2:
+        seconds = secs_from_centiseconds(stamp)
+        cern_time = cern_time_from_secs(seconds)
+    else:
+        stamp = None
+    return dict(tier=tier, stamp=stamp, seconds=seconds, cern_time=cern_time)
+
+
+def member_key(name):
+    '''Return (name, kind, tag, trigger) for an NPZ member name or a
+    frame store key.
+
+    Members are named like <kind>_<tag>_<trigger>.npy.  The kind,
+    tag and trigger are None if the name does not follow this.
+    '''
+    if name.endswith(".npy"):
+        name = name[:-4]
+    parts = name.split("_")
+    if len(parts) < 3 or not parts[-1].isdigit():
+        return name, None, None, None
+    return name, parts[0], "_".join(parts[1:-1]), int(parts[-1])
+
+
+def read_header(fp):
+    '''Read an .npy header from file object fp.
+
+    Return (shape, fortran, dtype) leaving fp at the array data.
+    '''
+    version = numpy.lib.format.read_magic(fp)
+    if version == (1, 0):
+        return numpy.lib.format.read_array_header_1_0(fp)
+    return numpy.lib.format.read_array_header_2_0(fp)
+
+
+def frame_stats(arr):
+    'Return dict of the summary statistics of a frame'
+    return dict(min=float(arr.min()), max=float(arr.max()),
+                mean=float(arr.mean()), std=float(arr.std()))
+
+
+def scan_framestore(path, stats=True):
+    '''Return list of member dicts describing the arrays in a frame
+    store file, as scan_file().
+
+    An array's offset is that of its first chunk and only an array
+    held in one uncompressed chunk has an array_offset.  As arrays are
+    not zip members, compress is None.
+    '''
+    ret = list()
+    with FrameStore(path) as fs:
+        for key, ent in fs.index.items():
+            name, kind, tag, trig = member_key(key)
+            dtype = numpy.dtype(ent['dtype'])
+            shape = ent['shape']
+            chunks = ent['chunks']
+            array_offset = None
+            if 'planes' not in ent and chunks[0]['codec'] == 'none':
+                array_offset = chunks[0]['offset']
+            row = dict(name=name, kind=kind, tag=tag, trigger=trig,
+                       dtype=dtype.str, shape=json.dumps(shape),
+                       fortran=0, compress=None,
+                       offset=chunks[0]['offset'] if chunks else None,
+                       array_offset=array_offset,
+                       nbytes=int(numpy.prod(shape)) * dtype.itemsize,
+                       min=None, max=None, mean=None, std=None)
+            if stats and kind == "frame" and len(shape):
+                row.update(frame_stats(fs.read(key)))
+            ret.append(row)
+    return ret
+
+
+def scan_file(path, stats=True):
+    '''Return list of member dicts describing the arrays in an NPZ or
+    frame store file.
+
+    If stats is true, each frame is read to give min, max, mean and
+    standard deviation.
+    '''
+    if is_framestore(path):
+        return scan_framestore(path, stats)
+    ret = list()
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as raw:
+        for zinfo in zf.infolist():
+            name, kind, tag, trig = member_key(zinfo.filename)
+            offset = data_offset(raw, zinfo)
+            array_offset = None
+            if zinfo.compress_type == zipfile.ZIP_STORED:
+                raw.seek(offset)
+                shape, fortran, dtype = read_header(raw)
+                array_offset = raw.tell()
+            else:
+                with zf.open(zinfo) as fp:
+                    shape, fortran, dtype = read_header(fp)
+            row = dict(name=name, kind=kind, tag=tag, trigger=trig,
+                       dtype=dtype.str, shape=json.dumps(list(shape)),
+                       fortran=int(fortran), compress=zinfo.compress_type,
+                       offset=offset, array_offset=array_offset,
+                       nbytes=zinfo.file_size,
+                       min=None, max=None, mean=None, std=None)
+            if stats and kind == "frame" and len(shape):
+                with zf.open(zinfo) as fp:
+                    arr = numpy.lib.format.read_array(fp)
+                extra = list()
+                for ckey in companion_keys(name):
+                    one = None
+                    if ckey + ".npy" in zf.NameToInfo:
+                        with zf.open(ckey + ".npy") as fp:
+                            one = numpy.lib.format.read_array(fp)
+                    extra.append(one)
+                row.update(frame_stats(expand_frame(arr, *extra)))
+            ret.append(row)
+    return ret
+
+
+class Catalog:
+    '''
+    A catalog of NPZ or frame store files kept in an SQLite database
+    file.
+
+    The database file is created if missing and create is true,
+    otherwise a missing one raises FileNotFoundError.
+    '''
+    def __init__(self, dbfile="pcbro-catalog.db", create=True):
+        self.dbfile = dbfile
+        if create:
+            self.db = sqlite3.connect(dbfile)
+        else:
+            uri = "file:" + urllib.parse.quote(os.path.abspath(dbfile)) + "?mode=rw"
+            try:
+                self.db = sqlite3.connect(uri, uri=True)
+            except sqlite3.OperationalError:
+                raise FileNotFoundError(f'no catalog database: {dbfile}') from None
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def update(self, paths, pattern="*.npz", stats=True, prune=False):
+        '''Add new or changed files to the catalog.
+
+        Paths may be files or directories which are searched for files
+        matching pattern.  Files already cataloged with unchanged size
+        and modification time are skipped.  If prune is true, files in
+        the catalog which no longer exist are removed.  Return list of
+        the paths that were (re)scanned.
+        '''
+        files = list()
+        for path in paths:
+            if os.path.isdir(path):
+                files += sorted(glob.glob(os.path.join(path, pattern)))
+            else:
+                files.append(path)
+
+        done = list()
+        for path in files:
+            path = os.path.abspath(path)
+            st = os.stat(path)
+            old = self.db.execute("SELECT id, size, mtime FROM files WHERE path=?",
+                                  (path,)).fetchone()
+            if old and old[1] == st.st_size and old[2] == st.st_mtime:
+                continue
+            rows = scan_file(path, stats)
+            with self.db:
+                if old:
+                    self.db.execute("DELETE FROM files WHERE id=?", (old[0],))
+                info = file_info(path)
+                cur = self.db.execute(
+                    "INSERT INTO files (path, size, mtime, tier, stamp, seconds, cern_time) "
+                    "VALUES (?,?,?,?,?,?,?)",
+                    (path, st.st_size, st.st_mtime, info['tier'], info['stamp'],
+                     info['seconds'], info['cern_time']))
+                fid = cur.lastrowid
+                for row in rows:
+                    cols = list(row)
+                    self.db.execute(
+                        f"INSERT INTO members (file_id, {', '.join(cols)}) "
+                        f"VALUES (?, {', '.join('?'*len(cols))})",
+                        [fid] + [row[c] for c in cols])
+            done.append(path)
+
+        if prune:
+            gone = [(fid,) for fid, path in self.db.execute("SELECT id, path FROM files")
+                    if not os.path.exists(path)]
+            with self.db:
+                self.db.executemany("DELETE FROM files WHERE id=?", gone)
+        return done
+
+    def select(self, tier=None, tag=None, kind="frame", paths=None,
+               stamps=None, triggers=None, where=None, params=()):
+        '''Return list of Record matching the given constraints.
+
+        Each of tier, tag and kind is a value to match if not None.
+        Each of paths, stamps and triggers is a sequence of values to
+        match.  The where is an additional SQL expression on the
+        member (m) and file (f) columns, eg "m.max > 1e5", with
+        params giving values for any "?" it holds.  Records are ordered
+        by file path and member archive order.
+        '''
+        conds = list()
+        args = list()
+        for col, val in (("f.tier", tier), ("m.tag", tag), ("m.kind", kind)):
+            if val is not None:
+                conds.append(f"{col} = ?")
+                args.append(val)
+        for col, vals in (("f.path", paths), ("f.stamp", stamps), ("m.trigger", triggers)):
+            if vals is None:
+                continue
+            vals = list(vals)
+            if col == "f.path":
+                vals = [os.path.abspath(v) for v in vals]
+            conds.append(f"{col} IN ({', '.join('?'*len(vals))})")
+            args += vals
+        if where:
+            conds.append(f"({where})")
+            args += list(params)
+        sql = f"SELECT {record_columns} FROM members m JOIN files f ON m.file_id = f.id"
+        if conds:
+            sql += " WHERE " + " AND ".join(conds)
+        sql += " ORDER BY f.path, m.offset"
+        return [Record(*row) for row in self.db.execute(sql, args)]
+
+    def files(self):
+        'Return list of (path, tier, stamp, cern_time, nmembers)'
+        return list(self.db.execute(
+            "SELECT f.path, f.tier, f.stamp, f.cern_time, COUNT(m.name) "
+            "FROM files f LEFT JOIN members m ON m.file_id = f.id "
+            "GROUP BY f.id ORDER BY f.path"))
+
+
+def load(record, mmap=False):
+    '''Return the array for a catalog Record.
+
+    Uncompressed members are read directly at their recorded offset,
+    and if mmap is true are memory mapped, without touching the rest
+    of the file.  Other arrays of a frame store are read from their
+    chunks.
+    '''
+    shape = tuple(json.loads(record.shape))
+    if record.array_offset is not None:
+        order = 'F' if record.fortran else 'C'
+        if mmap:
+            return numpy.memmap(record.path, dtype=record.dtype, mode='r',
+                                offset=record.array_offset, shape=shape,
+                                order=order)
+        count = int(numpy.prod(shape))
+        with open(record.path, 'rb') as fp:
+            fp.seek(record.array_offset)
+            arr = numpy.fromfile(fp, dtype=record.dtype, count=count)
+        return arr.reshape(shape, order=order)
+    if is_framestore(record.path):
+        with FrameStore(record.path) as fs:
+            return fs.read(record.name)
+    with zipfile.ZipFile(record.path) as zf:
+        with zf.open(record.name + ".npy") as fp:
+            return numpy.lib.format.read_array(fp)
+
+
+class CatalogArrays:
+    '''
+    A read-only dict-like view of the cataloged arrays of one file.
+
+    Arrays are keyed by member name like an NpzFile and are loaded
+    on access.
+    '''
+    def __init__(self, records):
+        self.records = dict((r.name, r) for r in records)
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def keys(self):
+        return self.records.keys()
+
+    def __getitem__(self, key):
+        arr = load(self.records[key])
+        if not key.startswith("frame_"):
+            return arr
+        return expand_frame(arr, *[load(self.records[k]) if k in self.records else None
+                                   for k in companion_keys(key)])
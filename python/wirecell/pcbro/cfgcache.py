@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+'''
+A cache of wire-cell configuration compiled from jsonnet.
+
+Workflow jobs run the same configuration templates with top level
+arguments (TLAs) which differ mostly in file names.  Here a template
+is evaluated once per distinct set of its other TLAs, with file names
+replaced by placeholders, and the resulting JSON is cached.  A job's
+configuration is then made by substituting its file names back into
+the cached JSON, which wire-cell reads without running jsonnet.
+
+The cache key covers the template, the TLAs other than file names,
+the number of file names in each list of them and the content of
+every .jsonnet file directly in the template's directory and in the
+search path, so editing any of them compiles afresh.
+
+Placeholders are opaque strings so a template must not test a file
+name other than for being empty.  Empty file names are not replaced.
+'''
+import os
+import json
+import glob
+import hashlib
+import subprocess
+
+
+def search_path(paths=()):
+    '''Return paths followed by those of WIRECELL_PATH.
+    '''
+    wcpath = os.environ.get("WIRECELL_PATH", "")
+    return list(paths) + [p for p in wcpath.split(":") if p]
+
+
+def find_template(template, paths=()):
+    '''Return the path of a template, as given or found in paths.
+    '''
+    if os.path.exists(template):
+        return template
+    for path in paths:
+        maybe = os.path.join(path, template)
+        if os.path.exists(maybe):
+            return maybe
+    raise FileNotFoundError(f'no configuration template {template} in {paths}')
+
+
+def placeholder(name, index=None):
+    '''Return the placeholder of file name TLA name, or of an element
+    of a list of them.
+    '''
+    if index is None:
+        return f'@pcbro-file:{name}@'
+    return f'@pcbro-file:{name}:{index}@'
+
+
+def digest(template, paths=()):
+    '''Return a digest of the .jsonnet files which template may use.
+    '''
+    dirs = [os.path.dirname(os.path.abspath(template))]
+    dirs += [os.path.abspath(p) for p in paths if os.path.isdir(p)]
+    hasher = hashlib.sha256()
+    for one in sorted(set(dirs)):
+        for fname in sorted(glob.glob(os.path.join(one, "*.jsonnet"))):
+            hasher.update(fname.encode())
+            with open(fname, "rb") as fp:
+                hasher.update(fp.read())
+    return hasher.hexdigest()
+
+
+def split_files(files):
+    '''Split file name TLAs into (placeheld, literal).
+
+    The placeheld map names to their placeholder or list of them and
+    the literal to the empty file names which are left as they are.
+    '''
+    placeheld = dict()
+    literal = dict()
+    for name, val in files.items():
+        if isinstance(val, (list, tuple)):
+            placeheld[name] = [placeholder(name, ind) for ind in range(len(val))]
+        elif val:
+            placeheld[name] = placeholder(name)
+        else:
+            literal[name] = val
+    return placeheld, literal
+
+
+def cache_key(template, files, tla_str, tla_code, paths=()):
+    '''Return the key of a compiled template.
+    '''
+    placeheld, literal = split_files(files)
+    params = dict(template=os.path.basename(template),
+                  files=placeheld, literal=literal,
+                  tla_str=tla_str, tla_code=tla_code,
+                  digest=digest(template, paths))
+    text = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def evaluate(template, files, tla_str, tla_code, paths=(), jsonnet="jsonnet"):
+    '''Evaluate template with placeholders for its file names and
+    return the configuration object.
+    '''
+    placeheld, literal = split_files(files)
+    cmd = [jsonnet]
+    for path in paths:
+        cmd += ["-J", path]
+    for name, val in list(tla_str.items()) + list(literal.items()):
+        cmd += ["--tla-str", f'{name}={val}']
+    for name, val in placeheld.items():
+        if isinstance(val, list):
+            cmd += ["--tla-code", f'{name}={json.dumps(val)}']
+        else:
+            cmd += ["--tla-str", f'{name}={val}']
+    for name, val in tla_code.items():
+        cmd += ["--tla-code", f'{name}={val}']
+    cmd.append(template)
+    proc = subprocess.run(cmd, check=True, stdout=subprocess.PIPE)
+    return json.loads(proc.stdout)
+
+
+def substitute(cfg, files):
+    '''Return cfg with placeholders replaced by the file names.
+    '''
+    subs = dict()
+    for name, val in files.items():
+        if isinstance(val, (list, tuple)):
+            for ind, one in enumerate(val):
+                subs[placeholder(name, ind)] = one
+        elif val:
+            subs[placeholder(name)] = val
+
+    def sub(obj):
+        if isinstance(obj, str):
+            for ph, val in subs.items():
+                if ph in obj:
+                    obj = obj.replace(ph, val)
+            return obj
+        if isinstance(obj, list):
+            return [sub(one) for one in obj]
+        if isinstance(obj, dict):
+            return {sub(key): sub(val) for key, val in obj.items()}
+        return obj
+
+    return sub(cfg)
+
+
+def compile_config(template, files, tla_str=None, tla_code=None, paths=(),
+                   cachedir=".", jsonnet="jsonnet"):
+    '''Return the configuration of template for the given TLAs.
+
+    The files map TLA names to a file name or a list of them, tla_str
+    and tla_code give the other TLAs as strings or as jsonnet code.
+    The compiled template is read from cachedir or evaluated and
+    saved there.
+    '''
+    tla_str = tla_str or dict()
+    tla_code = tla_code or dict()
+    paths = search_path(paths)
+    template = find_template(template, paths)
+
+    key = cache_key(template, files, tla_str, tla_code, paths)
+    stem = os.path.splitext(os.path.basename(template))[0]
+    cached = os.path.join(cachedir, f'{stem}-{key}.json')
+    try:
+        with open(cached) as fp:
+            cfg = json.load(fp)
+    except FileNotFoundError:
+        cfg = evaluate(template, files, tla_str, tla_code, paths, jsonnet)
+        os.makedirs(cachedir, exist_ok=True)
+        # Concurrent jobs may compile the same key, each renames its
+        # own complete file into place.
+        tmp = f'{cached}.{os.getpid()}'
+        with open(tmp, "w") as fp:
+            json.dump(cfg, fp)
+        os.replace(tmp, cached)
+    return substitute(cfg, files)
@@ -4,10 +4,10 @@ Provide simple event display for 50L.
 '''
 import os
 import time
+import zlib
+import struct
+import functools
 import numpy
-import matplotlib.pyplot as plt 
-import matplotlib as mpl
-Normer = mpl.colors.TwoSlopeNorm
 
 class Dataset50L:
     '''
@@ -64,7 +64,21 @@ def secs_from_centiseconds(cs):
     assert(isinstance(cs, int))
     return cs // 100
 
+@functools.lru_cache(maxsize=None)
+def _cern_tz():
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo("CET")
+    except Exception:           # no zoneinfo module or no tz database
+        return None
+
 def cern_time_from_secs(secs):
+    'Return CERN local time string for a Unix time in seconds'
+    tz = _cern_tz()
+    if tz is not None:
+        from datetime import datetime
+        return datetime.fromtimestamp(secs, tz).ctime()
+
     oldtz = os.environ.get("TZ", None)
     os.environ["TZ"] = "CET"
     time.tzset()
@@ -83,8 +97,9 @@ def ts_from_bin(binname):
     return cern_time_from_secs(secs)
 
 def ds_from_50l_npz(npzname, tier=None, name='', run=''):
-    'Return Dataset from a 50-L NPZ file assuming conventions'
-    arrs = numpy.load(npzname)
+    'Return Dataset from a 50-L NPZ or frame store file assuming conventions'
+    from .framestore import load
+    arrs = load(npzname)
 
     # these are pretty dicey:
     if tier is None and "sig-" in npzname:
@@ -94,6 +109,170 @@ def ds_from_50l_npz(npzname, tier=None, name='', run=''):
 
     return Dataset50L(arrs, tier=tier, name=name, run=run)
 
+@functools.lru_cache(maxsize=None)
+def colormap_lut(name, n=256):
+    '''Return (n,3) uint8 RGB lookup table for a named colormap.
+
+    The table is taken once from matplotlib's colormap registry.  No
+    figure machinery is touched.
+    '''
+    import matplotlib
+    try:
+        cmap = matplotlib.colormaps[name]
+    except AttributeError:      # matplotlib < 3.5
+        import matplotlib.cm
+        cmap = matplotlib.cm.get_cmap(name)
+    rgba = cmap(numpy.linspace(0.0, 1.0, n))
+    return (rgba[:,:3]*255 + 0.5).astype(numpy.uint8)
+
+def fast_norm(arr, vmin, vcenter, vmax):
+    '''Map values to [0,1] like matplotlib's TwoSlopeNorm.
+
+    Values below vmin or above vmax are clipped.
+    '''
+    return numpy.interp(arr, [vmin, vcenter, vmax], [0.0, 0.5, 1.0])
+
+def colorize(arr, color_range, cmap, bad=(255,255,255)):
+    '''Return (rows,cols,3) uint8 RGB image of 2D array.
+
+    The color_range is (min,center,max) and cmap is a colormap name
+    or a lookup table as from colormap_lut().  Masked elements, if
+    any, are given the bad color.
+    '''
+    lut = colormap_lut(cmap) if isinstance(cmap, str) else cmap
+    n = len(lut)
+    data = numpy.ma.getdata(arr)
+    ind = (fast_norm(data, *color_range) * n).astype(numpy.intp)
+    numpy.minimum(ind, n-1, out=ind)
+    mask = numpy.ma.getmask(arr)
+    if mask is not numpy.ma.nomask:
+        lut = numpy.vstack((lut, numpy.array(bad, dtype=numpy.uint8)))
+        ind[mask] = n
+    return lut.take(ind, axis=0)
+
+def fast_image(arrs, color_range, cmap, ticks=None, channels=None,
+               scale=(1,1), gap=4, annotate=True, colorbar=True,
+               tick_marks=(50, 10)):
+    '''Return RGB image array made from per-plane 2D arrays.
+
+    Each array in arrs is (ticks, channels) as from Main.plane_array().
+    Planes are placed left to right with ticks increasing upward, as
+    drawn by Main.draw().  The scale gives integer (channel, tick)
+    pixel multipliers.
+
+    If annotate is true, a frame is drawn around each plane with
+    tick marks every tick_marks[0] ticks and tick_marks[1] channels
+    counted from the ticks (t0,t1) and per-plane channels (c0,c1)
+    ranges, if given.  If colorbar is true a color scale strip is
+    placed on the right.
+    '''
+    white = numpy.array([255,255,255], dtype=numpy.uint8)
+    black = numpy.array([0,0,0], dtype=numpy.uint8)
+    sx, sy = scale
+    lut = colormap_lut(cmap) if isinstance(cmap, str) else cmap
+
+    imgs = list()
+    for arr in arrs:
+        img = colorize(arr, color_range, lut)[::-1]
+        if sx > 1 or sy > 1:
+            img = numpy.repeat(numpy.repeat(img, sy, axis=0), sx, axis=1)
+        imgs.append(img)
+    height = max(img.shape[0] for img in imgs)
+
+    margin = 6 if annotate else 0
+    nplanes = len(imgs)
+    width = sum(img.shape[1] + 2*margin for img in imgs) + gap*(nplanes-1)
+    cbwidth = 12
+    if colorbar:
+        width += gap + cbwidth + 2*margin
+    out = numpy.empty((height + 2*margin, width, 3), dtype=numpy.uint8)
+    out[:] = white
+
+    top = margin
+    x0 = 0
+    for pind, img in enumerate(imgs):
+        rows, cols = img.shape[:2]
+        left = x0 + margin
+        out[top:top+rows, left:left+cols] = img
+        if annotate:
+            bot = top + rows
+            out[top-1, left-1:left+cols+1] = black
+            out[bot, left-1:left+cols+1] = black
+            out[top-1:bot+1, left-1] = black
+            out[top-1:bot+1, left+cols] = black
+            if ticks is not None:
+                t0, t1 = ticks
+                step = tick_marks[0]
+                for t in range(step*((t0+step-1)//step), t1+1, step):
+                    y = bot - (t-t0)*sy
+                    if top <= y <= bot:
+                        out[y, left-margin:left-1] = black
+            if channels is not None:
+                c0, c1 = channels[pind]
+                step = tick_marks[1]
+                for c in range(step*((c0+step-1)//step), c1+1, step):
+                    x = left + (c-c0)*sx
+                    if left <= x <= left+cols:
+                        out[bot+1:bot+margin, x] = black
+        x0 += cols + 2*margin + gap
+
+    if colorbar:
+        left = x0 + margin
+        ind = numpy.linspace(len(lut)-1, 0, height).astype(numpy.intp)
+        out[top:top+height, left:left+cbwidth] = lut[ind][:,None,:]
+        if annotate:
+            out[top-1, left-1:left+cbwidth+1] = black
+            out[top+height, left-1:left+cbwidth+1] = black
+            out[top-1:top+height+1, left-1] = black
+            out[top-1:top+height+1, left+cbwidth] = black
+            # mark the center value of the two-slope scale
+            vmin, vcen, vmax = color_range
+            y = top + int(round((height-1)*(1.0 - fast_norm(vcen, vmin, vcen, vmax))))
+            out[y, left+cbwidth+1:left+cbwidth+margin] = black
+    return out
+
+def _png_chunk(tag, data):
+    return (struct.pack('>I', len(data)) + tag + data
+            + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+def write_png(fname, rgb, text=None, level=1):
+    '''Write (rows,cols,3) uint8 RGB array to a PNG file.
+
+    The optional text dict is saved as PNG tEXt chunks.  The level is
+    the zlib compression level, low is fast.
+    '''
+    rgb = numpy.ascontiguousarray(rgb, dtype=numpy.uint8)
+    rows, cols = rgb.shape[:2]
+    raw = numpy.zeros((rows, 1 + 3*cols), dtype=numpy.uint8)
+    raw[:,1:] = rgb.reshape(rows, 3*cols)
+
+    chunks = [_png_chunk(b'IHDR', struct.pack('>IIBBBBB', cols, rows, 8, 2, 0, 0, 0))]
+    for key, val in (text or dict()).items():
+        data = key.encode('latin-1') + b'\0' + str(val).encode('latin-1', 'replace')
+        chunks.append(_png_chunk(b'tEXt', data))
+    chunks.append(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), level)))
+    chunks.append(_png_chunk(b'IEND', b''))
+    with open(fname, 'wb') as fp:
+        fp.write(b'\x89PNG\r\n\x1a\n')
+        for chunk in chunks:
+            fp.write(chunk)
+
+def ds_from_catalog(cat, npzname, tier=None, name='', run=None):
+    '''Return Dataset for one file of a catalog.Catalog.
+
+    Arrays are loaded directly from their location in the file as they
+    are accessed.  The run defaults to the CERN time of the file.
+    '''
+    from .catalog import CatalogArrays
+    recs = cat.select(paths=[npzname], kind=None)
+    if not recs:
+        raise KeyError(f'file not in catalog: {npzname}')
+    if tier is None:
+        tier = recs[0].tier
+    if run is None:
+        run = recs[0].cern_time or ''
+    return Dataset50L(CatalogArrays(recs), tier=tier, name=name, run=run)
+
 class Main:
     '''
     Main display class
@@ -129,13 +308,23 @@ class Main:
         self._opts.update(opts)
         self._fa = None
         self._cb = None
-        self._fig = fig or plt.figure(tight_layout=True)
-        self._fig.set_tight_layout(True)
+        self._fig = fig
         self._axes = None
 
     def __getattr__(self, key):
+        if key.startswith('_'):
+            raise AttributeError(key)
         return self._opts[key]
 
+    @property
+    def fig(self):
+        'The matplotlib figure, made on first use'
+        if self._fig is None:
+            import matplotlib.pyplot as plt
+            self._fig = plt.figure(tight_layout=True)
+        self._fig.set_tight_layout(True)
+        return self._fig
+
     def reload(self, dataset):
         '''
         Swap in a new dataset
@@ -177,8 +366,8 @@ class Main:
         cc = self._opts['channels']
         if not cc:
             return self.ds.channels
-        if isinstance(c, str):
-            cc = [list(map(int, ss.strip().split(":"))) for ss in c.split(",")]
+        if isinstance(cc, str):
+            cc = [list(map(int, ss.strip().split(":"))) for ss in cc.split(",")]
         return cc
 
     @property
@@ -194,11 +383,16 @@ class Main:
 
     @property
     def color_range(self):
+        return self.color_range_for(self.frame)
+
+    def color_range_for(self, frame):
+        'Return (min,center,max) color range applied to given frame'
         cr = self._opts['color_range']
         if isinstance(cr, str):
             cr = list(map(float, cr.split(',')))
         if cr is None:
-            cr = [numpy.min(self.frame), numpy.max(self.frame)]
+            cr = [numpy.min(frame), numpy.max(frame)]
+        cr = list(cr)
         if len(cr) == 2:
             cr.insert(1, 0.5*numpy.sum(cr))
         if cr[0] >= cr[1]:
@@ -252,48 +446,64 @@ class Main:
         self.draw()
 
 
+    def plane_array(self, frame, pind):
+        '''Return 2D array (ticks, channels) of plane pind for display.
+
+        The frame is windowed by ticks and tshift with out of frame
+        samples zero-filled.  If mask_min is set, the result is a
+        masked array.
+        '''
+        tt = self.ticks
+        cc = self.channels[pind]
+
+        src_t0 = tt[0]-self.tshift
+        src_dt = tt[1]-tt[0]
+        tgt_t0 = 0
+        tgt_dt = src_dt
+
+        bshrink = -src_t0
+        if bshrink > 0:
+            tgt_t0 += bshrink
+            tgt_dt -= bshrink
+            src_dt -= bshrink
+            src_t0 = 0
+        tshrink = src_t0 + src_dt - frame.shape[0]
+        if tshrink > 0:
+            src_dt -= tshrink
+            tgt_dt -= tshrink
+
+        #print(f'{src_t0}+{src_dt} {tgt_t0}+{tgt_dt}')
+        sa = numpy.zeros((tt[1]-tt[0], cc[1]-cc[0]))
+        sa[tgt_t0:tgt_t0+tgt_dt,:] += numpy.array(frame[src_t0:src_t0+src_dt, cc[0]:cc[1]])
+
+        if self.mask_min is not None:
+            sa = numpy.ma.masked_where(sa <= self.mask_min, sa)
+        return sa
+
     def draw(self):
         '''
         Craw current event
         '''
+        from matplotlib.colors import TwoSlopeNorm
+
         tt = self.ticks
         channels = self.channels
         nplanes = len(self.planes)
-        cr = self.color_range
-        norm = Normer(vmin=cr[0], vcenter=cr[1], vmax=cr[2])
 
         frame = self.frame
+        cr = self.color_range_for(frame)
+        norm = TwoSlopeNorm(vmin=cr[0], vcenter=cr[1], vmax=cr[2])
+
+        fig = self.fig
         if self._axes is None:
-            self._axes = self._fig.subplots(1, nplanes, sharey=True)
+            self._axes = fig.subplots(1, nplanes, sharey=True)
 
         for axind, pind in enumerate(self.planes):
             ax = self._axes[axind]
             ax.clear()
 
             cc = channels[pind]
-            
-            src_t0 = tt[0]-self.tshift
-            src_dt = tt[1]-tt[0]
-            tgt_t0 = 0
-            tgt_dt = src_dt
-
-            bshrink = -src_t0
-            if bshrink > 0:
-                tgt_t0 += bshrink
-                tgt_dt -= bshrink
-                src_dt -= bshrink
-                src_t0 = 0
-            tshrink = src_t0 + src_dt - frame.shape[0]
-            if tshrink > 0:
-                src_dt -= tshrink
-                tgt_dt -= tshrink
-
-            #print(f'{src_t0}+{src_dt} {tgt_t0}+{tgt_dt}')
-            sa = numpy.zeros((tt[1]-tt[0], cc[1]-cc[0]))
-            sa[tgt_t0:tgt_t0+tgt_dt,:] += numpy.array(frame[src_t0:src_t0+src_dt, cc[0]:cc[1]])
-
-            if self.mask_min is not None:
-                sa = numpy.ma.masked_where(sa <= self.mask_min, sa)
+            sa = self.plane_array(frame, pind)
             totp = numpy.sum(sa[sa>0])
             totm = numpy.sum(sa[sa<0])
             print(self.sformat('{name} totals: {totm} {totp}', totm=totm, totp=totp))
@@ -308,19 +518,52 @@ class Main:
         self._axes[0].set_ylabel('sample period [count]')
 
         if self._cb is None:
-            self._cb = self._fig.colorbar(im)
+            self._cb = fig.colorbar(im)
             self._cb.set_label(self.color_unit)
         self._cb.update_normal(im)
 
-        self._fig.subplots_adjust(top=0.90)
-        self._fig.suptitle(self.title, fontsize=14)
-        self._fig.tight_layout()
+        fig.subplots_adjust(top=0.90)
+        fig.suptitle(self.title, fontsize=14)
+        fig.tight_layout()
         #plt.show()
 
+    def render(self, frame=None, **kwds):
+        '''Return current display as RGB image array without matplotlib.
+
+        The frame is taken from the dataset if not given.  Keywords
+        are passed to fast_image().
+        '''
+        if frame is None:
+            frame = self.frame
+        cr = self.color_range_for(frame)
+        arrs = [self.plane_array(frame, pind) for pind in self.planes]
+        cmap = self.color_map or 'viridis'
+        kwds.setdefault('ticks', self.ticks)
+        kwds.setdefault('channels', [self.channels[pind] for pind in self.planes])
+        return fast_image(arrs, cr, cmap, **kwds)
 
     def save(self, fname):
         'Save current display to a file'
-        plt.savefig(fname, bbox_inches='tight')
+        self.fig.savefig(fname, bbox_inches='tight')
+
+    def save_fast(self, fname, frame=None, **kwds):
+        '''Save current display to a PNG file without matplotlib.
+
+        Keywords are passed to fast_image().
+        '''
+        if frame is None:
+            frame = self.frame
+        rgb = self.render(frame, **kwds)
+        cr = self.color_range_for(frame)
+        text = dict(Title=self.title,
+                    Comment=self.sformat(
+                        '{tier} tag:{tag} trigger:{trignum} '
+                        'ticks:{ticks} channels:{channels} planes:{planes} '
+                        'color:{cr} [{unit}]',
+                        ticks=self.ticks, channels=self.channels,
+                        planes=list(self.planes), cr=cr,
+                        unit=self.color_unit))
+        write_png(fname, rgb, text)
 
 class MainN:
     def __init__(self, mains, **kwds):
@@ -354,6 +597,7 @@ def plot_figures(figures, nrows = 1, ncols=1):
     nrows : number of rows of subplots wanted in the figure
     """
 
+    import matplotlib.pyplot as plt
     fig, axeslist = plt.subplots(ncols=ncols, nrows=nrows)
     for ind,title in enumerate(figures):
         axeslist.ravel()[ind].imshow(figures[title], cmap=plt.gray())
@@ -8,11 +8,6 @@ import os.path as osp
 import numpy
 from wirecell import units
 
-from matplotlib.backends.backend_pdf import PdfPages
-import pylab
-import matplotlib.pyplot as plt
-import matplotlib as mpl
-
 
 def lg10(arr, eps = 1e-5):
     shape = arr.shape
@@ -409,6 +404,8 @@ def draw_fp_speed(arrs, outfile, start=0.0, **kwds):
     '''
     Draw drift speed as impact vs step
     '''
+    from matplotlib.backends.backend_pdf import PdfPages
+    import matplotlib.pyplot as plt
     sunits = units.mm/units.us
     fp_tick = 5*units.ns
     start_tick = int(start / fp_tick)
@@ -452,6 +449,8 @@ def draw_fp_waves(arrs, pdfname, start=0, **kwds):
     '''
     Draw representative waveforms
     '''
+    from matplotlib.backends.backend_pdf import PdfPages
+    import matplotlib.pyplot as plt
     fp_tick = 5*units.ns
     start_tick = round(start/fp_tick)
 
@@ -482,6 +481,8 @@ def draw_fp_sum(arrs, pdfname, **kwds):
     '''
     Integrate over time
     '''
+    from matplotlib.backends.backend_pdf import PdfPages
+    import matplotlib.pyplot as plt
     what = osp.splitext(osp.basename(pdfname))[0]
     with PdfPages(pdfname) as pdf:
         plane_strips = list()
@@ -540,6 +541,9 @@ def draw_fp_diag(arrs, pdfname, start=0*units.us, skip=10, **kwds):
     Plots include unprocessed views of these arrays as well as result
     of processing to form input to conversion to WCT form.
     '''
+    from matplotlib.backends.backend_pdf import PdfPages
+    import matplotlib.pyplot as plt
+    import matplotlib as mpl
     xyz="XYZ"
 
     fp_tick = 5*units.ns
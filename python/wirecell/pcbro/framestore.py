@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+'''
+A chunked, random-access store of 50-L frames.
+
+A frame store file (.pfs) holds arrays keyed like NPZ members, eg
+frame_<tag>_<trigger>.  Unlike NPZ, each 2D (tick, channel) frame is
+split into chunks, one per plane (channel range) and block of ticks,
+each separately compressed.  A slice by trigger, plane and tick range
+reads and decodes only the chunks it overlaps.  Uncompressed chunks
+may be memory mapped.  Other arrays (channels, tickinfo) are stored
+as a single chunk.
+
+The file layout is:
+
+    magic, chunk, chunk, ..., index, footer
+
+The index is JSON describing each array and the location, size and
+codec of its chunks.  The footer gives the index offset and a second
+magic.  Appending new arrays overwrites the old index and writes a new
+one after the new chunks.
+'''
+import os
+import bz2
+import json
+import lzma
+import zlib
+import struct
+import numpy
+
+magic = b'PCBROFS1'
+footer = struct.Struct('<Q8s')
+footer_magic = b'PCBROIDX'
+
+default_planes = ((0,64), (64,128), (128,192))
+default_tblock = 128
+
+codecs = {
+    'none': (lambda b, level: b, lambda b: b),
+    'zlib': (lambda b, level: zlib.compress(b, level), zlib.decompress),
+    'bz2': (lambda b, level: bz2.compress(b, max(1, level)), bz2.decompress),
+    'lzma': (lambda b, level: lzma.compress(b, preset=level), lzma.decompress),
+}
+
+
+def is_framestore(path):
+    'Return true if path is a frame store file'
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as fp:
+        return fp.read(len(magic)) == magic
+
+
+def plane_ranges(nchans, planes=default_planes):
+    '''Return list of (first,last) channel ranges covering nchans.
+
+    The given planes are clipped to nchans and any channels past the
+    last are put in one more range.
+    '''
+    ret = [(c0, min(c1, nchans)) for c0, c1 in planes if c0 < nchans]
+    last = ret[-1][1] if ret else 0
+    if last < nchans:
+        ret.append((last, nchans))
+    return ret
+
+
+class FrameStore:
+    '''
+    Read and write a frame store file.
+
+    The mode is 'r' to read, 'w' to create or truncate and 'a' to
+    append to an existing file or create it.  Written frames use the
+    codec (one of "none", "zlib", "bz2", "lzma") and compression
+    level, are chunked by planes (channel ranges) and tblock ticks.
+
+    The object may be used like a read-only dict of arrays such as
+    returned by numpy.load() on an NPZ file.
+    '''
+    def __init__(self, path, mode='r', codec='zlib', level=1,
+                 planes=default_planes, tblock=default_tblock):
+        if codec not in codecs:
+            raise ValueError(f'unknown codec: {codec}')
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError(f'unknown mode: {mode}')
+        self.path = path
+        self.mode = mode
+        self.codec = codec
+        self.level = level
+        self.planes = planes
+        self.tblock = tblock
+        self.index = dict()
+        self._dirty = False
+        # In append mode, the offset of the old index which the first
+        # new chunk overwrites.
+        self._ioff = None
+
+        if mode == 'w' or (mode == 'a' and not os.path.exists(path)):
+            self.fp = open(path, 'w+b')
+            self.fp.write(magic)
+            self._dirty = True
+            return
+
+        self.fp = open(path, 'rb' if mode == 'r' else 'r+b')
+        if self.fp.read(len(magic)) != magic:
+            raise ValueError(f'not a frame store: {path}')
+        self.fp.seek(-footer.size, os.SEEK_END)
+        ioff, fmagic = footer.unpack(self.fp.read(footer.size))
+        if fmagic != footer_magic:
+            raise ValueError(f'frame store missing index: {path}')
+        self.fp.seek(ioff)
+        nbytes = os.fstat(self.fp.fileno()).st_size - footer.size - ioff
+        self.index = json.loads(self.fp.read(nbytes).decode())['arrays']
+        if mode == 'a':
+            self._ioff = ioff
+
+    def close(self):
+        if self.fp is None:
+            return
+        if self.mode != 'r' and self._dirty:
+            self.fp.seek(0, os.SEEK_END)
+            ioff = self.fp.tell()
+            self.fp.write(json.dumps(dict(version=1, arrays=self.index)).encode())
+            self.fp.write(footer.pack(ioff, footer_magic))
+        self.fp.close()
+        self.fp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    # dict-like read access
+    def keys(self):
+        return self.index.keys()
+
+    @property
+    def files(self):
+        return list(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        return self.read(key)
+
+    def items(self):
+        for key in self.index:
+            yield key, self.read(key)
+
+    def _chunk(self, chunk, dtype, shape, mmap=False):
+        offset, nbytes, codec = chunk['offset'], chunk['nbytes'], chunk['codec']
+        if codec == 'none' and mmap:
+            return numpy.memmap(self.path, dtype=dtype, mode='r',
+                                offset=offset, shape=shape)
+        self.fp.seek(offset)
+        data = codecs[codec][1](self.fp.read(nbytes))
+        return numpy.frombuffer(data, dtype=dtype).reshape(shape)
+
+    def read(self, key, plane=None, ticks=None, mmap=False):
+        '''Return array of key, or a slice of a frame.
+
+        If plane is given, only that plane's channels are returned.
+        If ticks is given as (first,last), only those ticks.  Only the
+        chunks overlapping the slice are read.  If mmap is true,
+        uncompressed chunks are memory mapped where possible.
+        '''
+        ent = self.index[key]
+        dtype = numpy.dtype(ent['dtype'])
+        shape = tuple(ent['shape'])
+        if 'planes' not in ent:
+            return self._chunk(ent['chunks'][0], dtype, shape, mmap)
+
+        planes = ent['planes']
+        pinds = range(len(planes)) if plane is None else [plane]
+        t0, t1 = (0, shape[0]) if ticks is None else ticks
+        t0 = max(0, t0)
+        t1 = min(shape[0], t1)
+        c0 = planes[pinds[0]][0]
+        c1 = planes[pinds[-1]][1]
+        out = numpy.zeros((max(0, t1-t0), c1-c0), dtype=dtype)
+        for chunk in ent['chunks']:
+            if chunk['plane'] not in pinds:
+                continue
+            ct0, ct1 = chunk['ticks']
+            if ct1 <= t0 or ct0 >= t1:
+                continue
+            pc0, pc1 = planes[chunk['plane']]
+            arr = self._chunk(chunk, dtype, (ct1-ct0, pc1-pc0),
+                              mmap and plane is not None)
+            lo, hi = max(ct0, t0), min(ct1, t1)
+            out[lo-t0:hi-t0, pc0-c0:pc1-c0] = arr[lo-ct0:hi-ct0]
+        return out
+
+    def _write_chunk(self, arr, **extra):
+        data = codecs[self.codec][0](numpy.ascontiguousarray(arr).tobytes(), self.level)
+        if self._ioff is not None:
+            # the old index is replaced on close
+            self.fp.seek(self._ioff)
+            self.fp.truncate()
+            self._ioff = None
+            self._dirty = True
+        self.fp.seek(0, os.SEEK_END)
+        offset = self.fp.tell()
+        self.fp.write(data)
+        return dict(extra, offset=offset, nbytes=len(data), codec=self.codec)
+
+    def write(self, key, arr):
+        '''Add array arr as key.
+
+        A 2D array with a "frame_" key is chunked by plane and ticks.
+        '''
+        if self.mode == 'r':
+            raise IOError(f'frame store opened read-only: {self.path}')
+        if key in self.index:
+            raise KeyError(f'frame store already has: {key}')
+        arr = numpy.asarray(arr)
+        ent = dict(dtype=arr.dtype.str, shape=list(arr.shape))
+        if arr.ndim != 2 or not key.startswith("frame_"):
+            ent['chunks'] = [self._write_chunk(arr)]
+        else:
+            planes = plane_ranges(arr.shape[1], self.planes)
+            ent['planes'] = [list(p) for p in planes]
+            chunks = list()
+            for pind, (c0, c1) in enumerate(planes):
+                for t0 in range(0, arr.shape[0], self.tblock):
+                    t1 = min(t0 + self.tblock, arr.shape[0])
+                    chunks.append(self._write_chunk(arr[t0:t1, c0:c1],
+                                                    plane=pind, ticks=[t0, t1]))
+            ent['chunks'] = chunks
+        self.index[key] = ent
+        self._dirty = True
+
+
+def load(path):
+    '''Return dict-like arrays of an NPZ or frame store file.
+    '''
+    if is_framestore(path):
+        return FrameStore(path)
+    from .npzio import Frames
+    return Frames(numpy.load(path))
+
+
+def from_npz(npzfile, pfsfile, mode='w', prefix="", **kwds):
+    '''Convert an NPZ file to a frame store.  Keywords are passed to
+    FrameStore.  Packed, aliased or sparse frames are stored expanded.
+    If prefix is given it is put before the trigger number of each
+    key, see npzio.prefixed_key().  Return list of keys written.
+    '''
+    from .npzio import Frames, prefixed_key
+    keys = list()
+    with FrameStore(pfsfile, mode, **kwds) as fs:
+        arrs = Frames(numpy.load(npzfile))
+        todo = [(k, prefixed_key(k, prefix)) for k in arrs.keys()
+                if not k.startswith(("alias_", "roi_"))]
+        have = [new for _, new in todo if new in fs]
+        if have:
+            more = f' and {len(have)-1} more' if len(have) > 1 else ''
+            raise KeyError(f'frame store already has: {have[0]}{more}')
+        for key, new in todo:
+            fs.write(new, arrs[key])
+            keys.append(new)
+    return keys
+
+
+def to_npz(pfsfile, npzfile):
+    '''Convert a frame store to an NPZ file.  Return list of keys
+    written.
+    '''
+    import zipfile
+    keys = list()
+    with FrameStore(pfsfile) as fs, \
+         zipfile.ZipFile(npzfile, "w", allowZip64=True) as zout:
+        for key in fs.keys():
+            with zout.open(key + ".npy", "w", force_zip64=True) as fp:
+                numpy.lib.format.write_array(fp, fs.read(key))
+            keys.append(key)
+    return keys
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+'''
+Member level access to NPZ files.
+
+An NPZ file is a zip archive holding one .npy file per array.  The
+functions here move members between archives as bytes so arrays need
+never be decoded or held in memory whole.
+
+Raw frames may be stored compactly: as int16, packed to 12 bits per
+sample as a uint8 array (see pack12()) and with duplicated columns
+given by an alias_<tag>_<trigger> array instead of being stored
+twice (see alias_columns()).  Signal frames, mostly zero outside of
+regions of interest, may be stored sparse as a 1D frame_ array of
+the samples of each region with a roi_<tag>_<trigger> array
+describing the regions (see sparsify()).  Readers get the full frame
+back with expand_frame() or the Frames view.
+'''
+import os
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+
+# zip local file header: signature, version, flags, compression,
+# time, date, crc, compressed size, size, name length, extra length.
+local_header = struct.Struct('<4s5H3L2H')
+local_signature = b'PK\x03\x04'
+
+# bytes to move at a time when streaming a member
+chunk_size = 1<<20
+
+
+def members(npzfile):
+    '''Return list of ZipInfo of members of an NPZ file in archive
+    order.
+    '''
+    with zipfile.ZipFile(npzfile) as zf:
+        return zf.infolist()
+
+
+def data_offset(fp, zinfo):
+    '''Return the offset in the open archive file fp to the start of
+    the member data described by zinfo.
+    '''
+    fp.seek(zinfo.header_offset)
+    hdr = local_header.unpack(fp.read(local_header.size))
+    if hdr[0] != local_signature:
+        raise ValueError(f'bad zip local header for {zinfo.filename}')
+    return zinfo.header_offset + local_header.size + hdr[9] + hdr[10]
+
+
+def read_data(npzfile, zinfo):
+    '''Return the bytes of one member, decompressed if it is
+    compressed.
+    '''
+    with zipfile.ZipFile(npzfile) as zf:
+        return zf.read(zinfo)
+
+
+def iter_data(npzfile, zinfo):
+    '''Yield the bytes of one member in chunks, decompressed if it is
+    compressed.
+    '''
+    with zipfile.ZipFile(npzfile) as zf, zf.open(zinfo) as fp:
+        while True:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def write_data(zout, name, zinfo, data):
+    '''Write a member to the open ZipFile zout.
+
+    The member is named name and otherwise described by zinfo, as
+    taken from the source archive, and is compressed as it was there.
+    The data is the member's bytes, as from read_data(), or an
+    iterable of chunks of them.  Members stored uncompressed, as
+    numpy.savez() writes them, are copied byte for byte.
+    '''
+    zi = zipfile.ZipInfo(name, date_time=zinfo.date_time)
+    zi.compress_type = zinfo.compress_type
+    zi.external_attr = zinfo.external_attr
+    zi.create_system = zinfo.create_system
+    # the expected size lets ZipFile choose zip64 headers up front
+    zi.file_size = zinfo.file_size
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = [data]
+    with zout.open(zi, "w") as fp:
+        for chunk in data:
+            fp.write(chunk)
+    if zi.file_size != zinfo.file_size or zi.CRC != zinfo.CRC:
+        raise IOError(f'wrote {zi.file_size} of {zinfo.file_size} bytes of {name} '
+                      f'or they differ')
+    return zi
+
+
+def write_array(zout, name, arr):
+    '''Write an array as a member of the open ZipFile zout.
+    '''
+    with zout.open(name, "w", force_zip64=True) as fp:
+        numpy.lib.format.write_array(fp, arr)
+
+
+def pack12(frame):
+    '''Return a (nticks, nchans) frame of 12 bit samples packed as a
+    (nticks, 3*nchans/2) uint8 array.
+
+    Each pair of channels (a, b) takes three bytes: the low byte of a,
+    the high nibble of a with the low nibble of b above it and the
+    high byte of b.  Samples must be in [0, 4096) and nchans even.
+    '''
+    frame = numpy.asarray(frame)
+    if frame.ndim != 2 or frame.shape[1] % 2:
+        raise ValueError(f'can not pack frame of shape {frame.shape}')
+    if frame.size and (frame.min() < 0 or frame.max() > 0xfff):
+        raise ValueError('frame has samples outside of 12 bits')
+    a = frame[:, 0::2].astype(numpy.uint16)
+    b = frame[:, 1::2].astype(numpy.uint16)
+    out = numpy.empty((frame.shape[0], 3*(frame.shape[1]//2)), dtype=numpy.uint8)
+    out[:, 0::3] = a & 0xff
+    out[:, 1::3] = (a >> 8) | ((b & 0xf) << 4)
+    out[:, 2::3] = b >> 4
+    return out
+
+
+def unpack12(packed):
+    '''Return the int16 frame of a frame packed by pack12().
+    '''
+    packed = numpy.asarray(packed, dtype=numpy.uint8)
+    b0 = packed[:, 0::3].astype(numpy.int16)
+    b1 = packed[:, 1::3].astype(numpy.int16)
+    b2 = packed[:, 2::3].astype(numpy.int16)
+    out = numpy.empty((packed.shape[0], 2*b0.shape[1]), dtype=numpy.int16)
+    out[:, 0::2] = b0 | ((b1 & 0xf) << 8)
+    out[:, 1::2] = (b1 >> 4) | (b2 << 4)
+    return out
+
+
+def alias_key(key):
+    '''Return the key of the alias array of frame key, eg
+    frame_<tag>_<trigger> gives alias_<tag>_<trigger>.
+    '''
+    return "alias_" + key[len("frame_"):]
+
+
+def alias_columns(nstored, alias):
+    '''Return the stored column of each column of an aliased frame.
+
+    The alias is an (n,3) array, each row (first, source, count)
+    meaning that count columns starting at first are copies of those
+    starting at stored column source.  Rows apply in order and each
+    inserts its columns into those of the stored frame.
+    '''
+    cols = list(range(nstored))
+    for first, source, count in numpy.asarray(alias).reshape(-1, 3):
+        cols[first:first] = range(source, source+count)
+    return numpy.array(cols)
+
+
+def roi_key(key):
+    '''Return the key of the region array of frame key, eg
+    frame_<tag>_<trigger> gives roi_<tag>_<trigger>.
+    '''
+    return "roi_" + key[len("frame_"):]
+
+
+def companion_keys(key):
+    '''Return the keys of arrays which may describe how frame key is
+    stored: its alias and roi keys.
+    '''
+    return alias_key(key), roi_key(key)
+
+
+def key_prefixes(npzfiles, single=False):
+    '''Return dict from each file to a prefix for the trigger numbers of
+    its arrays when they are saved with arrays of the other files.
+
+    As npzjoin does, the prefix is the file's timestamp in seconds,
+    the last "-" field of its name less two centisecond digits.  If
+    any file lacks a timestamp or shares it with another, each file's
+    index is used instead.  Unless single is true, a single file gets
+    an empty prefix so its arrays keep their keys.
+    '''
+    if len(npzfiles) < 2 and not single:
+        return dict((f, "") for f in npzfiles)
+    stamps = [os.path.splitext(os.path.basename(f))[0].split("-")[-1]
+              for f in npzfiles]
+    stamps = [st[:-2] if st.isdigit() and len(st) > 2 else None for st in stamps]
+    if None in stamps or len(set(stamps)) < len(stamps):
+        width = len(str(len(npzfiles) - 1))
+        stamps = [f'{ind:0{width}d}' for ind in range(len(npzfiles))]
+    return dict(zip(npzfiles, stamps))
+
+
+def prefixed_key(key, prefix):
+    '''Return a <kind>_<tag>_<trigger> key with prefix, as from
+    key_prefixes(), put before its trigger number.  Keys without a
+    trigger number are returned as-is.
+    '''
+    head, _, trig = key.rpartition("_")
+    if not prefix or not head or not trig.isdigit():
+        return key
+    return f'{head}_{prefix}{int(trig):02d}'
+
+
+def sparsify(frame, threshold=0):
+    '''Return (samples, roi) storing a (nticks, nchans) frame sparse.
+
+    A region of interest is a run of ticks of one channel with
+    samples whose magnitude is above threshold.  The roi is an int32
+    array of (nroi+1, 3).  Its first row is (nticks, nchans, nroi) and
+    each other row is (channel column, first tick, count) of one
+    region, ordered by column then tick.  The samples are a 1D array
+    of the frame's type holding those of each region in turn.
+    '''
+    frame = numpy.asarray(frame)
+    nticks, nchans = frame.shape
+    bychan = frame.T
+    above = numpy.abs(bychan) > threshold
+    edges = numpy.diff(numpy.pad(above, ((0, 0), (1, 1))).astype(numpy.int8), axis=1)
+    cols, starts = numpy.nonzero(edges == 1)
+    _, ends = numpy.nonzero(edges == -1)
+    roi = numpy.empty((cols.size + 1, 3), dtype=numpy.int32)
+    roi[0] = (nticks, nchans, cols.size)
+    roi[1:, 0] = cols
+    roi[1:, 1] = starts
+    roi[1:, 2] = ends - starts
+    return bychan[above], roi
+
+
+def densify(samples, roi):
+    '''Return the (nticks, nchans) frame of samples and roi as made
+    by sparsify().  Samples of any overlapping regions add.
+    '''
+    roi = numpy.asarray(roi).reshape(-1, 3)
+    nticks, nchans, nroi = roi[0]
+    cols, starts, counts = roi[1:nroi+1].T.astype(numpy.int64)
+    if counts.sum() != samples.size:
+        raise ValueError(f'{samples.size} samples for regions of {counts.sum()}')
+    first = numpy.cumsum(counts) - counts
+    ticks = numpy.arange(samples.size) - numpy.repeat(first - starts, counts)
+    flat = ticks * nchans + numpy.repeat(cols, counts)
+    frame = numpy.bincount(flat, weights=samples, minlength=nticks*nchans)
+    return frame.astype(samples.dtype).reshape(nticks, nchans)
+
+
+def expand_frame(frame, alias=None, roi=None):
+    '''Return a frame as it was before storage.
+
+    If roi is given, the frame holds its samples and is densified as
+    by densify().  A uint8 frame is unpacked as by unpack12().  If
+    alias is given, aliased columns are restored as by
+    alias_columns().  Other frames are returned as-is.
+    '''
+    if roi is not None:
+        frame = densify(frame, roi)
+    if frame.dtype == numpy.uint8:
+        frame = unpack12(frame)
+    if alias is not None and len(alias):
+        frame = frame[:, alias_columns(frame.shape[1], alias)]
+    return frame
+
+
+class Frames:
+    '''
+    A read-only dict-like view of arrays, eg from numpy.load(), which
+    gives frames expanded by expand_frame() using any matching alias
+    and roi arrays.  Sparse frames are densified only as accessed.
+    '''
+    def __init__(self, arrs):
+        self.arrs = arrs
+
+    def keys(self):
+        return self.arrs.keys()
+
+    @property
+    def files(self):
+        return list(self.arrs.keys())
+
+    def __iter__(self):
+        return iter(self.arrs.keys())
+
+    def __len__(self):
+        return len(self.arrs.keys())
+
+    def __contains__(self, key):
+        return key in self.arrs
+
+    def __getitem__(self, key):
+        arr = self.arrs[key]
+        if not key.startswith("frame_"):
+            return arr
+        return expand_frame(arr, *[self.arrs[k] if k in self.arrs else None
+                                   for k in companion_keys(key)])
+
+    def items(self):
+        for key in self.keys():
+            yield key, self[key]
+
+
+def read_member(source, zinfo):
+    '''Return what copy_members() writes for one item: the bytes of an
+    NPZ member or, if zinfo is a key, the array from a frame store.
+    '''
+    if isinstance(zinfo, str):
+        from .framestore import FrameStore
+        with FrameStore(source) as fs:
+            return fs.read(zinfo)
+    return read_data(source, zinfo)
+
+
+def _write_member(zout, name, zinfo, data):
+    if isinstance(zinfo, str):
+        write_array(zout, name, data)
+    else:
+        write_data(zout, name, zinfo, data)
+
+
+def copy_members(output, items, workers=0):
+    '''Copy members between NPZ files without decoding their arrays.
+
+    The items are (npzfile, zinfo, newname) and are written in order
+    to a new NPZ file output.  Uncompressed members are copied byte
+    for byte, compressed ones are compressed again the same way.  An item may instead be (pfsfile, key,
+    newname) to take an array from a frame store, which is necessarily
+    decoded.  With workers > 0, that many members are read ahead by
+    threads, otherwise each NPZ member is streamed in chunks so memory
+    use is constant.
+    '''
+    with zipfile.ZipFile(output, "w", allowZip64=True) as zout:
+        if workers <= 0:
+            for source, zinfo, name in items:
+                if isinstance(zinfo, str):
+                    data = read_member(source, zinfo)
+                else:
+                    data = iter_data(source, zinfo)
+                _write_member(zout, name, zinfo, data)
+            return
+
+        pending = list()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for source, zinfo, name in items:
+                pending.append((zinfo, name, pool.submit(read_member, source, zinfo)))
+                if len(pending) > workers:
+                    zinfo0, name0, fut = pending.pop(0)
+                    _write_member(zout, name0, zinfo0, fut.result())
+            for zinfo0, name0, fut in pending:
+                _write_member(zout, name0, zinfo0, fut.result())
@@ -46,10 +46,11 @@ def avgwf(bled, thresh_sigma=5, offset=0):
             res_2d[nticks//2: nticks//2 + nticks,:])
 
 def load(fname, arrname):
-    fp = numpy.load(fname)
+    from wirecell.pcbro.framestore import load as load_frames
+    fp = load_frames(fname)
     if not arrname:
         arrname = list(fp.keys())[0]
-    raw = numpy.load(fname)[arrname]
+    raw = fp[arrname]
     med = numpy.median(raw, axis=0)
     bled = raw - med
     col=bled[:,0:64]
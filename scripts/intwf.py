@@ -7,7 +7,8 @@ import numpy
 import matplotlib.pyplot as plt
 
 def load_array(fname, key):
-    return numpy.load(fname)[key]
+    from wirecell.pcbro.framestore import load
+    return load(fname)[key]
 
 def plane_totals(bychan):
     return [numpy.sum(bychan[s:s+64]) for s in [0,64,128]]
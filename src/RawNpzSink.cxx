@@ -0,0 +1,124 @@
+#include "WireCellPcbro/RawNpzSink.h"
+
+#include "WireCellUtil/NamedFactory.h"
+#include "WireCellUtil/Logging.h"
+#include "WireCellUtil/cnpy.h"
+#include "WireCellUtil/Units.h"
+
+#include <cmath>
+
+WIRECELL_FACTORY(PcbroRawNpzSink, pcbro::RawNpzSink,
+                 WireCell::IConfigurable, WireCell::ITensorSetSink)
+
+using namespace WireCell;
+
+pcbro::RawNpzSink::RawNpzSink()
+{
+}
+
+pcbro::RawNpzSink::~RawNpzSink()
+{
+}
+
+WireCell::Configuration pcbro::RawNpzSink::default_configuration() const
+{
+    WireCell::Configuration cfg;
+    cfg["filename"] = "";
+    // How frames are stored: "int16" or "packed12" for 12 bit
+    // samples packed two to three bytes.  Float frames are rounded.
+    cfg["format"] = "int16";
+    return cfg;
+}
+
+void pcbro::RawNpzSink::configure(const WireCell::Configuration& cfg)
+{
+    m_filename = get<std::string>(cfg, "filename", m_filename);
+    if (m_filename.empty()) {
+        throw std::runtime_error("pcbro::RawNpzSink: no output file name");
+    }
+    m_format = get<std::string>(cfg, "format", m_format);
+    if (m_format != "int16" and m_format != "packed12") {
+        throw std::runtime_error("pcbro::RawNpzSink: unknown format: " + m_format);
+    }
+    m_narrays = 0;
+}
+
+template <typename T>
+void pcbro::RawNpzSink::save(const std::string& name, const T* data,
+                             const std::vector<size_t>& shape)
+{
+    cnpy::npz_save(m_filename, name, data, shape, m_narrays ? "a" : "w");
+    ++m_narrays;
+}
+
+bool pcbro::RawNpzSink::operator()(const ITensorSet::pointer& ts)
+{
+    if (! ts) {
+        return true;            // EOS
+    }
+    auto log = WireCell::Log::logger("pcbro");
+
+    auto tens = ts->tensors();
+    if (tens->size() < 2) {
+        throw std::runtime_error("pcbro::RawNpzSink: want frame and channels tensors");
+    }
+    auto frame = tens->at(0);
+    auto chans = tens->at(1);
+    auto fmd = frame->metadata();
+    const std::string tag = get<std::string>(fmd, "tag", "");
+    const std::string suffix = tag + "_" + std::to_string(ts->ident());
+
+    // Frame tensors are (nrows, nticks) with rows fastest in memory,
+    // which is a C-ordered (nticks, nrows) array.
+    const auto shape = frame->shape();
+    const size_t nrows = shape[0], nticks = shape[1], nsamples = nrows*nticks;
+    std::vector<int16_t> samples;
+    const int16_t* adc = (const int16_t*) frame->data();
+    if (frame->element_type() == typeid(float)) {
+        const float* fdat = (const float*) frame->data();
+        samples.resize(nsamples);
+        for (size_t ind = 0; ind < nsamples; ++ind) {
+            samples[ind] = std::round(fdat[ind]);
+        }
+        adc = samples.data();
+    }
+    else if (frame->element_type() != typeid(int16_t)) {
+        throw std::runtime_error("pcbro::RawNpzSink: frame must be float or int16");
+    }
+
+    if (m_format == "packed12") {
+        if (nrows % 2) {
+            throw std::runtime_error("pcbro::RawNpzSink: can not pack an odd number of rows");
+        }
+        std::vector<uint8_t> packed(3*nsamples/2);
+        pcbro::pack12(adc, nsamples, packed.data());
+        save("frame_" + suffix, packed.data(), {nticks, 3*nrows/2});
+    }
+    else {
+        save("frame_" + suffix, adc, {nticks, nrows});
+    }
+
+    auto jalias = fmd["alias"];
+    if (jalias.size()) {
+        std::vector<int32_t> alias;
+        for (const auto& one : jalias) {
+            for (const auto& val : one) {
+                alias.push_back(val.asInt());
+            }
+        }
+        save("alias_" + suffix, alias.data(), {jalias.size(), 3});
+    }
+
+    const size_t nchans = chans->shape()[0];
+    save("channels_" + suffix, (const int32_t*) chans->data(), {nchans});
+
+    auto smd = ts->metadata();
+    const double tickinfo[3] = {get<double>(smd, "time", 0.0),
+                                get<double>(smd, "tick", 0.5*units::us),
+                                get<double>(fmd, "tbin", 0.0)};
+    save("tickinfo_" + suffix, tickinfo, {3});
+
+    log->debug("RawNpzSink: {} {} frame {} of {} ticks, {} rows, {} channels",
+               m_filename, m_format, suffix, nticks, nrows, nchans);
+    return true;
+}
@@ -11,6 +11,8 @@
 
 
 #include <numeric>
+#include <algorithm>
+#include <fstream>
 
 WIRECELL_FACTORY(PcbroRawSource, pcbro::RawSource,
                  WireCell::IConfigurable, WireCell::ITensorSetSource)
@@ -33,8 +35,63 @@ WireCell::Configuration pcbro::RawSource::default_configuration() const
     cfg["filename"] = "";       // can also accept an array of files
     cfg["tag"] = "";
     cfg["dupind"] = false;      // if true, DUPlicate INDuction planes
+    // The frame sample type: "float" as WCT frames want or "int16"
+    // which, with dupind, holds the induction rows once and marks
+    // the duplicates as an "alias" in its metadata.  Only pcbro's
+    // PcbroRawNpzSink takes int16 frames.
+    cfg["dtype"] = "float";
     cfg["start_trigger"] = "0";
     cfg["triggers"] = "50";
+    // If not empty, output only triggers with these idents, given as
+    // numbers or strings, instead of start_trigger and triggers.
+    cfg["trigger_list"] = Json::arrayValue;
+    // How to index packages and triggers of each file so skipped
+    // triggers need not be decoded: "none" to decode sequentially,
+    // "memory" to index on open or "sidecar" to also read or write
+    // an index file next to each .bin file.
+    cfg["index"] = "none";
+    // If true, recover from a break in the package sequence by
+    // dropping the damaged trigger and resuming at the next trigger
+    // found after it, instead of ending the file.  This indexes each
+    // file, in memory if index is "none".
+    cfg["resync"] = false;
+    // If true, read each file through a sliding window of at most
+    // "window" bytes instead of slurping it whole.
+    cfg["stream"] = false;
+    cfg["window"] = (int)pcbro::default_window_bytes;
+    // The decoder: "binfile" to find triggers in raw data as above
+    // and unpack them, or "binstream" to unpack samples as a file
+    // is read with BinStreamDecoder.
+    cfg["engine"] = "binfile";
+    // Number of threads decoding triggers ahead of their output and
+    // the number of triggers they may hold.  A queue of 0 means
+    // twice the workers.  With no workers, decode as each is output.
+    cfg["workers"] = 0;
+    cfg["queue"] = 0;
+    // Number of files to open and read ahead of the current one on
+    // a background thread.  When streaming, only the first window of
+    // each is read ahead.
+    cfg["prefetch"] = 0;
+    // If not empty, write counters and timers of reading, decoding
+    // and output per file as JSON to this file at end of stream.
+    cfg["metrics"] = "";
+    // If above 0, measure the raw activity of each decoded trigger:
+    // for each group of frame rows, given as [first, last) pairs, the
+    // sum of absolute differences from each row's median that are
+    // above activity_minimum ADC.  A trigger is active if every sum
+    // reaches the threshold.  Quiet triggers are dropped, or with
+    // quiet "tag" they are output and, as for active ones, the set
+    // metadata gives the "activity" sums and "active".
+    cfg["activity_threshold"] = 0.0;
+    cfg["activity_minimum"] = 20.0;
+    cfg["activity_groups"] = Json::arrayValue;
+    for (const auto& grp : m_activity_groups) {
+        Json::Value one = Json::arrayValue;
+        one.append((int)grp.first);
+        one.append((int)grp.second);
+        cfg["activity_groups"].append(one);
+    }
+    cfg["quiet"] = "drop";
     return cfg;
 }
 
@@ -43,7 +100,15 @@ void pcbro::RawSource::configure(const WireCell::Configuration& cfg)
 {
     auto log = WireCell::Log::logger("pcbro");
 
+    // Files of a previous configuration may still be opening.
+    m_opening.clear();
+    m_reader.reset();
+
     m_dupind = get<bool>(cfg, "dupind", m_dupind);
+    m_dtype = get<std::string>(cfg, "dtype", m_dtype);
+    if (m_dtype != "float" and m_dtype != "int16") {
+        throw std::runtime_error("pcbro::RawSource: unknown dtype: " + m_dtype);
+    }
 
     m_tag = get<std::string>(cfg, "tag", "");
     log->debug("RawSource: using tag: \"{}\"", m_tag);
@@ -55,6 +120,80 @@ void pcbro::RawSource::configure(const WireCell::Configuration& cfg)
     m_start_trigger = std::stoi( m_start_trigger_string );
     m_triggers = std::stoi( m_triggers_string );
 
+    m_trigger_list.clear();
+    for (auto jone : cfg["trigger_list"]) {
+        m_trigger_list.push_back(jone.isString() ? std::stoi(jone.asString()) : jone.asInt());
+    }
+    std::sort(m_trigger_list.begin(), m_trigger_list.end());
+    m_trigger_list.erase(std::unique(m_trigger_list.begin(), m_trigger_list.end()),
+                         m_trigger_list.end());
+    if (! m_trigger_list.empty()) {
+        log->debug("RawSource: {} listed triggers from {} to {}", m_trigger_list.size(),
+                   m_trigger_list.front(), m_trigger_list.back());
+    }
+
+    m_index = get<std::string>(cfg, "index", m_index);
+    if (m_index != "none" and m_index != "memory" and m_index != "sidecar") {
+        throw std::runtime_error("pcbro::RawSource: unknown index mode: " + m_index);
+    }
+    m_stream = get<bool>(cfg, "stream", m_stream);
+    m_window = get<int>(cfg, "window", m_window);
+    m_engine = get<std::string>(cfg, "engine", m_engine);
+    if (m_engine != "binfile" and m_engine != "binstream") {
+        throw std::runtime_error("pcbro::RawSource: unknown engine: " + m_engine);
+    }
+    m_resync = get<bool>(cfg, "resync", m_resync);
+    if ((m_stream or m_engine == "binstream") and m_resync) {
+        log->warn("RawSource: resync is not supported when streaming");
+        m_resync = false;
+    }
+    if ((m_stream or m_engine == "binstream") and m_index != "none") {
+        log->warn("RawSource: index is not used when streaming");
+        m_index = "none";
+    }
+    if (m_resync and m_index == "none") {
+        m_index = "memory";
+    }
+
+    m_workers = get<int>(cfg, "workers", m_workers);
+    m_queue = get<int>(cfg, "queue", m_queue);
+    if (m_queue == 0) {
+        m_queue = std::max<size_t>(1, 2*m_workers);
+    }
+    m_pending.clear();
+    m_nomore = false;
+    m_channels = nullptr;
+    m_pool.reset();
+    if (m_workers > 0) {
+        m_pool = std::make_unique<pcbro::TaskPool>(m_workers);
+        log->debug("RawSource: decode with {} workers, {} deep", m_workers, m_queue);
+    }
+    m_metrics_file = get<std::string>(cfg, "metrics", m_metrics_file);
+    m_activity_threshold = get<double>(cfg, "activity_threshold", m_activity_threshold);
+    m_activity_minimum = get<double>(cfg, "activity_minimum", m_activity_minimum);
+    if (cfg["activity_groups"].size()) {
+        m_activity_groups.clear();
+        for (const auto& jone : cfg["activity_groups"]) {
+            if (jone.size() != 2 or jone[0].asInt() < 0 or jone[1].asInt() <= jone[0].asInt()) {
+                throw std::runtime_error("pcbro::RawSource: activity groups must be [first, last) rows");
+            }
+            m_activity_groups.emplace_back(jone[0].asInt(), jone[1].asInt());
+        }
+    }
+    m_quiet = get<std::string>(cfg, "quiet", m_quiet);
+    if (m_quiet != "drop" and m_quiet != "tag") {
+        throw std::runtime_error("pcbro::RawSource: unknown quiet mode: " + m_quiet);
+    }
+    if (m_activity_threshold > 0) {
+        log->debug("RawSource: {} triggers with activity below {} in any of {} groups",
+                   m_quiet, m_activity_threshold, m_activity_groups.size());
+    }
+    m_prefetch = get<int>(cfg, "prefetch", m_prefetch);
+    if (m_prefetch > 0) {
+        m_reader = std::make_unique<pcbro::TaskPool>(1);
+        log->debug("RawSource: open up to {} files ahead", m_prefetch);
+    }
+
     auto jfn = cfg["filename"];
     if (jfn.empty()) {
         std::runtime_error("pcbro::RawSource: empty input filename");
@@ -80,6 +219,7 @@ void pcbro::RawSource::configure(const WireCell::Configuration& cfg)
         }
         log->debug("RawSource: using file: {}", fname);
     }
+    m_metrics = std::make_shared<pcbro::RawMetrics>(m_filenames);
     m_filenum=0;
     bool ok = init_file();
     if (! ok) {
@@ -91,152 +231,647 @@ bool pcbro::RawSource::init_file()
 {
     auto log = WireCell::Log::logger("pcbro");
 
+    close_file();
+    m_infile = false;
     if (m_filenum >= m_filenames.size()) {
         log->debug("RawSource: end of {} files", m_filenames.size());
         return false;
     }
 
-    std::string fname = m_filenames[m_filenum];
-    std::fstream fstr(fname, std::ios_base::in | std::ios_base::binary);
-    if (!fstr.is_open()) {
-        std::runtime_error("pcbro::RawSource: failed to open file: " + fname);
+    const auto t0 = pcbro::RawMetrics::clock_type::now();
+    std::shared_ptr<OpenFile> of;
+    if (m_opening.empty()) {
+        of = open_file(m_filenum);
     }
+    else {
+        of = m_opening.front().get();
+        m_opening.pop_front();
+    }
+    const double wait = pcbro::RawMetrics::since(t0);
+    m_metrics->update(m_filenum, [&](pcbro::RawMetrics::File& fm) {
+            fm.bytes = of->bytes;
+            fm.open = of->seconds;
+            fm.open_wait = wait;
+            if (m_resync) {
+                fm.corrupt += of->ri.breaks.size();
+                fm.dropped += of->ri.dropped;
+            }
+        });
+    m_fpd = of->fpd;
+    m_rd = of->rd;
+    m_ri = std::move(of->ri);
+    m_bw = std::move(of->bw);
+    m_bs = std::move(of->bs);
 
-    m_fpd = pcbro::parse_file_path(fname);
-
-    // slurp!
-    m_rd = pcbro::read_raw_data(fstr);
-    m_cur = m_rd.begin();
-    log->debug("RawSource: open file {}", m_filenames[m_filenum]);
     ++m_filenum;
+    m_infile = true;
+    prefetch();
     return true;
 }
 
-
-bool pcbro::RawSource::operator()(ITensorSet::pointer& ts)
+void pcbro::RawSource::close_file()
 {
-    ts = nullptr;
-    if (m_eos) {
-        return false;
+    // Streamed files are read only as far as their triggers are.
+    size_t nread = 0;
+    if (m_bw) {
+        nread = m_bw->bytes_read();
+    }
+    if (m_bs) {
+        nread = m_bs->bytes_read();
     }
+    if (nread) {
+        m_metrics->update(m_filenum-1, [&](pcbro::RawMetrics::File& fm) {
+                fm.bytes = nread;
+            });
+    }
+    m_rd.reset();               // pending triggers may still hold it
+    m_cur = 0;
+    m_bw.reset();
+    m_bs.reset();
+}
 
+std::shared_ptr<pcbro::RawSource::OpenFile> pcbro::RawSource::open_file(size_t filenum) const
+{
     auto log = WireCell::Log::logger("pcbro");
 
-    // This fills ticks (rows) vs electronics channels (columns).
-    pcbro::block128_t block;
-    try {
-        m_cur = pcbro::make_trigger( block, m_cur, m_rd.end() );
+    const auto t0 = pcbro::RawMetrics::clock_type::now();
+    const std::string& fname = m_filenames[filenum];
+    auto of = std::make_shared<OpenFile>();
+    of->fpd = pcbro::parse_file_path(fname);
+
+    if (m_engine == "binstream") {
+        of->bs = std::make_unique<pcbro::BinStreamDecoder>(fname);
+        of->bs->prime();
+        log->debug("RawSource: decode file {} as read", fname);
+        of->seconds = pcbro::RawMetrics::since(t0);
+        return of;
+    }
+    if (m_stream) {
+        of->bw = std::make_unique<pcbro::BinWindow>(fname, m_window);
+        of->bw->prime();
+        log->debug("RawSource: stream file {} with {} byte window", fname, m_window);
+        of->seconds = pcbro::RawMetrics::since(t0);
+        return of;
+    }
+
+    // slurp!  (memory mapped)
+    of->rd = std::make_shared<pcbro::raw_data_t>(pcbro::read_raw_data(fname));
+    log->debug("RawSource: open file {}", fname);
+    struct stat st;
+    if (::stat(fname.c_str(), &st) == 0) {
+        of->bytes = st.st_size;
+    }
+
+    if (m_index == "memory") {
+        of->ri = pcbro::index_raw_data(of->rd->begin(), of->rd->end(),
+                                       pcbro::default_package_size, m_resync);
+    }
+    else if (m_index == "sidecar") {
+        of->ri = pcbro::sidecar_raw_index(fname, *of->rd, true,
+                                          pcbro::default_package_size, m_resync);
+    }
+    if (m_index != "none") {
+        log->debug("RawSource: index of {}: {} packages, {} triggers, {} breaks",
+                   fname, of->ri.packages.size(), of->ri.triggers.size(),
+                   of->ri.breaks.size());
     }
-    catch (const std::range_error& e) {
-        log->debug("RawSource: after {} triggers end of file {}",
-                   m_ident, m_filenames[m_filenum-1]);
-        bool ok = init_file();
-        if (ok) {               // keep going
-            return this->operator()(ts);
+    of->seconds = pcbro::RawMetrics::since(t0);
+    return of;
+}
+
+void pcbro::RawSource::prefetch()
+{
+    if (! m_reader or next_wanted(m_ident+1) < 0) {
+        return;
+    }
+    while (m_opening.size() < m_prefetch
+           and m_filenum + m_opening.size() < m_filenames.size()) {
+        const size_t filenum = m_filenum + m_opening.size();
+        m_opening.push_back(m_reader->submit([this, filenum]() {
+                    return this->open_file(filenum);
+                }));
+    }
+}
+
+
+void pcbro::RawSource::locate(RawTrigger& rt, bool want)
+{
+    rt.data = nullptr;
+    rt.block = nullptr;
+    rt.short_link = false;
+    rt.begin = rt.end = 0;
+    if (m_bs) {
+        if (! want) {
+            if (! m_bs->skip()) {
+                throw std::range_error("end of stream");
+            }
+            return;
         }
-        m_eos = true;           // next time we return false
-        return true;
+        auto block = std::make_shared<pcbro::block128_t>();
+        if (! m_bs->next(*block)) {
+            throw std::range_error("end of stream");
+        }
+        rt.block = block;
+        const auto& lt = m_bs->link_ticks();
+        rt.short_link = *std::min_element(lt.begin(), lt.end()) < block->rows();
+        return;
+    }
+    if (m_bw) {
+        if (! want) {
+            if (! m_bw->skip()) {
+                throw std::range_error("end of stream");
+            }
+            return;
+        }
+        auto data = std::make_shared<pcbro::raw_data_t>();
+        if (! m_bw->next_raw(*data)) {
+            throw std::range_error("end of stream");
+        }
+        rt.data = data;
+        rt.begin = 0;
+        rt.end = data->size();
+        return;
+    }
+    auto beg = m_rd->begin();
+    auto next = pcbro::seek_trigger(beg + m_cur, m_rd->end());
+    const size_t cur = m_cur;
+    m_cur = std::distance(beg, next);
+    if (! want) {
+        return;
     }
-    catch (const std::runtime_error& d) {
-        log->debug("RawSource: after {} triggers bad data in file {}",
-                   m_ident, m_filenames[m_filenum-1]);
-        bool ok = init_file();
-        if (ok) {               // keep going
-            return this->operator()(ts);
+    rt.data = m_rd;
+    rt.begin = cur;
+    // include the following header which ends the last link
+    rt.end = std::min(m_rd->size(), m_cur + 4);
+}
+
+bool pcbro::RawSource::next_raw(RawTrigger& rt)
+{
+    auto log = WireCell::Log::logger("pcbro");
+
+    while (true) {
+        if (! m_infile and ! init_file()) {
+            return false;
+        }
+        const size_t filenum = m_filenum-1;
+        const auto t0 = pcbro::RawMetrics::clock_type::now();
+        const int ident0 = m_ident;
+        bool want = false;
+        bool bad = false;
+        try {
+            resume_indexed();
+            skip_indexed();
+            want = wanted(m_ident+1);
+            locate(rt, want);
+        }
+        catch (const std::range_error& e) {
+            log->debug("RawSource: after {} triggers end of file {}",
+                       m_ident, m_filenames[filenum]);
+            m_infile = false;
         }
-        m_eos = true;           // next time we return false
+        catch (const std::runtime_error& d) {
+            log->debug("RawSource: after {} triggers bad data in file {}",
+                       m_ident, m_filenames[filenum]);
+            m_infile = false;
+            bad = true;
+        }
+        // Triggers jumped over by the index, and this one if located.
+        const int nskip = m_ident - ident0;
+        const int nfound = m_infile ? 1 : 0;
+        m_metrics->update(filenum, [&](pcbro::RawMetrics::File& fm) {
+                fm.locate += pcbro::RawMetrics::since(t0);
+                fm.triggers += nskip + nfound;
+                fm.skipped += nskip + ((nfound and ! want) ? 1 : 0);
+                fm.corrupt += bad ? 1 : 0;
+            });
+        if (! m_infile) {
+            continue;
+        }
+        rt.ident = ++m_ident;
+        rt.filenum = filenum;
+        rt.fpd = m_fpd;
         return true;
     }
+}
+
+void pcbro::RawSource::fill_queue()
+{
+    auto log = WireCell::Log::logger("pcbro");
+
+    while (! m_nomore and m_pending.size() < m_queue) {
+        if (next_wanted(m_ident+1) < 0) {
+            return;             // have all we want, if all decode
+        }
+        RawTrigger rt;
+        if (! next_raw(rt)) {
+            m_nomore = true;
+            return;
+        }
+        if (! rt.data and ! rt.block) {
+            log->debug("RawSource: skip trigger {}", rt.ident);
+            continue;
+        }
+
+        auto decode = [this, rt]() { return this->decode(rt); };
+        if (m_pool) {
+            m_pending.push_back(Pending{rt, m_pool->submit(decode)});
+        }
+        else {
+            m_pending.push_back(Pending{rt, std::async(std::launch::deferred, decode)});
+        }
+    }
+}
+
+void pcbro::RawSource::drop_file(const RawTrigger& bad)
+{
+    auto log = WireCell::Log::logger("pcbro");
+    log->debug("RawSource: after {} triggers bad data in file {}",
+               bad.ident-1, m_filenames[bad.filenum]);
+    m_metrics->update(bad.filenum, [](pcbro::RawMetrics::File& fm) {
+            ++fm.corrupt;
+        });
+
+    // As if the file ended before the bad trigger.  Triggers read
+    // ahead, including those of following files, were numbered and
+    // selected counting the rest of this file so they are forgotten
+    // and read again following the bad trigger.
+    m_pending.clear();
+    m_nomore = false;
+    m_ident = bad.ident - 1;
+    close_file();
+    m_infile = false;
+    if (m_filenum > bad.filenum + 1) {
+        m_opening.clear();
+        for (size_t filenum = bad.filenum + 1; filenum < m_filenum; ++filenum) {
+            m_metrics->update(filenum, [](pcbro::RawMetrics::File& fm) {
+                    fm = pcbro::RawMetrics::File{fm.filename};
+                });
+        }
+        m_filenum = bad.filenum + 1;
+    }
+}
 
-    ++m_ident;
+bool pcbro::RawSource::wanted(int ident) const
+{
+    if (m_trigger_list.empty()) {
+        return ident >= m_start_trigger and ident < m_start_trigger + m_triggers;
+    }
+    return std::binary_search(m_trigger_list.begin(), m_trigger_list.end(), ident);
+}
 
+int pcbro::RawSource::next_wanted(int ident) const
+{
+    if (m_trigger_list.empty()) {
+        if (ident >= m_start_trigger + m_triggers) {
+            return -1;
+        }
+        return std::max(ident, m_start_trigger);
+    }
+    auto it = std::lower_bound(m_trigger_list.begin(), m_trigger_list.end(), ident);
+    if (it == m_trigger_list.end()) {
+        return -1;
+    }
+    return *it;
+}
 
-    if( m_ident < m_start_trigger ) {
-      log->debug("RawSource: skip trigger {}", m_ident);
-      return this->operator()(ts); //keep going
+void pcbro::RawSource::resume_indexed()
+{
+    if (! m_resync or ! m_rd) {
+        return;
     }
-    else if( m_ident >= m_start_trigger+m_triggers ){
-      log->debug("RawSource: processed {} triggers. Now ening", m_triggers);
-      m_eos = true;
-      return true;
+    // Indexed triggers skip those dropped where bad data broke the
+    // package sequence.
+    const auto& trigs = m_ri.triggers;
+    auto it = std::lower_bound(trigs.begin(), trigs.end(), m_cur,
+                               [](const pcbro::TriggerIndex& ti, size_t off) {
+                                   return ti.begin < off;
+                               });
+    const size_t resume = it == trigs.end() ? m_rd->size() : it->begin;
+    if (resume == m_cur) {
+        return;
     }
+    auto log = WireCell::Log::logger("pcbro");
+    log->debug("RawSource: after {} triggers drop bad data from word {} to {} of {}",
+               m_ident, m_cur, resume, m_filenames[m_filenum-1]);
+    m_cur = resume;
+}
 
+void pcbro::RawSource::skip_indexed()
+{
+    if (m_index == "none" or m_bw or m_bs or m_ri.triggers.empty()) {
+        return;
+    }
+    int nskip = next_wanted(m_ident+1) - 1 - m_ident;
+    if (nskip <= 0) {
+        return;
+    }
+    const auto& trigs = m_ri.triggers;
+    auto it = std::lower_bound(trigs.begin(), trigs.end(), m_cur,
+                               [](const pcbro::TriggerIndex& ti, size_t off) {
+                                   return ti.begin < off;
+                               });
+    if (it == trigs.end() or it->begin != m_cur) {
+        return;                 // not at a trigger, decode as usual
+    }
+    nskip = std::min<int>(nskip, std::distance(it, trigs.end()));
+    m_cur = (it + nskip - 1)->end;
+    m_ident += nskip;
+    auto log = WireCell::Log::logger("pcbro");
+    log->debug("RawSource: skip {} indexed triggers to {}", nskip, m_ident);
+}
 
-    log->trace("RawSource: [{}]: #{}: {} ticks", m_tag, m_ident, block.rows());
+// Copied from "dataConversion.py".  Map electronics channel index
+// to a "physical" channel.  Collection runs over [0,61], induction
+// over [62,127].  Relative handedness is not yet known.
+static const int chanPhy[128] =
+    {65, 66, 67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,
+     85,86,87,88,89,90,91,92,93,94,95,96,113,114,115,116,117,118,119,
+     120,121,122,123,124,125,126,127,128,97,98,99,100,101,102,103,
+     104,105,106,107,108,109,110,111,112,16,15,14,13,12,11,10,9,8,
+     7,6,5,4,3,2,1,32,31,30,29,28,27,26,25,24,23,22,21,20,19,18,17,
+     64,63,62,61,60,59,58,57,56,55,54,53,52,51,50,49,48,47,46,45,44,
+     43,42,41,40,39,38,37,36,35,34,33};
+
+// Ticks unpacked before their duplicated induction rows are copied.
+static const size_t tick_block = 256;
+
+// Unpack a trigger, from its block if given else from its links, to
+// out of nticks rows of nrows channels in "physical channel" order.
+// Any rows past the 128 channels repeat those of induction.
+template <typename T>
+static void unpack_frame(T* out, size_t nticks, size_t nrows,
+                         const pcbro::block128_t* block,
+                         const pcbro::trigger_links_t& links)
+{
+    int coff[128];
+    for (size_t ec = 0; ec < 128; ++ec) {
+        coff[ec] = chanPhy[ec]-1;
+    }
+    for (size_t t0 = 0; t0 < nticks; t0 += tick_block) {
+        const size_t t1 = std::min(nticks, t0 + tick_block);
+        if (block) {
+            for (size_t ec = 0; ec < 128; ++ec) {
+                for (size_t tick = t0; tick < t1; ++tick) {
+                    out[tick*nrows + coff[ec]] = (*block)(tick, ec);
+                }
+            }
+        }
+        else {
+            pcbro::unpack_trigger(links, t0, t1, out, nrows, coff);
+        }
+        if (nrows > 128) {
+            for (size_t tick = t0; tick < t1; ++tick) {
+                T* col = out + tick*nrows;
+                std::copy(col+64, col+128, col+128);
+            }
+        }
+    }
+}
 
-    // produce tensor set.
-    Configuration set_md;
-    set_md["ident"] = m_ident;
-    set_md["time"] = m_ident*units::ms; // fixme: any meaningful value here?
-    set_md["tick"] = m_tick;
-    set_md["tags"][0] = m_tag;
-    set_md["runTime"] = Json::Value::Int64(m_fpd.seconds);
-    set_md["runTime_ms"] = m_fpd.msecs;
-
-    ITensor::vector* itv = new ITensor::vector;
-
-    // Output tensor assumes TRANSPOSE of block: ticks are columns!
-    // We also will apply the "physical channel map" so channels
-    // (rows) more closely map to wire order.
-
-    // Copied from "dataConversion.py".  Map electronics channel index
-    // to a "physical" channel.  Collection runs over [0,61],
-    // induction over [62,127].  Relative handedness is not yet known.
-    const std::vector<int> chanPhy =
-        {65, 66, 67,68,69,70,71,72,73,74,75,76,77,78,79,80,81,82,83,84,
-         85,86,87,88,89,90,91,92,93,94,95,96,113,114,115,116,117,118,119,
-         120,121,122,123,124,125,126,127,128,97,98,99,100,101,102,103,
-         104,105,106,107,108,109,110,111,112,16,15,14,13,12,11,10,9,8,
-         7,6,5,4,3,2,1,32,31,30,29,28,27,26,25,24,23,22,21,20,19,18,17,
-         64,63,62,61,60,59,58,57,56,55,54,53,52,51,50,49,48,47,46,45,44,
-         43,42,41,40,39,38,37,36,35,34,33};
-
-
-    const size_t nticks = block.rows(); // output is the TRANSPOSE
-    size_t nchans = block.cols(); // of the input block!
+ITensor::pointer pcbro::RawSource::decode(const RawTrigger& rt) const
+{
+    const auto t0 = pcbro::RawMetrics::clock_type::now();
+
+    // Links are gathered into per-thread buffers reused for every
+    // trigger.
+    thread_local pcbro::trigger_links_t links;
+    if (! rt.block) {
+        auto beg = rt.data->begin();
+        pcbro::gather_trigger(links, beg + rt.begin, beg + rt.end);
+    }
+
+    // WCT frame tensor wants float type, rows:chans, cols:ticks.
+    // Samples are unpacked straight into it, already transposed and
+    // in "physical channel" order.
+    const size_t nticks = rt.block ? rt.block->rows() : pcbro::trigger_ticks(links);
+    bool is_short = rt.short_link;
+    if (! rt.block) {
+        for (const auto& ld : links) {
+            is_short = is_short or ld.size()/25 < nticks;
+        }
+    }
+    size_t nchans = 128;
     int nplanes = 2;
     if (m_dupind) {
         nplanes = 3;
         nchans += nchans/2;
     } // half again more for the extra plane
-    // WCT frame tensor wants float type, rows:chans, cols:ticks so
-    // transpose and cast.
-    const std::vector<size_t> shape = {nchans, nticks};
-    Aux::SimpleTensor<float>* frame = new Aux::SimpleTensor<float>(shape);
-    Eigen::Map<Eigen::ArrayXXf> arr((float*) frame->data(), nchans, nticks);
-    // First real data.
-    for (size_t ec = 0; ec < 128; ++ec) {
-        size_t out_ind = chanPhy[ec]-1;
-        for (int ind=0; ind<block.rows(); ++ind) {
-            arr(out_ind, ind) = (float)block(ind, ec);
+
+    // As int16 the extra plane is not stored but its rows are marked
+    // as an alias of the induction rows, see "alias" below.
+    ITensor::pointer ret;
+    Configuration* md = nullptr;
+    std::vector<double> activity;
+    if (m_dtype == "int16") {
+        auto* frame = new Aux::SimpleTensor<int16_t>({128, nticks});
+        unpack_frame((int16_t*) frame->data(), nticks, 128, rt.block.get(), links);
+        if (m_activity_threshold > 0) {
+            activity = pcbro::raw_activity((const int16_t*) frame->data(), nticks, 128,
+                                           m_activity_minimum, m_activity_groups);
         }
+        md = &frame->metadata();
+        ret = ITensor::pointer(frame);
     }
-    if (m_dupind) {
-        for (size_t pch=64; pch<128; ++pch) {
-            arr.row(pch+64) = arr.row(pch);
+    else {
+        auto* frame = new Aux::SimpleTensor<float>({nchans, nticks});
+        unpack_frame((float*) frame->data(), nticks, nchans, rt.block.get(), links);
+        if (m_activity_threshold > 0) {
+            activity = pcbro::raw_activity((const float*) frame->data(), nticks, nchans,
+                                           m_activity_minimum, m_activity_groups);
         }
+        md = &frame->metadata();
+        ret = ITensor::pointer(frame);
     }
 
-    log->trace("RawSource: total sum: {}", arr.sum());
-
-    auto& wf_md = frame->metadata();
+    auto& wf_md = *md;
     wf_md["pad"] = 0;
     wf_md["tbin"] = 0.0;
     wf_md["type"] = "waveform";
     wf_md["tag"] = m_tag;
     wf_md["nplanes"] = nplanes;
-    itv->push_back(ITensor::pointer(frame));
+    if (m_dtype == "int16" and m_dupind) {
+        // (first, source, count) rows: rows [128,192) are [64,128)
+        Json::Value one = Json::arrayValue;
+        one.append(128);
+        one.append(64);
+        one.append(64);
+        wf_md["alias"].append(one);
+    }
+    if (m_activity_threshold > 0) {
+        // Passed on to the set metadata, see operator().
+        for (double one : activity) {
+            wf_md["activity"].append(one);
+        }
+        wf_md["active"] = pcbro::raw_active(activity, m_activity_threshold);
+    }
+
+    const double dt = pcbro::RawMetrics::since(t0);
+    m_metrics->update(rt.filenum, [&](pcbro::RawMetrics::File& fm) {
+            ++fm.decoded;
+            fm.decode += dt;
+            fm.short_triggers += is_short ? 1 : 0;
+        });
+    return ret;
+}
+
+bool pcbro::RawSource::operator()(ITensorSet::pointer& ts)
+{
+    ts = nullptr;
+    if (m_eos) {
+        return false;
+    }
+
+    auto log = WireCell::Log::logger("pcbro");
+
+    RawTrigger rt;
+    ITensor::pointer frame;
+    while (true) {
+        fill_queue();
+        if (m_pending.empty()) {
+            log->debug("RawSource: processed {} triggers. Now ending", m_ident);
+            m_eos = true;       // next time we return false
+            close_file();
+            report_metrics();
+            return true;
+        }
+        Pending job = std::move(m_pending.front());
+        m_pending.pop_front();
+        rt = job.raw;
+        const auto t0 = pcbro::RawMetrics::clock_type::now();
+        try {
+            frame = job.frame.get();
+        }
+        catch (const std::runtime_error& err) {
+            drop_file(rt);
+            continue;
+        }
+        const double wait = pcbro::RawMetrics::since(t0);
+        const bool quiet = m_activity_threshold > 0
+            and ! frame->metadata()["active"].asBool();
+        m_metrics->update(rt.filenum, [&](pcbro::RawMetrics::File& fm) {
+                fm.decode_wait += wait;
+                fm.quiet += quiet ? 1 : 0;
+            });
+        if (quiet and m_quiet == "drop") {
+            log->debug("RawSource: drop quiet trigger {}", rt.ident);
+            continue;
+        }
+        break;
+    }
+    const auto t0 = pcbro::RawMetrics::clock_type::now();
+
+    const auto shape = frame->shape();
+    const size_t nrows = shape[0], nticks = shape[1];
+    // Aliased rows are not stored but still have channels.
+    const size_t nchans = m_dupind ? 192 : 128;
+    log->trace("RawSource: [{}]: #{}: {} ticks", m_tag, rt.ident, nticks);
+    if (log->should_log(spdlog::level::trace)) {
+        double sum = 0;
+        if (m_dtype == "int16") {
+            Eigen::Map<const Eigen::Array<int16_t, Eigen::Dynamic, Eigen::Dynamic>>
+                arr((const int16_t*) frame->data(), nrows, nticks);
+            sum = arr.cast<double>().sum();
+        }
+        else {
+            Eigen::Map<const Eigen::ArrayXXf> arr((const float*) frame->data(), nrows, nticks);
+            sum = arr.sum();
+        }
+        log->trace("RawSource: total sum: {}", sum);
+    }
+
+    // produce tensor set.
+    Configuration set_md;
+    set_md["ident"] = rt.ident;
+    set_md["time"] = rt.ident*units::ms; // fixme: any meaningful value here?
+    set_md["tick"] = m_tick;
+    set_md["tags"][0] = m_tag;
+    set_md["runTime"] = Json::Value::Int64(rt.fpd.seconds);
+    set_md["runTime_ms"] = rt.fpd.msecs;
+    if (m_activity_threshold > 0) {
+        const auto& fmd = frame->metadata();
+        set_md["activity"] = fmd["activity"];
+        set_md["active"] = fmd["active"];
+    }
 
-    Aux::SimpleTensor<int>* cht = new Aux::SimpleTensor<int>({nchans});
-    int* chdat = reinterpret_cast<int*>(cht->store().data());
-    std::iota(chdat, chdat+nchans, 1);
-    auto& ch_md = cht->metadata();
-    ch_md["type"] = "channels";
-    ch_md["tag"] = m_tag;
-    itv->push_back(ITensor::pointer(cht));
+    // The channels are the same for every trigger so share them.
+    if (! m_channels or m_channels->shape()[0] != nchans) {
+        Aux::SimpleTensor<int>* cht = new Aux::SimpleTensor<int>({nchans});
+        int* chdat = reinterpret_cast<int*>(cht->store().data());
+        std::iota(chdat, chdat+nchans, 1);
+        auto& ch_md = cht->metadata();
+        ch_md["type"] = "channels";
+        ch_md["tag"] = m_tag;
+        m_channels = ITensor::pointer(cht);
+    }
 
-    ts = std::make_shared<Aux::SimpleTensorSet>(m_ident, set_md,
+    ITensor::vector* itv = new ITensor::vector{frame, m_channels};
+    ts = std::make_shared<Aux::SimpleTensorSet>(rt.ident, set_md,
                                                 ITensor::shared_vector(itv));
 
+    const double dt = pcbro::RawMetrics::since(t0);
+    m_metrics->update(rt.filenum, [&](pcbro::RawMetrics::File& fm) {
+            fm.output += dt;
+        });
     return true;
 }
+
+static Json::Value metrics_json(const pcbro::RawMetrics::File& fm)
+{
+    Json::Value jm;
+    jm["filename"] = fm.filename;
+    jm["bytes"] = Json::Value::UInt64(fm.bytes);
+    jm["triggers"] = Json::Value::UInt64(fm.triggers);
+    jm["skipped"] = Json::Value::UInt64(fm.skipped);
+    jm["decoded"] = Json::Value::UInt64(fm.decoded);
+    jm["short"] = Json::Value::UInt64(fm.short_triggers);
+    jm["corrupt"] = Json::Value::UInt64(fm.corrupt);
+    jm["dropped"] = Json::Value::UInt64(fm.dropped);
+    jm["quiet"] = Json::Value::UInt64(fm.quiet);
+    Json::Value& js = jm["seconds"];
+    js["open"] = fm.open;
+    js["open_wait"] = fm.open_wait;
+    js["locate"] = fm.locate;
+    js["decode"] = fm.decode;
+    js["decode_wait"] = fm.decode_wait;
+    js["output"] = fm.output;
+    return jm;
+}
+
+void pcbro::RawSource::report_metrics()
+{
+    auto log = WireCell::Log::logger("pcbro");
+
+    const double wall = m_metrics->elapsed();
+    const auto tot = m_metrics->total();
+    const double mb = tot.bytes/1e6;
+    log->info("RawSource: {} of {} triggers from {:.1f} MB in {:.3f} s, "
+              "{:.1f} MB/s, {:.1f} triggers/s, {} corrupt, {} dropped, {} short, {} quiet",
+              tot.decoded, tot.triggers, mb, wall,
+              wall > 0 ? mb/wall : 0.0, wall > 0 ? tot.decoded/wall : 0.0,
+              tot.corrupt, tot.dropped, tot.short_triggers, tot.quiet);
+    log->info("RawSource: seconds open {:.3f} (waited {:.3f}), locate {:.3f}, "
+              "decode {:.3f} (waited {:.3f}), output {:.3f}",
+              tot.open, tot.open_wait, tot.locate,
+              tot.decode, tot.decode_wait, tot.output);
+
+    Json::Value jfiles = Json::arrayValue;
+    for (const auto& fm : m_metrics->files()) {
+        log->debug("RawSource: {}: {} bytes, {} triggers, {} decoded, {} corrupt, "
+                   "open {:.3f} s, locate {:.3f} s, decode {:.3f} s",
+                   fm.filename, fm.bytes, fm.triggers, fm.decoded, fm.corrupt,
+                   fm.open, fm.locate, fm.decode);
+        jfiles.append(metrics_json(fm));
+    }
+    if (m_metrics_file.empty()) {
+        return;
+    }
+    Json::Value jtop;
+    jtop["wall"] = wall;
+    jtop["total"] = metrics_json(tot);
+    jtop["files"] = jfiles;
+    std::ofstream out(m_metrics_file);
+    out << jtop;
+    if (! out) {
+        log->warn("RawSource: failed to write metrics file: {}", m_metrics_file);
+    }
+}
@@ -0,0 +1,133 @@
+#include "WireCellPcbro/SparseFrameSaver.h"
+
+#include "WireCellUtil/NamedFactory.h"
+#include "WireCellUtil/Logging.h"
+#include "WireCellUtil/cnpy.h"
+
+#include <algorithm>
+#include <map>
+
+WIRECELL_FACTORY(PcbroSparseFrameSaver, pcbro::SparseFrameSaver,
+                 WireCell::IConfigurable, WireCell::IFrameFilter)
+
+using namespace WireCell;
+
+pcbro::SparseFrameSaver::SparseFrameSaver()
+{
+}
+
+pcbro::SparseFrameSaver::~SparseFrameSaver()
+{
+}
+
+WireCell::Configuration pcbro::SparseFrameSaver::default_configuration() const
+{
+    WireCell::Configuration cfg;
+    cfg["filename"] = "";
+    // Trace tags to save, an empty tag saves all traces.
+    cfg["frame_tags"] = Json::arrayValue;
+    cfg["frame_tags"].append("");
+    // Samples of magnitude at most this are outside of any region.
+    cfg["threshold"] = m_threshold;
+    return cfg;
+}
+
+void pcbro::SparseFrameSaver::configure(const WireCell::Configuration& cfg)
+{
+    m_filename = get<std::string>(cfg, "filename", m_filename);
+    if (m_filename.empty()) {
+        throw std::runtime_error("pcbro::SparseFrameSaver: no output file name");
+    }
+    m_tags.clear();
+    for (const auto& jtag : cfg["frame_tags"]) {
+        m_tags.push_back(jtag.asString());
+    }
+    if (m_tags.empty()) {
+        m_tags.push_back("");
+    }
+    m_threshold = get<double>(cfg, "threshold", m_threshold);
+    m_narrays = 0;
+}
+
+template <typename T>
+void pcbro::SparseFrameSaver::save(const std::string& name, const T* data,
+                                   const std::vector<size_t>& shape)
+{
+    cnpy::npz_save(m_filename, name, data, shape, m_narrays ? "a" : "w");
+    ++m_narrays;
+}
+
+void pcbro::SparseFrameSaver::save_tag(const IFrame::pointer& frame, const std::string& tag)
+{
+    auto log = WireCell::Log::logger("pcbro");
+
+    auto traces = frame->traces();
+    std::vector<size_t> inds;
+    const auto& ftags = frame->frame_tags();
+    if (tag.empty() or std::find(ftags.begin(), ftags.end(), tag) != ftags.end()) {
+        for (size_t ind = 0; ind < traces->size(); ++ind) {
+            inds.push_back(ind);
+        }
+    }
+    else {
+        inds = frame->tagged_traces(tag);
+    }
+    if (inds.empty()) {
+        log->debug("SparseFrameSaver: no traces tagged \"{}\" in frame {}", tag, frame->ident());
+        return;
+    }
+
+    // Columns are the channels in order, ticks start at the first
+    // tbin of any trace.
+    std::map<int, int32_t> columns;
+    int tbinmin = traces->at(inds[0])->tbin(), tbinmax = tbinmin;
+    for (size_t ind : inds) {
+        auto trace = traces->at(ind);
+        columns[trace->channel()] = 0;
+        tbinmin = std::min(tbinmin, trace->tbin());
+        tbinmax = std::max(tbinmax, trace->tbin() + (int)trace->charge().size());
+    }
+    std::vector<int32_t> channels;
+    for (auto& [chan, col] : columns) {
+        col = channels.size();
+        channels.push_back(chan);
+    }
+
+    std::sort(inds.begin(), inds.end(), [&](size_t a, size_t b) {
+        auto ta = traces->at(a), tb = traces->at(b);
+        return std::make_pair(columns[ta->channel()], ta->tbin())
+            < std::make_pair(columns[tb->channel()], tb->tbin());
+    });
+    std::vector<roi_t> rois{{tbinmax - tbinmin, (int32_t)channels.size(), 0}};
+    std::vector<float> samples;
+    for (size_t ind : inds) {
+        auto trace = traces->at(ind);
+        const auto& charge = trace->charge();
+        add_rois(rois, samples, columns[trace->channel()], trace->tbin() - tbinmin,
+                 charge.data(), charge.size(), m_threshold);
+    }
+    rois[0].count = rois.size() - 1;
+
+    const std::string suffix = tag + "_" + std::to_string(frame->ident());
+    save("frame_" + suffix, samples.data(), {samples.size()});
+    save("roi_" + suffix, (const int32_t*) rois.data(), {rois.size(), 3});
+    save("channels_" + suffix, channels.data(), {channels.size()});
+    const double tickinfo[3] = {frame->time(), frame->tick(), (double)tbinmin};
+    save("tickinfo_" + suffix, tickinfo, {3});
+
+    log->debug("SparseFrameSaver: {} frame {} {} samples in {} regions of {} ticks, {} channels",
+               m_filename, suffix, samples.size(), rois.size() - 1,
+               tbinmax - tbinmin, channels.size());
+}
+
+bool pcbro::SparseFrameSaver::operator()(const input_pointer& in, output_pointer& out)
+{
+    out = in;
+    if (! in) {
+        return true;            // EOS
+    }
+    for (const auto& tag : m_tags) {
+        save_tag(in, tag);
+    }
+    return true;
+}
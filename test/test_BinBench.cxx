@@ -0,0 +1,253 @@
+// Benchmark decoding of synthesized raw .bin data.
+//
+// Usage: test_BinBench [-s megabytes] [-c corrupt_rate] [-f file.bin]
+//                      [-o results.json] [-k]
+//
+// A file of about the given size (default 10 MB) is synthesized with
+// a fraction of damaged package headers (default 0) and the rate, in
+// MB/s and triggers/s, of each stage of decoding it is measured:
+// reading, walking packages, indexing, make_trigger(), the stream
+// decoder and RawSource end to end in several modes.  Results are
+// logged and, with -o, written as JSON.  The file is removed unless
+// -k is given.  Sizes of many GB may be given as the file is
+// written a trigger at a time, but reading holds it all in memory.
+
+#include "WireCellPcbro/BinSynth.h"
+#include "WireCellPcbro/BinStream.h"
+#include "WireCellPcbro/RawSource.h"
+
+#include "WireCellIface/ITensorSet.h"
+
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+
+#include <chrono>
+#include <cstdio>
+#include <cstring>
+#include <unistd.h>
+
+using spdlog::info;
+
+struct Result {
+    std::string stage;
+    double seconds{0};
+    size_t triggers{0};
+};
+
+class Bench {
+public:
+    Bench(size_t nbytes) : m_nbytes(nbytes) { }
+
+    // Time func which returns the number of triggers it saw.
+    template<typename Func>
+    void operator()(const std::string& stage, Func func) {
+        auto t0 = std::chrono::steady_clock::now();
+        const size_t ntrig = func();
+        const double secs = std::chrono::duration<double>(std::chrono::steady_clock::now() - t0).count();
+        info("{:>20}: {:8.3f} s {:8.1f} MB/s {:8.1f} triggers/s ({} triggers)",
+             stage, secs, 1e-6*m_nbytes/secs, ntrig/secs, ntrig);
+        m_results.push_back(Result{stage, secs, ntrig});
+    }
+
+    Json::Value json() const {
+        Json::Value jr = Json::arrayValue;
+        for (const auto& res : m_results) {
+            Json::Value one;
+            one["stage"] = res.stage;
+            one["seconds"] = res.seconds;
+            one["triggers"] = Json::Value::UInt64(res.triggers);
+            one["MBps"] = 1e-6*m_nbytes/res.seconds;
+            one["triggers_per_second"] = res.triggers/res.seconds;
+            jr.append(one);
+        }
+        return jr;
+    }
+
+private:
+    size_t m_nbytes;
+    std::vector<Result> m_results;
+};
+
+size_t run_source(const std::string& fname, Json::Value extra)
+{
+    pcbro::RawSource rawsrc;
+    auto cfg = rawsrc.default_configuration();
+    cfg["filename"] = fname;
+    cfg["triggers"] = "1000000000";
+    for (const auto& key : extra.getMemberNames()) {
+        cfg[key] = extra[key];
+    }
+    rawsrc.configure(cfg);
+    size_t ntrig = 0;
+    while (true) {
+        WireCell::ITensorSet::pointer ts = nullptr;
+        if (! rawsrc(ts)) {
+            break;
+        }
+        if (ts) {
+            ++ntrig;
+        }
+    }
+    return ntrig;
+}
+
+int main(int argc, char* argv[])
+{
+    WireCell::Log::add_stdout(true, "info");
+
+    double megabytes = 10;
+    pcbro::SynthConfig cfg;
+    // names must parse as .bin file paths
+    std::string fname = "/tmp/WIB00step18_FEMB_B8_1590484059"
+        + std::to_string(10 + ::getpid() % 90) + ".bin";
+    std::string output = "";
+    bool keep = false;
+    for (int ind=1; ind<argc; ++ind) {
+        std::string arg = argv[ind];
+        if (arg == "-k") {
+            keep = true;
+            continue;
+        }
+        if (ind+1 == argc) {
+            throw std::runtime_error("missing value for " + arg);
+        }
+        std::string val = argv[++ind];
+        if (arg == "-s") { megabytes = std::stod(val); }
+        else if (arg == "-c") { cfg.corrupt_rate = std::stod(val); }
+        else if (arg == "-f") { fname = val; }
+        else if (arg == "-o") { output = val; }
+        else {
+            throw std::runtime_error("unknown option " + arg);
+        }
+    }
+
+    // Size the file by the bytes of one trigger.
+    {
+        auto one = cfg;
+        one.triggers = 1;
+        const size_t nbytes = 2*pcbro::synth_raw_data(one).size();
+        cfg.triggers = std::max<size_t>(1, 1e6*megabytes/nbytes);
+    }
+
+    pcbro::SynthTruth truth;
+    auto t0 = std::chrono::steady_clock::now();
+    truth = pcbro::synth_file(fname, cfg);
+    const size_t nbytes = 2*truth.nwords;
+    {
+        const double secs = std::chrono::duration<double>(std::chrono::steady_clock::now() - t0).count();
+        info("{}: {} triggers, {:.1f} MB, {} damaged headers, written at {:.1f} MB/s",
+             fname, cfg.triggers, 1e-6*nbytes, truth.damaged.size(), 1e-6*nbytes/secs);
+    }
+    const size_t nwhole = cfg.triggers - truth.damaged_triggers.size();
+
+    Bench bench(nbytes);
+    pcbro::raw_data_t rd;
+    bench("read_raw_data", [&]() {
+        rd = pcbro::read_raw_data(fname);
+        return 0;
+    });
+
+    bench("seek_package", [&]() {
+        size_t npkg = 0;
+        auto beg = rd.begin();
+        try {
+            while (beg != rd.end()) {
+                beg = pcbro::seek_package(beg, rd.end());
+                ++npkg;
+            }
+        }
+        catch (const std::runtime_error& err) { }
+        info("{} packages walked", npkg);
+        return 0;
+    });
+
+    bench("index_raw_data", [&]() {
+        auto ri = pcbro::index_raw_data(rd.begin(), rd.end(), cfg.package_size, true);
+        return ri.triggers.size();
+    });
+
+    bench("make_trigger", [&]() {
+        size_t ntrig = 0;
+        pcbro::block128_t block;
+        auto beg = rd.begin();
+        try {
+            while (true) {
+                beg = pcbro::make_trigger(block, beg, rd.end(), cfg.package_size);
+                ++ntrig;
+            }
+        }
+        catch (const std::exception& err) { }
+        return ntrig;
+    });
+
+    bench("gather+unpack", [&]() {
+        size_t ntrig = 0;
+        pcbro::trigger_links_t links;
+        std::vector<float> frame;
+        int coff[128];
+        for (int ec=0; ec<128; ++ec) { coff[ec] = ec; }
+        auto beg = rd.begin();
+        try {
+            while (true) {
+                beg = pcbro::gather_trigger(links, beg, rd.end(), cfg.package_size);
+                const size_t nticks = pcbro::trigger_ticks(links);
+                frame.resize(128*nticks);
+                pcbro::unpack_trigger(links, 0, nticks, frame.data(), 128, coff);
+                ++ntrig;
+            }
+        }
+        catch (const std::exception& err) { }
+        return ntrig;
+    });
+    rd.clear();
+    rd.shrink_to_fit();
+
+    bench("BinStreamDecoder", [&]() {
+        size_t ntrig = 0;
+        pcbro::BinStreamDecoder bsd(fname, cfg.package_size);
+        pcbro::block128_t block;
+        try {
+            while (bsd.next(block)) {
+                ++ntrig;
+            }
+        }
+        catch (const std::runtime_error& err) { }
+        return ntrig;
+    });
+
+    Json::Value modes;
+    modes["RawSource"] = Json::objectValue;
+    modes["RawSource workers=2"]["workers"] = 2;
+    modes["RawSource stream"]["stream"] = true;
+    modes["RawSource binstream"]["engine"] = "binstream";
+    modes["RawSource int16"]["dtype"] = "int16";
+    if (cfg.corrupt_rate > 0) {
+        modes["RawSource resync"]["resync"] = true;
+    }
+    for (const auto& mode : modes.getMemberNames()) {
+        bench(mode, [&]() {
+            const size_t ntrig = run_source(fname, modes[mode]);
+            if (truth.damaged.empty()) {
+                Assert(ntrig == cfg.triggers);
+            }
+            else if (modes[mode].isMember("resync")) {
+                Assert(ntrig == nwhole);
+            }
+            return ntrig;
+        });
+    }
+
+    if (! output.empty()) {
+        Json::Value jout;
+        jout["file"] = fname;
+        jout["bytes"] = Json::Value::UInt64(nbytes);
+        jout["triggers"] = Json::Value::UInt64(cfg.triggers);
+        jout["damaged"] = Json::Value::UInt64(truth.damaged.size());
+        jout["results"] = bench.json();
+        std::ofstream(output) << jout;
+    }
+    if (! keep) {
+        std::remove(fname.c_str());
+    }
+    return 0;
+}
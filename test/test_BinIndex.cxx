@@ -0,0 +1,220 @@
+// Check the package/trigger index of raw .bin data.
+//
+// Usage: test_BinIndex [file.bin]
+//
+// With no file, raw data is synthesized.  Each trigger decoded by
+// jumping to its indexed offset must equal the one reached by
+// decoding sequentially, and the sidecar index must round trip.
+// With resync, only the triggers holding bad data may be lost.
+
+#include "WireCellPcbro/BinFile.h"
+#include "WireCellUtil/Logging.h"
+
+#include <chrono>
+#include <random>
+#include <sstream>
+#include <cstdio>
+
+using spdlog::info;
+
+// Return host order raw data of ntrig triggers of 4 links, each with
+// nticks 32-channel samples, packed into packages.
+pcbro::raw_data_t make_raw(int ntrig, int nticks,
+                           size_t package_size = pcbro::default_package_size)
+{
+    std::mt19937 rng(1234);
+    pcbro::raw_data_t rd;
+    uint32_t count = 1;
+    const size_t payload = package_size - 8;
+    for (int itrig=0; itrig<ntrig; ++itrig) {
+        for (int ilink=0; ilink<4; ++ilink) {
+            pcbro::raw_data_t link;
+            for (int itick=0; itick<nticks; ++itick) {
+                link.push_back(0xface);
+                for (int ind=0; ind<24; ++ind) {
+                    link.push_back((rng() & 0xffff) | 1);
+                }
+            }
+            // a link ends with a short package
+            if (link.size() % payload == 0) {
+                throw std::logic_error("link fills whole packages");
+            }
+            for (size_t beg = 0; beg < link.size(); beg += payload) {
+                size_t end = std::min(beg + payload, link.size());
+                rd.insert(rd.end(), {(uint16_t)(count>>16), (uint16_t)(count&0xffff),
+                        0, 0, 0x1234, 0x5678, 0x9abc, 0xdef0});
+                rd.insert(rd.end(), link.begin() + beg, link.begin() + end);
+                ++count;
+            }
+        }
+    }
+    // What read_raw_data() leaves at the end of an even sized file.
+    rd.push_back(0);
+    return rd;
+}
+
+void check(pcbro::raw_data_t& rd)
+{
+    auto t0 = std::chrono::steady_clock::now();
+    auto ri = pcbro::index_raw_data(rd.begin(), rd.end());
+    auto t1 = std::chrono::steady_clock::now();
+    info("index: {} words, {} packages, {} triggers, {} breaks in {:.3f} s",
+         ri.nwords, ri.packages.size(), ri.triggers.size(), ri.breaks.size(),
+         std::chrono::duration<double>(t1-t0).count());
+
+    // sequential decode
+    std::vector<pcbro::block128_t> blocks;
+    auto beg = rd.begin();
+    while (true) {
+        pcbro::block128_t block;
+        try {
+            beg = pcbro::make_trigger(block, beg, rd.end());
+        }
+        catch (const std::range_error& err) {
+            break;
+        }
+        blocks.push_back(block);
+    }
+    auto t2 = std::chrono::steady_clock::now();
+    info("sequential decode: {} triggers in {:.3f} s",
+         blocks.size(), std::chrono::duration<double>(t2-t1).count());
+    if (blocks.size() != ri.triggers.size()) {
+        throw std::runtime_error("index and decode disagree on number of triggers");
+    }
+
+    // random access decode, backwards
+    for (size_t ind = ri.triggers.size(); ind-- > 0; ) {
+        const auto& ti = ri.triggers[ind];
+        pcbro::block128_t block;
+        auto next = pcbro::make_trigger(block, rd.begin() + ti.begin, rd.end());
+        if ((size_t)std::distance(rd.begin(), next) != ti.end) {
+            throw std::runtime_error("indexed trigger end differs");
+        }
+        if (block.rows() != blocks[ind].rows() or !(block == blocks[ind]).all()) {
+            throw std::runtime_error("indexed trigger decode differs");
+        }
+    }
+
+    std::stringstream ss;
+    pcbro::write_raw_index(ss, ri);
+    auto ri2 = pcbro::read_raw_index(ss);
+    if (ri2.packages.size() != ri.packages.size()
+        or ri2.triggers.size() != ri.triggers.size()
+        or ri2.triggers.back().begin != ri.triggers.back().begin
+        or ri2.packages.back().count != ri.packages.back().count) {
+        throw std::runtime_error("index does not round trip");
+    }
+}
+
+// Check resync index of bad, made from the good rd of index ri by
+// damaging the triggers lost.
+void check_resync(pcbro::raw_data_t& rd, const pcbro::RawIndex& ri,
+                  pcbro::raw_data_t& bad, const std::vector<size_t>& lost)
+{
+    auto ris = pcbro::index_raw_data(bad.begin(), bad.end(),
+                                     pcbro::default_package_size, true);
+    info("resync: {} triggers, {} breaks, {} dropped",
+         ris.triggers.size(), ris.breaks.size(), ris.dropped);
+    if (ris.breaks.size() != 1 or ris.resumes.size() != 1
+        or ris.dropped != lost.size()
+        or ris.triggers.size() + lost.size() != ri.triggers.size()) {
+        throw std::runtime_error("resync lost the wrong number of triggers");
+    }
+    size_t iris = 0;
+    for (size_t iri = 0; iri < ri.triggers.size(); ++iri) {
+        if (std::find(lost.begin(), lost.end(), iri) != lost.end()) {
+            continue;
+        }
+        const auto& want = ri.triggers[iri];
+        const auto& got = ris.triggers[iris++];
+        if (got.begin != want.begin or got.end != want.end) {
+            throw std::runtime_error("resync trigger offsets differ");
+        }
+        pcbro::block128_t bgot, bwant;
+        pcbro::make_trigger(bgot, bad.begin() + got.begin, bad.end());
+        pcbro::make_trigger(bwant, rd.begin() + want.begin, rd.end());
+        if (bgot.rows() != bwant.rows() or !(bgot == bwant).all()) {
+            throw std::runtime_error("resync trigger decode differs");
+        }
+    }
+
+    std::stringstream ss;
+    pcbro::write_raw_index(ss, ris);
+    auto ris2 = pcbro::read_raw_index(ss);
+    if (! ris2.resync or ris2.dropped != ris.dropped or ris2.resumes != ris.resumes) {
+        throw std::runtime_error("resync index does not round trip");
+    }
+}
+
+int main(int argc, char* argv[])
+{
+    WireCell::Log::add_stdout(true, "info");
+
+    if (argc > 1) {
+        std::string fname = argv[1];
+        auto rd = pcbro::read_raw_data(fname);
+        check(rd);
+        auto ri = pcbro::sidecar_raw_index(fname, rd);
+        info("sidecar: {}", pcbro::raw_index_path(fname));
+        return 0;
+    }
+
+    auto rd = make_raw(20, 1000);
+    auto ri = pcbro::index_raw_data(rd.begin(), rd.end());
+    if (ri.triggers.size() != 20 or !ri.breaks.empty()) {
+        throw std::runtime_error("wrong number of triggers indexed");
+    }
+    check(rd);
+
+    // A corrupt header part way through stops the index there.
+    auto bad = rd;
+    bad[ri.packages[100].offset + 2] = 0xdead;
+    auto rib = pcbro::index_raw_data(bad.begin(), bad.end());
+    info("corrupt: {} triggers, breaks at {}", rib.triggers.size(),
+         rib.breaks.empty() ? 0 : rib.breaks[0]);
+    if (rib.breaks.empty()) {
+        throw std::runtime_error("corruption not found");
+    }
+
+    // With resync, a corrupt header loses only its trigger and
+    // garbage over several triggers loses only those.
+    size_t ibad = 0;
+    while (ri.triggers[ibad].end <= ri.packages[100].offset) {
+        ++ibad;
+    }
+    check_resync(rd, ri, bad, {ibad});
+    auto junk = rd;
+    {
+        std::mt19937 rng(4321);
+        const size_t jbeg = (ri.triggers[5].begin + ri.triggers[5].end)/2;
+        const size_t jend = (ri.triggers[8].begin + ri.triggers[8].end)/2;
+        for (size_t ind = jbeg; ind < jend; ++ind) {
+            junk[ind] = rng() | 1;
+        }
+    }
+    check_resync(rd, ri, junk, {5, 6, 7, 8});
+
+    // The sidecar is written once and then reused.
+    std::string fname = "test_BinIndex.bin";
+    {
+        std::ofstream out(fname, std::ios_base::out | std::ios_base::binary);
+        for (size_t ind=0; ind+1 < rd.size(); ++ind) {
+            char buf[2] = {(char)(rd[ind]>>8), (char)(rd[ind]&0xff)};
+            out.write(buf, 2);
+        }
+    }
+    std::remove(pcbro::raw_index_path(fname).c_str());
+    auto frd = pcbro::read_raw_data(fname);
+    auto ri1 = pcbro::sidecar_raw_index(fname, frd);
+    std::ifstream side(pcbro::raw_index_path(fname));
+    if (!side or ri1.triggers.size() != 20) {
+        throw std::runtime_error("sidecar index not written");
+    }
+    auto ri2 = pcbro::sidecar_raw_index(fname, frd);
+    if (ri2.triggers.size() != 20) {
+        throw std::runtime_error("sidecar index not reused");
+    }
+    std::remove(pcbro::raw_index_path(fname).c_str());
+    std::remove(fname.c_str());
+    return 0;
+}
@@ -0,0 +1,107 @@
+// Check that synthesized raw data decodes to its known content.
+//
+// Usage: test_BinSynth
+//
+// Triggers are decoded with make_trigger(), BinStreamDecoder and the
+// index, with and without zero padded packages and short links.
+// With damaged headers, triggers found by resync must be whole.
+
+#include "WireCellPcbro/BinSynth.h"
+#include "WireCellPcbro/BinStream.h"
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+
+#include <sstream>
+
+using spdlog::info;
+
+void check(const pcbro::SynthConfig& cfg)
+{
+    pcbro::SynthTruth truth;
+    auto rd = pcbro::synth_raw_data(cfg, &truth);
+    Assert(rd.size() == truth.nwords);
+    Assert(truth.triggers.size() == cfg.triggers);
+    rd.push_back(0);            // as read_raw_data()
+
+    auto beg = rd.begin();
+    for (size_t itrig=0; itrig<cfg.triggers; ++itrig) {
+        Assert((size_t)std::distance(rd.begin(), beg) == truth.triggers[itrig]);
+        pcbro::block128_t block;
+        beg = pcbro::make_trigger(block, beg, rd.end(), cfg.package_size);
+        Assert((block == pcbro::synth_block(cfg, itrig)).all());
+    }
+
+    std::stringstream ss;
+    pcbro::write_raw_data(ss, rd.begin(), rd.end()-1);
+    pcbro::BinStreamDecoder bsd(ss, cfg.package_size);
+    pcbro::block128_t block;
+    size_t ntrig = 0;
+    while (bsd.next(block)) {
+        Assert((block == pcbro::synth_block(cfg, ntrig)).all());
+        ++ntrig;
+    }
+    Assert(ntrig == cfg.triggers);
+
+    auto ri = pcbro::index_raw_data(rd.begin(), rd.end(), cfg.package_size);
+    Assert(ri.triggers.size() == cfg.triggers);
+    for (size_t itrig=0; itrig<cfg.triggers; ++itrig) {
+        Assert(ri.triggers[itrig].begin == truth.triggers[itrig]);
+    }
+    info("{} triggers of {} ticks, {} short, zero pad {}: {} words",
+         cfg.triggers, cfg.nticks, cfg.short_ticks, cfg.zero_pad, rd.size());
+}
+
+void check_corrupt(const pcbro::SynthConfig& cfg)
+{
+    pcbro::SynthTruth truth;
+    auto rd = pcbro::synth_raw_data(cfg, &truth);
+    rd.push_back(0);
+    Assert(! truth.damaged.empty());
+    for (auto off : truth.damaged) {
+        Assert(rd[off+3] != 0);
+    }
+
+    // Every trigger found is whole and in place.
+    auto ri = pcbro::index_raw_data(rd.begin(), rd.end(), cfg.package_size, true);
+    size_t nfound = 0;
+    for (const auto& ti : ri.triggers) {
+        auto it = std::find(truth.triggers.begin(), truth.triggers.end(), ti.begin);
+        Assert(it != truth.triggers.end());
+        const size_t itrig = std::distance(truth.triggers.begin(), it);
+        pcbro::block128_t block;
+        pcbro::make_trigger(block, rd.begin() + ti.begin, rd.end(), cfg.package_size);
+        Assert((block == pcbro::synth_block(cfg, itrig)).all());
+        ++nfound;
+    }
+    Assert(nfound + truth.damaged_triggers.size() <= cfg.triggers);
+    info("{} damaged headers in {} triggers, {} triggers found, {} breaks, {} dropped",
+         truth.damaged.size(), truth.damaged_triggers.size(), nfound,
+         ri.breaks.size(), ri.dropped);
+}
+
+int main()
+{
+    WireCell::Log::add_stdout(true, "info");
+
+    pcbro::SynthConfig cfg;
+    check(cfg);
+    cfg.zero_pad = false;
+    check(cfg);
+    cfg.zero_pad = true;
+    cfg.short_ticks = 3;
+    cfg.nticks = 1000;
+    check(cfg);
+
+    // Links filling whole packages end with an empty one.
+    cfg.short_ticks = 0;
+    cfg.package_size = 8 + 25*4;
+    cfg.zero_pad = false;
+    cfg.nticks = 40;
+    check(cfg);
+
+    cfg = pcbro::SynthConfig();
+    cfg.triggers = 100;
+    cfg.corrupt_rate = 0.01;
+    check_corrupt(cfg);
+    return 0;
+}
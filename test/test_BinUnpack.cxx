@@ -0,0 +1,132 @@
+// Check that gathering and unpacking a trigger directly to a
+// transposed, channel mapped layout matches make_trigger() and time
+// both against make_trigger() followed by a copy.
+//
+// Usage: test_BinUnpack [file.bin]
+//
+// With no file, raw data is synthesized with links of differing
+// lengths.
+
+#include "WireCellPcbro/BinFile.h"
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+
+#include <chrono>
+#include <random>
+#include <numeric>
+
+using spdlog::info;
+
+// Return host order raw data of ntrig triggers of 4 links.  Link
+// ilink has nticks-ilink 32-channel samples packed into packages.
+pcbro::raw_data_t make_raw(int ntrig, int nticks,
+                           size_t package_size = pcbro::default_package_size)
+{
+    std::mt19937 rng(1234);
+    pcbro::raw_data_t rd;
+    uint32_t count = 1;
+    const size_t payload = package_size - 8;
+    for (int itrig=0; itrig<ntrig; ++itrig) {
+        for (int ilink=0; ilink<4; ++ilink) {
+            pcbro::raw_data_t link;
+            for (int itick=0; itick<nticks-ilink; ++itick) {
+                link.push_back(0xface);
+                for (int ind=0; ind<24; ++ind) {
+                    link.push_back((rng() & 0xffff) | 1);
+                }
+            }
+            for (size_t beg = 0; beg < link.size(); beg += payload) {
+                size_t end = std::min(beg + payload, link.size());
+                rd.insert(rd.end(), {(uint16_t)(count>>16), (uint16_t)(count&0xffff),
+                        0, 0, 0x1234, 0x5678, 0x9abc, 0xdef0});
+                rd.insert(rd.end(), link.begin() + beg, link.begin() + end);
+                ++count;
+            }
+        }
+    }
+    rd.push_back(0);
+    return rd;
+}
+
+// An arbitrary permutation of channels, reversed.
+int mapped(int ec) { return 127 - ec; }
+
+int main(int argc, char* argv[])
+{
+    pcbro::raw_data_t rd;
+    if (argc > 1) {
+        rd = pcbro::read_raw_data(std::string(argv[1]));
+    }
+    else {
+        rd = make_raw(20, 1000);
+    }
+
+    // Reference: make_trigger() then copy with transpose and map.
+    auto t0 = std::chrono::steady_clock::now();
+    std::vector<std::vector<float>> want;
+    auto beg = rd.begin();
+    while (true) {
+        pcbro::block128_t block;
+        try {
+            beg = pcbro::make_trigger(block, beg, rd.end());
+        }
+        catch (const std::range_error& err) {
+            break;
+        }
+        const size_t nticks = block.rows();
+        std::vector<float> frame(nticks*128);
+        for (size_t ec = 0; ec < 128; ++ec) {
+            for (size_t tick = 0; tick < nticks; ++tick) {
+                frame[tick*128 + mapped(ec)] = block(tick, ec);
+            }
+        }
+        want.push_back(frame);
+    }
+    auto t1 = std::chrono::steady_clock::now();
+    Assert(want.size() > 0);
+
+    // Fused: gather links to reused buffers and unpack in place.
+    int coff[128];
+    for (int ec = 0; ec < 128; ++ec) {
+        coff[ec] = mapped(ec);
+    }
+    pcbro::trigger_links_t links;
+    std::vector<std::vector<float>> got;
+    beg = rd.begin();
+    while (true) {
+        try {
+            beg = pcbro::gather_trigger(links, beg, rd.end());
+        }
+        catch (const std::range_error& err) {
+            break;
+        }
+        const size_t nticks = pcbro::trigger_ticks(links);
+        std::vector<float> frame(nticks*128, -1);
+        pcbro::unpack_trigger(links, 0, nticks, frame.data(), 128, coff);
+        got.push_back(frame);
+    }
+    auto t2 = std::chrono::steady_clock::now();
+
+    Assert(got.size() == want.size());
+    for (size_t ind = 0; ind < got.size(); ++ind) {
+        Assert(got[ind] == want[ind]);
+    }
+
+    // The block layout of make_trigger() itself.
+    beg = rd.begin();
+    pcbro::block128_t block;
+    pcbro::make_trigger(block, beg, rd.end());
+    pcbro::gather_trigger(links, beg, rd.end());
+    pcbro::block128_t same(pcbro::trigger_ticks(links), 128);
+    for (int ec = 0; ec < 128; ++ec) {
+        coff[ec] = ec*same.rows();
+    }
+    pcbro::unpack_trigger(links, 0, same.rows(), same.data(), 1, coff);
+    Assert((same == block).all());
+
+    const double dt1 = std::chrono::duration<double>(t1-t0).count();
+    const double dt2 = std::chrono::duration<double>(t2-t1).count();
+    info("{} triggers: make_trigger and copy {:.3f} s, fused {:.3f} s, {:.1f}x",
+         want.size(), dt1, dt2, dt1/dt2);
+    return 0;
+}
@@ -0,0 +1,123 @@
+// Check that reading triggers through a BinWindow matches slurping.
+//
+// Usage: test_BinWindow [file.bin [window_bytes]]
+//
+// With no file, raw data is synthesized to a temporary file.
+
+#include "WireCellPcbro/BinWindow.h"
+#include "WireCellUtil/Logging.h"
+
+#include <chrono>
+#include <random>
+#include <cstdio>
+
+using spdlog::info;
+
+// Write ntrig triggers of 4 links, each with nticks 32-channel
+// samples, packed into packages as big-endian words.
+void make_file(const std::string& fname, int ntrig, int nticks,
+               size_t package_size = pcbro::default_package_size)
+{
+    std::mt19937 rng(1234);
+    pcbro::raw_data_t rd;
+    uint32_t count = 1;
+    const size_t payload = package_size - 8;
+    for (int itrig=0; itrig<ntrig; ++itrig) {
+        for (int ilink=0; ilink<4; ++ilink) {
+            pcbro::raw_data_t link;
+            for (int itick=0; itick<nticks; ++itick) {
+                link.push_back(0xface);
+                for (int ind=0; ind<24; ++ind) {
+                    link.push_back((rng() & 0xffff) | 1);
+                }
+            }
+            for (size_t beg = 0; beg < link.size(); beg += payload) {
+                size_t end = std::min(beg + payload, link.size());
+                rd.insert(rd.end(), {(uint16_t)(count>>16), (uint16_t)(count&0xffff),
+                        0, 0, 0x1234, 0x5678, 0x9abc, 0xdef0});
+                rd.insert(rd.end(), link.begin() + beg, link.begin() + end);
+                ++count;
+            }
+        }
+    }
+    std::ofstream out(fname, std::ios_base::out | std::ios_base::binary);
+    for (auto w : rd) {
+        char buf[2] = {(char)(w>>8), (char)(w&0xff)};
+        out.write(buf, 2);
+    }
+}
+
+void check(const std::string& fname, size_t window_bytes)
+{
+    auto t0 = std::chrono::steady_clock::now();
+    auto rd = pcbro::read_raw_data(fname);
+    std::vector<pcbro::block128_t> blocks;
+    auto beg = rd.begin();
+    while (true) {
+        pcbro::block128_t block;
+        try {
+            beg = pcbro::make_trigger(block, beg, rd.end());
+        }
+        catch (const std::range_error& err) {
+            break;
+        }
+        blocks.push_back(block);
+    }
+    auto t1 = std::chrono::steady_clock::now();
+    info("slurp: {} triggers, {} MB in {:.3f} s", blocks.size(),
+         2e-6*rd.size(), std::chrono::duration<double>(t1-t0).count());
+
+    pcbro::BinWindow bw(fname, window_bytes);
+    size_t ntrig = 0;
+    while (true) {
+        pcbro::block128_t block;
+        if (! bw.next(block)) {
+            break;
+        }
+        if (ntrig >= blocks.size()) {
+            throw std::runtime_error("window gives too many triggers");
+        }
+        const auto& want = blocks[ntrig];
+        if (block.rows() != want.rows() or !(block == want).all()) {
+            throw std::runtime_error("window trigger differs");
+        }
+        ++ntrig;
+    }
+    auto t2 = std::chrono::steady_clock::now();
+    info("window: {} triggers, peak {} MB of {} MB window in {:.3f} s",
+         ntrig, 2e-6*bw.peak_words(), 1e-6*window_bytes,
+         std::chrono::duration<double>(t2-t1).count());
+    if (ntrig != blocks.size()) {
+        throw std::runtime_error("window gives too few triggers");
+    }
+    if (2*bw.peak_words() > window_bytes + pcbro::raw_read_chunk + 2) {
+        throw std::runtime_error("window exceeded its bound");
+    }
+
+    pcbro::BinWindow bs(fname, window_bytes);
+    size_t nskip = 0;
+    while (bs.skip()) {
+        ++nskip;
+    }
+    if (nskip != blocks.size()) {
+        throw std::runtime_error("skipping gives wrong number of triggers");
+    }
+}
+
+int main(int argc, char* argv[])
+{
+    WireCell::Log::add_stdout(true, "info");
+
+    if (argc > 1) {
+        size_t window_bytes = argc > 2 ? std::stoul(argv[2]) : pcbro::default_window_bytes;
+        check(argv[1], window_bytes);
+        return 0;
+    }
+
+    std::string fname = "test_BinWindow.bin";
+    make_file(fname, 30, 2000);
+    check(fname, 4<<20);
+    check(fname, pcbro::default_window_bytes);
+    std::remove(fname.c_str());
+    return 0;
+}
@@ -0,0 +1,170 @@
+// Check that int16 frames from RawSource written by RawNpzSink, as
+// int16 or packed to 12 bits and with the duplicated induction plane
+// aliased, read back to the float frames of RawSource.
+//
+// Usage: test_RawNpzSink [file.bin]
+//
+// With no file, raw data is synthesized to a temporary file.
+
+#include "WireCellPcbro/RawSource.h"
+#include "WireCellPcbro/RawNpzSink.h"
+
+#include "WireCellIface/ITensorSet.h"
+
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+#include "WireCellUtil/cnpy.h"
+
+#include <random>
+#include <cstdio>
+#include <unistd.h>
+
+using spdlog::info;
+
+// Write ntrig triggers of 4 links, each with nticks 32-channel
+// samples, packed into packages as big-endian words.
+void make_file(const std::string& fname, int ntrig, int nticks,
+               size_t package_size = pcbro::default_package_size)
+{
+    std::mt19937 rng(1234);
+    pcbro::raw_data_t rd;
+    uint32_t count = 1;
+    const size_t payload = package_size - 8;
+    for (int itrig=0; itrig<ntrig; ++itrig) {
+        for (int ilink=0; ilink<4; ++ilink) {
+            pcbro::raw_data_t link;
+            for (int itick=0; itick<nticks; ++itick) {
+                link.push_back(0xface);
+                for (int ind=0; ind<24; ++ind) {
+                    link.push_back((rng() & 0xffff) | 1);
+                }
+            }
+            for (size_t beg = 0; beg < link.size(); beg += payload) {
+                size_t end = std::min(beg + payload, link.size());
+                rd.insert(rd.end(), {(uint16_t)(count>>16), (uint16_t)(count&0xffff),
+                        0, 0, 0x1234, 0x5678, 0x9abc, 0xdef0});
+                rd.insert(rd.end(), link.begin() + beg, link.begin() + end);
+                ++count;
+            }
+        }
+    }
+    std::ofstream out(fname, std::ios_base::out | std::ios_base::binary);
+    for (auto w : rd) {
+        char buf[2] = {(char)(w>>8), (char)(w&0xff)};
+        out.write(buf, 2);
+    }
+}
+
+// Run the source, giving each tensor set to the sink if any, and
+// return the frames as float.
+std::vector<std::vector<float>> run(const std::string& fname, const std::string& dtype,
+                                    pcbro::RawNpzSink* sink = nullptr)
+{
+    pcbro::RawSource rawsrc;
+    auto cfg = rawsrc.default_configuration();
+    cfg["filename"] = fname;
+    cfg["start_trigger"] = "1";
+    cfg["triggers"] = "5";
+    cfg["dupind"] = true;
+    cfg["dtype"] = dtype;
+    rawsrc.configure(cfg);
+
+    std::vector<std::vector<float>> ret;
+    while (true) {
+        WireCell::ITensorSet::pointer ts = nullptr;
+        if (! rawsrc(ts)) {
+            break;
+        }
+        if (sink) {
+            (*sink)(ts);
+        }
+        if (!ts) {
+            continue;
+        }
+        auto frame = ts->tensors()->at(0);
+        const size_t n = frame->shape()[0] * frame->shape()[1];
+        if (dtype == "int16") {
+            const int16_t* data = (const int16_t*)frame->data();
+            ret.emplace_back(data, data + n);
+        }
+        else {
+            const float* data = (const float*)frame->data();
+            ret.emplace_back(data, data + n);
+        }
+    }
+    return ret;
+}
+
+int main(int argc, char* argv[])
+{
+    // names must parse as .bin file paths
+    const std::string stem = "/tmp/WIB00step18_FEMB_B8_1590484059"
+        + std::to_string(10 + ::getpid() % 90);
+    std::string fname = stem + ".bin";
+    if (argc > 1) {
+        fname = argv[1];
+    }
+    else {
+        make_file(fname, 6, 700);
+    }
+
+    uint8_t packed[3];
+    const int16_t pair[2] = {0xabc, 0x123};
+    pcbro::pack12(pair, 2, packed);
+    int16_t unpacked[2];
+    pcbro::unpack12(packed, 2, unpacked);
+    Assert(unpacked[0] == pair[0] and unpacked[1] == pair[1]);
+
+    auto want = run(fname, "float");
+    Assert(want.size() == 5);
+
+    for (std::string format : {"int16", "packed12"}) {
+        const std::string npzfile = stem + "_" + format + ".npz";
+        pcbro::RawNpzSink sink;
+        auto cfg = sink.default_configuration();
+        cfg["filename"] = npzfile;
+        cfg["format"] = format;
+        sink.configure(cfg);
+        auto got = run(fname, "int16", &sink);
+        Assert(got.size() == want.size());
+
+        auto npz = cnpy::npz_load(npzfile);
+        Assert(npz.size() == 4*want.size());
+        for (size_t ind = 0; ind < want.size(); ++ind) {
+            // the tag is empty
+            const std::string suffix = "__" + std::to_string(ind+1);
+            auto& frame = npz["frame" + suffix];
+            auto& alias = npz["alias" + suffix];
+            auto& chans = npz["channels" + suffix];
+            Assert(alias.shape.size() == 2 and alias.shape[0] == 1 and alias.shape[1] == 3);
+            const int32_t* adat = alias.data<int32_t>();
+            Assert(adat[0] == 128 and adat[1] == 64 and adat[2] == 64);
+            Assert(chans.num_vals == 192);
+
+            const size_t nticks = frame.shape[0];
+            std::vector<int16_t> adc(nticks*128);
+            if (format == "packed12") {
+                Assert(frame.word_size == 1 and frame.shape[1] == 192);
+                pcbro::unpack12(frame.data<uint8_t>(), adc.size(), adc.data());
+            }
+            else {
+                Assert(frame.word_size == 2 and frame.shape[1] == 128);
+                std::copy(frame.data<int16_t>(), frame.data<int16_t>() + adc.size(), adc.begin());
+            }
+            Assert(want[ind].size() == nticks*192);
+            for (size_t tick = 0; tick < nticks; ++tick) {
+                for (size_t row = 0; row < 192; ++row) {
+                    const size_t src = row < 128 ? row : row - 64;
+                    Assert(want[ind][tick*192 + row] == adc[tick*128 + src]);
+                }
+            }
+        }
+        info("{}: {} frames", npzfile, want.size());
+        std::remove(npzfile.c_str());
+    }
+
+    if (argc == 1) {
+        std::remove(fname.c_str());
+    }
+    return 0;
+}
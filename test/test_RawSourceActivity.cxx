@@ -0,0 +1,95 @@
+// Check that RawSource finds triggers with raw activity and drops or
+// tags the quiet ones.
+//
+// Usage: test_RawSourceActivity
+//
+// Raw data with a pulse on all channels of every third trigger is
+// synthesized to a temporary file.
+
+#include "WireCellPcbro/RawSource.h"
+#include "WireCellPcbro/BinSynth.h"
+
+#include "WireCellIface/ITensorSet.h"
+
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+
+#include <cstdio>
+#include <unistd.h>
+
+using spdlog::info;
+
+// Return the idents of output triggers with their "active" flag.
+std::vector<std::pair<int, bool>> run(const std::string& fname, const std::string& quiet,
+                                      const std::string& dtype, double threshold)
+{
+    pcbro::RawSource rawsrc;
+    auto cfg = rawsrc.default_configuration();
+    cfg["filename"] = fname;
+    cfg["start_trigger"] = "1";
+    cfg["dupind"] = true;
+    cfg["dtype"] = dtype;
+    cfg["workers"] = 2;
+    cfg["activity_threshold"] = threshold;
+    // above the noise, which is within 64 ADC of a baseline
+    cfg["activity_minimum"] = 40;
+    cfg["quiet"] = quiet;
+    rawsrc.configure(cfg);
+
+    std::vector<std::pair<int, bool>> ret;
+    while (true) {
+        WireCell::ITensorSet::pointer ts = nullptr;
+        if (! rawsrc(ts)) {
+            break;
+        }
+        if (!ts) {
+            continue;
+        }
+        auto md = ts->metadata();
+        if (threshold > 0) {
+            Assert(md["activity"].size() == 2);
+        }
+        else {
+            Assert(! md.isMember("activity"));
+        }
+        ret.emplace_back(ts->ident(), md["active"].asBool());
+    }
+    return ret;
+}
+
+int main()
+{
+    WireCell::Log::add_stdout(true, "info");
+
+    // names must parse as .bin file paths
+    const std::string fname = "/tmp/WIB00step18_FEMB_B8_1590484059"
+        + std::to_string(10 + ::getpid() % 90) + ".bin";
+    pcbro::SynthConfig scfg;
+    scfg.triggers = 10;
+    scfg.pulse_every = 3;
+    pcbro::synth_file(fname, scfg);
+
+    // A pulse gives 64 channels * 20 ticks * 1000 ADC to each group.
+    const double threshold = 1e6;
+
+    auto all = run(fname, "drop", "float", 0);
+    Assert(all.size() == scfg.triggers);
+
+    for (std::string dtype : {"float", "int16"}) {
+        auto tagged = run(fname, "tag", dtype, threshold);
+        Assert(tagged.size() == scfg.triggers);
+        for (const auto& [ident, active] : tagged) {
+            Assert(active == ((ident-1) % 3 == 0));
+        }
+
+        auto kept = run(fname, "drop", dtype, threshold);
+        Assert(kept.size() == 4);
+        for (const auto& [ident, active] : kept) {
+            Assert(active and (ident-1) % 3 == 0);
+        }
+        info("{}: {} of {} triggers active", dtype, kept.size(), tagged.size());
+    }
+
+    std::remove(fname.c_str());
+    return 0;
+}
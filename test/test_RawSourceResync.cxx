@@ -0,0 +1,145 @@
+// Check that with resync a break in the package sequence loses only
+// the damaged trigger and the rest of the file is still read.
+//
+// Usage: test_RawSourceResync [file.bin]
+//
+// The file, synthesized if not given, is copied with a corrupt
+// package header part way through.
+
+#include "WireCellPcbro/RawSource.h"
+
+#include "WireCellIface/ITensorSet.h"
+
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+
+#include <random>
+#include <cstdio>
+#include <unistd.h>
+
+using spdlog::info;
+
+// Write ntrig triggers of 4 links, each with nticks 32-channel
+// samples, packed into packages as big-endian words.
+void make_file(const std::string& fname, int ntrig, int nticks,
+               size_t package_size = pcbro::default_package_size)
+{
+    std::mt19937 rng(1234);
+    pcbro::raw_data_t rd;
+    uint32_t count = 1;
+    const size_t payload = package_size - 8;
+    for (int itrig=0; itrig<ntrig; ++itrig) {
+        for (int ilink=0; ilink<4; ++ilink) {
+            pcbro::raw_data_t link;
+            for (int itick=0; itick<nticks; ++itick) {
+                link.push_back(0xface);
+                for (int ind=0; ind<24; ++ind) {
+                    link.push_back((rng() & 0xffff) | 1);
+                }
+            }
+            for (size_t beg = 0; beg < link.size(); beg += payload) {
+                size_t end = std::min(beg + payload, link.size());
+                rd.insert(rd.end(), {(uint16_t)(count>>16), (uint16_t)(count&0xffff),
+                        0, 0, 0x1234, 0x5678, 0x9abc, 0xdef0});
+                rd.insert(rd.end(), link.begin() + beg, link.begin() + end);
+                ++count;
+            }
+        }
+    }
+    std::ofstream out(fname, std::ios_base::out | std::ios_base::binary);
+    for (auto w : rd) {
+        char buf[2] = {(char)(w>>8), (char)(w&0xff)};
+        out.write(buf, 2);
+    }
+}
+
+using frames_t = std::vector<std::vector<float>>;
+
+frames_t run(const std::string& fname, bool resync, const std::string& metrics = "")
+{
+    pcbro::RawSource rawsrc;
+    auto cfg = rawsrc.default_configuration();
+    cfg["filename"] = fname;
+    cfg["triggers"] = "100000";
+    cfg["resync"] = resync;
+    cfg["metrics"] = metrics;
+    rawsrc.configure(cfg);
+
+    frames_t ret;
+    while (true) {
+        WireCell::ITensorSet::pointer ts = nullptr;
+        if (! rawsrc(ts)) {
+            break;
+        }
+        if (!ts) {
+            continue;
+        }
+        Assert(ts->ident() == (int)ret.size() + 1);
+        auto frame = ts->tensors()->at(0);
+        const float* data = (const float*)frame->data();
+        ret.emplace_back(data, data + frame->size()/sizeof(float));
+    }
+    info("resync={}: {} triggers from {}", resync, ret.size(), fname);
+    return ret;
+}
+
+int main(int argc, char* argv[])
+{
+    // names must parse as .bin file paths
+    const std::string stem = "/tmp/WIB00step18_FEMB_B8_1590484059"
+        + std::to_string(10 + ::getpid() % 90);
+    std::string good = stem + ".bin";
+    if (argc > 1) {
+        good = argv[1];
+    }
+    else {
+        make_file(good, 20, 600);
+    }
+
+    // Damage the reserved word of the second package header of a
+    // trigger in the middle.
+    auto rd = pcbro::read_raw_data(good);
+    auto ri = pcbro::index_raw_data(rd.begin(), rd.end());
+    Assert(ri.triggers.size() > 4);
+    const size_t ibad = ri.triggers.size()/2;
+    auto pit = std::upper_bound(ri.packages.begin(), ri.packages.end(), ri.triggers[ibad].begin,
+                                [](size_t off, const pcbro::PackageIndex& pi) {
+                                    return off < pi.offset;
+                                });
+    const size_t woff = pit->offset + 2;
+    const std::string bad = stem + "_bad.bin";
+    {
+        std::ifstream in(good, std::ios_base::in | std::ios_base::binary);
+        std::string bytes((std::istreambuf_iterator<char>(in)), std::istreambuf_iterator<char>());
+        bytes[2*woff] = (char)0xde;
+        std::ofstream out(bad, std::ios_base::out | std::ios_base::binary);
+        out.write(bytes.data(), bytes.size());
+    }
+
+    auto want = run(good, false);
+    Assert(want.size() == ri.triggers.size());
+
+    // Without resync the file ends at the break.
+    auto ended = run(bad, false);
+    Assert(ended.size() <= ibad + 1);
+
+    // With resync only the damaged trigger is lost.
+    const std::string mfile = stem + "_metrics.json";
+    auto got = run(bad, true, mfile);
+    Assert(got.size() + 1 == want.size());
+    for (size_t ind = 0; ind < got.size(); ++ind) {
+        Assert(got[ind] == want[ind < ibad ? ind : ind+1]);
+    }
+
+    Json::Value jm;
+    std::ifstream(mfile) >> jm;
+    Assert(jm["total"]["corrupt"].asInt() == 1);
+    Assert(jm["total"]["dropped"].asInt() == 1);
+
+    std::remove(mfile.c_str());
+    std::remove(bad.c_str());
+    if (argc == 1) {
+        std::remove(good.c_str());
+    }
+    return 0;
+}
@@ -0,0 +1,179 @@
+// Check that selecting triggers by start_trigger and triggers or by
+// trigger_list gives the same tensor sets as taking them from a full
+// read, whether slurped, indexed or streamed and with either engine,
+// and that the metrics file counts them.
+//
+// Usage: test_RawSourceSelect [file.bin ...]
+//
+// With no file, raw data is synthesized to a temporary file.
+
+#include "WireCellPcbro/RawSource.h"
+
+#include "WireCellIface/ITensorSet.h"
+
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+
+#include <chrono>
+#include <map>
+#include <random>
+#include <cstdio>
+#include <unistd.h>
+
+using spdlog::info;
+
+// Write ntrig triggers of 4 links, each with nticks 32-channel
+// samples, packed into packages as big-endian words.
+void make_file(const std::string& fname, int ntrig, int nticks,
+               size_t package_size = pcbro::default_package_size)
+{
+    std::mt19937 rng(1234);
+    pcbro::raw_data_t rd;
+    uint32_t count = 1;
+    const size_t payload = package_size - 8;
+    for (int itrig=0; itrig<ntrig; ++itrig) {
+        for (int ilink=0; ilink<4; ++ilink) {
+            pcbro::raw_data_t link;
+            for (int itick=0; itick<nticks; ++itick) {
+                link.push_back(0xface);
+                for (int ind=0; ind<24; ++ind) {
+                    link.push_back((rng() & 0xffff) | 1);
+                }
+            }
+            for (size_t beg = 0; beg < link.size(); beg += payload) {
+                size_t end = std::min(beg + payload, link.size());
+                rd.insert(rd.end(), {(uint16_t)(count>>16), (uint16_t)(count&0xffff),
+                        0, 0, 0x1234, 0x5678, 0x9abc, 0xdef0});
+                rd.insert(rd.end(), link.begin() + beg, link.begin() + end);
+                ++count;
+            }
+        }
+    }
+    std::ofstream out(fname, std::ios_base::out | std::ios_base::binary);
+    for (auto w : rd) {
+        char buf[2] = {(char)(w>>8), (char)(w&0xff)};
+        out.write(buf, 2);
+    }
+}
+
+using frames_t = std::map<int, std::vector<float>>;
+
+frames_t run(const std::vector<std::string>& fnames, WireCell::Configuration cfg)
+{
+    pcbro::RawSource rawsrc;
+    auto full = rawsrc.default_configuration();
+    for (const auto& key : cfg.getMemberNames()) {
+        full[key] = cfg[key];
+    }
+    full["filename"] = Json::arrayValue;
+    for (const auto& fname : fnames) {
+        full["filename"].append(fname);
+    }
+
+    frames_t ret;
+    auto t0 = std::chrono::steady_clock::now();
+    rawsrc.configure(full);
+    while (true) {
+        WireCell::ITensorSet::pointer ts = nullptr;
+        if (! rawsrc(ts)) {
+            break;
+        }
+        if (!ts) {
+            continue;
+        }
+        auto frame = ts->tensors()->at(0);
+        const float* data = (const float*)frame->data();
+        ret[ts->ident()] = std::vector<float>(data, data + frame->size()/sizeof(float));
+    }
+    auto t1 = std::chrono::steady_clock::now();
+    info("{} triggers in {:.3f} s with {}", ret.size(),
+         std::chrono::duration<double>(t1-t0).count(), cfg);
+    return ret;
+}
+
+// Check got holds exactly the want idents of all.
+void check(const frames_t& all, const frames_t& got, const std::vector<int>& want)
+{
+    Assert(got.size() == want.size());
+    for (int ident : want) {
+        Assert(got.count(ident));
+        Assert(got.at(ident) == all.at(ident));
+    }
+}
+
+int main(int argc, char* argv[])
+{
+    std::vector<std::string> fnames;
+    std::string tmp;
+    for (int ind=1; ind<argc; ++ind) {
+        fnames.push_back(argv[ind]);
+    }
+    if (fnames.empty()) {
+        // name must parse as a .bin file path
+        tmp = "/tmp/WIB00step18_FEMB_B8_1590484059" + std::to_string(10 + ::getpid() % 90) + ".bin";
+        make_file(tmp, 20, 600);
+        fnames.push_back(tmp);
+        fnames.push_back(tmp);
+    }
+
+    WireCell::Configuration cfg;
+    cfg["triggers"] = "100000";
+    auto all = run(fnames, cfg);
+    const int ntrig = all.size();
+    Assert(ntrig > 4);
+
+    // The other decoder reads all the same.
+    cfg["engine"] = "binstream";
+    check(all, run(fnames, cfg), [&]() {
+        std::vector<int> idents;
+        for (const auto& one : all) {
+            idents.push_back(one.first);
+        }
+        return idents;
+    }());
+
+    for (const std::string engine : {"binfile", "binstream"}) {
+        for (const std::string index : {"none", "memory"}) {
+            for (bool stream : {false, true}) {
+                if ((stream or engine == "binstream") and index != "none") {
+                    continue;
+                }
+                cfg = WireCell::Configuration();
+                cfg["engine"] = engine;
+                cfg["index"] = index;
+                cfg["stream"] = stream;
+
+                cfg["start_trigger"] = std::to_string(ntrig-2);
+                cfg["triggers"] = "2";
+                check(all, run(fnames, cfg), {ntrig-2, ntrig-1});
+
+                // unsorted, repeated and past the end
+                cfg["trigger_list"].append(ntrig);
+                cfg["trigger_list"].append(2);
+                cfg["trigger_list"].append(std::to_string(ntrig/2));
+                cfg["trigger_list"].append(2);
+                cfg["trigger_list"].append(ntrig+10);
+                const std::string mfile = "/tmp/pcbro-metrics-" + std::to_string(::getpid()) + ".json";
+                cfg["metrics"] = mfile;
+                check(all, run(fnames, cfg), {2, ntrig/2, ntrig});
+
+                // reading stops at the last listed trigger
+                Json::Value jm;
+                std::ifstream(mfile) >> jm;
+                const auto& tot = jm["total"];
+                Assert(tot["decoded"].asInt() == 3);
+                Assert(tot["triggers"].asInt() == ntrig);
+                Assert(tot["skipped"].asInt() == ntrig-3);
+                Assert(tot["corrupt"].asInt() == 0);
+                Assert(tot["bytes"].asUInt64() > 0);
+                Assert(jm["files"].size() == fnames.size());
+                std::remove(mfile.c_str());
+            }
+        }
+    }
+
+    if (! tmp.empty()) {
+        std::remove(tmp.c_str());
+    }
+    return 0;
+}
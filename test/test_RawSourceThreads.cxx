@@ -0,0 +1,187 @@
+// Check that decoding triggers ahead with worker threads, and opening
+// files ahead, gives the same tensor sets, in the same order, as
+// decoding serially.
+//
+// Usage: test_RawSourceThreads [file.bin ...]
+//
+// With no file, raw data is synthesized to a temporary file.  A copy
+// with a corrupt trigger is also read between good files.
+
+#include "WireCellPcbro/RawSource.h"
+
+#include "WireCellIface/ITensorSet.h"
+
+#include "WireCellUtil/Testing.h"
+#include "WireCellUtil/Logging.h"
+
+#include <chrono>
+#include <random>
+#include <cstdio>
+#include <unistd.h>
+
+using spdlog::info;
+
+// Write ntrig triggers of 4 links, each with nticks 32-channel
+// samples, packed into packages as big-endian words.
+void make_file(const std::string& fname, int ntrig, int nticks,
+               size_t package_size = pcbro::default_package_size)
+{
+    std::mt19937 rng(1234);
+    pcbro::raw_data_t rd;
+    uint32_t count = 1;
+    const size_t payload = package_size - 8;
+    for (int itrig=0; itrig<ntrig; ++itrig) {
+        for (int ilink=0; ilink<4; ++ilink) {
+            pcbro::raw_data_t link;
+            for (int itick=0; itick<nticks; ++itick) {
+                link.push_back(0xface);
+                for (int ind=0; ind<24; ++ind) {
+                    link.push_back((rng() & 0xffff) | 1);
+                }
+            }
+            for (size_t beg = 0; beg < link.size(); beg += payload) {
+                size_t end = std::min(beg + payload, link.size());
+                rd.insert(rd.end(), {(uint16_t)(count>>16), (uint16_t)(count&0xffff),
+                        0, 0, 0x1234, 0x5678, 0x9abc, 0xdef0});
+                rd.insert(rd.end(), link.begin() + beg, link.begin() + end);
+                ++count;
+            }
+        }
+    }
+    std::ofstream out(fname, std::ios_base::out | std::ios_base::binary);
+    for (auto w : rd) {
+        char buf[2] = {(char)(w>>8), (char)(w&0xff)};
+        out.write(buf, 2);
+    }
+}
+
+struct Result {
+    std::vector<int> idents;
+    std::vector<std::vector<float>> frames;
+    double seconds{0};
+};
+
+Result run(const std::vector<std::string>& fnames, int workers, bool stream,
+           int start = 1, int triggers = 1000, int prefetch = 0,
+           const std::vector<int>& trigger_list = {})
+{
+    pcbro::RawSource rawsrc;
+    auto cfg = rawsrc.default_configuration();
+    cfg["filename"] = Json::arrayValue;
+    for (const auto& fname : fnames) {
+        cfg["filename"].append(fname);
+    }
+    cfg["start_trigger"] = std::to_string(start);
+    cfg["triggers"] = std::to_string(triggers);
+    cfg["workers"] = workers;
+    cfg["stream"] = stream;
+    cfg["prefetch"] = prefetch;
+    cfg["trigger_list"] = Json::arrayValue;
+    for (int one : trigger_list) {
+        cfg["trigger_list"].append(one);
+    }
+
+    Result res;
+    auto t0 = std::chrono::steady_clock::now();
+    rawsrc.configure(cfg);
+    while (true) {
+        WireCell::ITensorSet::pointer ts = nullptr;
+        if (! rawsrc(ts)) {
+            break;
+        }
+        if (!ts) {
+            continue;
+        }
+        res.idents.push_back(ts->ident());
+        auto frame = ts->tensors()->at(0);
+        const float* data = (const float*)frame->data();
+        res.frames.emplace_back(data, data + frame->size()/sizeof(float));
+    }
+    auto t1 = std::chrono::steady_clock::now();
+    res.seconds = std::chrono::duration<double>(t1-t0).count();
+    info("workers={} stream={} prefetch={} start={}: {} triggers in {:.3f} s",
+         workers, stream, prefetch, start, res.idents.size(), res.seconds);
+    return res;
+}
+
+void same(const Result& a, const Result& b)
+{
+    Assert(a.idents == b.idents);
+    Assert(a.frames == b.frames);
+}
+
+int main(int argc, char* argv[])
+{
+    std::vector<std::string> fnames;
+    std::string tmp;
+    for (int ind=1; ind<argc; ++ind) {
+        fnames.push_back(argv[ind]);
+    }
+    if (fnames.empty()) {
+        // name must parse as a .bin file path
+        tmp = "/tmp/WIB00step18_FEMB_B8_1590484058" + std::to_string(10 + ::getpid() % 90) + ".bin";
+        make_file(tmp, 20, 600);
+        fnames.push_back(tmp);
+        fnames.push_back(tmp);
+        fnames.push_back(tmp);
+    }
+
+    for (bool stream : {false, true}) {
+        auto serial = run(fnames, 0, stream);
+        Assert(serial.idents.size() > 0);
+        for (int workers : {1, 2, 4}) {
+            same(serial, run(fnames, workers, stream));
+        }
+        // start and count limits apply the same
+        same(run(fnames, 0, stream, 5, 7), run(fnames, 3, stream, 5, 7));
+        // files opened ahead, including past the last wanted trigger
+        for (int prefetch : {1, 2}) {
+            same(serial, run(fnames, 0, stream, 1, 1000, prefetch));
+            same(serial, run(fnames, 2, stream, 1, 1000, prefetch));
+            same(run(fnames, 0, stream, 5, 7), run(fnames, 1, stream, 5, 7, prefetch));
+        }
+    }
+
+    // Damage the reserved word of the second package header of a
+    // trigger in the middle of a copy of the first file.  The file
+    // ends there and following files are numbered on from it.
+    auto rd = pcbro::read_raw_data(fnames[0]);
+    auto ri = pcbro::index_raw_data(rd.begin(), rd.end());
+    Assert(ri.triggers.size() > 4);
+    const size_t ibad = ri.triggers.size()/2;
+    auto pit = std::upper_bound(ri.packages.begin(), ri.packages.end(), ri.triggers[ibad].begin,
+                                [](size_t off, const pcbro::PackageIndex& pi) {
+                                    return off < pi.offset;
+                                });
+    const size_t woff = pit->offset + 2;
+    const std::string bad = fnames[0].substr(0, fnames[0].size()-4) + "_bad.bin";
+    {
+        std::ifstream in(fnames[0], std::ios_base::in | std::ios_base::binary);
+        std::string bytes((std::istreambuf_iterator<char>(in)), std::istreambuf_iterator<char>());
+        bytes[2*woff] = (char)0xde;
+        std::ofstream out(bad, std::ios_base::out | std::ios_base::binary);
+        out.write(bytes.data(), bytes.size());
+    }
+    const std::vector<std::string> withbad{fnames[0], bad, fnames[0]};
+    const int ngood = ri.triggers.size();
+    // the good triggers of the bad file, some of the last file
+    const std::vector<int> tlist{2, ngood + 1, ngood + (int)ibad, ngood + (int)ibad + 1,
+                                 ngood + (int)ibad + 3, 2*ngood + 1};
+    for (bool stream : {false, true}) {
+        auto serial = run(withbad, 0, stream);
+        Assert(serial.idents.size() == ngood + ibad + ngood);
+        for (int workers : {1, 2, 4}) {
+            same(serial, run(withbad, workers, stream));
+            same(run(withbad, 0, stream, ngood + 2, ngood),
+                 run(withbad, workers, stream, ngood + 2, ngood));
+            same(run(withbad, 0, stream, 1, 1000, 0, tlist),
+                 run(withbad, workers, stream, 1, 1000, 1, tlist));
+        }
+    }
+    std::remove(bad.c_str());
+
+    if (! tmp.empty()) {
+        std::remove(tmp.c_str());
+    }
+    return 0;
+}
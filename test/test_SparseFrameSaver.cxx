@@ -0,0 +1,31 @@
+// Check finding regions of interest as SparseFrameSaver stores them.
+//
+// Usage: test_SparseFrameSaver
+
+#include "WireCellPcbro/SparseFrameSaver.h"
+
+#include "WireCellUtil/Testing.h"
+
+int main()
+{
+    std::vector<pcbro::roi_t> rois;
+    std::vector<float> samples;
+
+    const std::vector<float> wave{0, 5, -6, 0.5, 0, 7, 8};
+    pcbro::add_rois(rois, samples, 3, 10, wave.data(), wave.size(), 1.0);
+    Assert(rois.size() == 2);
+    Assert(rois[0].column == 3 and rois[0].first == 11 and rois[0].count == 2);
+    Assert(rois[1].column == 3 and rois[1].first == 15 and rois[1].count == 2);
+    Assert(samples == std::vector<float>({5, -6, 7, 8}));
+
+    // a quiet wave adds nothing
+    const std::vector<float> quiet(100, 0.5);
+    pcbro::add_rois(rois, samples, 4, 0, quiet.data(), quiet.size(), 1.0);
+    Assert(rois.size() == 2 and samples.size() == 4);
+
+    // all of a wave above threshold is one region
+    pcbro::add_rois(rois, samples, 5, 0, quiet.data(), quiet.size(), 0.0);
+    Assert(rois.size() == 3 and rois[2].count == 100);
+    Assert(samples.size() == 104);
+    return 0;
+}
@@ -0,0 +1,94 @@
+#!/usr/bin/env bats
+
+# Check "wirecell-pcbro activity" on signal NPZ files shaped as
+# sigproc writes them.  Like all sig-*.npz, both files of setup name
+# their frames frame_gauss0_<N> with the same trigger numbers.
+
+sigfiles=(sig-gauss0-159048405892.npz sig-gauss0-159048410034.npz)
+
+# Write sigfiles with triggers 0-3 and 50.  Triggers 0 and 2 of the
+# first and 1 and 2 of the second have a pulse, as does trigger 50 of
+# both.  Their frames are saved as frames.npz keyed by
+# "<file name>:<trigger>".
+setup () {
+    cd $BATS_TEST_TMPDIR
+    python3 - ${sigfiles[@]} <<'PYEOF'
+import sys
+import numpy
+pulsed = [(0, 2, 50), (1, 2, 50)]
+rng = numpy.random.default_rng(42)
+frames = dict()
+for fname, pulses in zip(sys.argv[1:], pulsed):
+    arrs = dict()
+    for trig in (0, 1, 2, 3, 50):
+        frame = rng.uniform(-4, 4, size=(600, 192)).astype(numpy.float32)
+        if trig in pulses:
+            frame[100:120, :128] += 100
+        arrs[f'frame_gauss0_{trig}'] = frame
+        arrs[f'channels_gauss0_{trig}'] = numpy.arange(192, dtype=numpy.int32)
+        arrs[f'tickinfo_gauss0_{trig}'] = numpy.array([0, 500, 0], dtype=numpy.float64)
+        frames[f'{fname}:{trig}'] = frame
+    numpy.savez(fname, **arrs)
+numpy.savez("frames.npz", **frames)
+PYEOF
+}
+
+# Check the frames of an activity output.  Arguments are the output
+# file then pairs of a saved key and the "<file name>:<trigger>" of
+# its frame.
+check_frames () {
+    python3 - "$@" <<'PYEOF'
+import sys
+import numpy
+out = numpy.load(sys.argv[1])
+want = dict(zip(sys.argv[2::2], sys.argv[3::2]))
+frames = numpy.load("frames.npz")
+assert sorted(out.files) == sorted(want), sorted(out.files)
+for key, src in want.items():
+    assert numpy.array_equal(out[key], frames[src]), key
+PYEOF
+}
+
+@test "activity saves frames of many files under their timestamps" {
+    cd $BATS_TEST_TMPDIR
+    a=${sigfiles[0]}
+    b=${sigfiles[1]}
+    wirecell-pcbro activity -t 1000 -o many.npz ${sigfiles[@]}
+    run check_frames many.npz \
+        frame_gauss0_159048405800 $a:0 frame_gauss0_159048405802 $a:2 \
+        frame_gauss0_159048410001 $b:1 frame_gauss0_159048410002 $b:2
+    echo "$output"
+    [ "$status" -eq 0 ]
+
+    mkdir sigs
+    mv ${sigfiles[@]} sigs/
+    wirecell-pcbro activity -t 1000 --max-trigger 0 -o dir.npz sigs
+    run check_frames dir.npz \
+        frame_gauss0_159048405800 $a:0 frame_gauss0_159048405802 $a:2 \
+        frame_gauss0_159048405850 $a:50 \
+        frame_gauss0_159048410001 $b:1 frame_gauss0_159048410002 $b:2 \
+        frame_gauss0_159048410050 $b:50
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "activity keeps the keys of one file" {
+    cd $BATS_TEST_TMPDIR
+    a=${sigfiles[0]}
+    wirecell-pcbro activity -t 1000 -o one.npz $a
+    run check_frames one.npz frame_gauss0_0 $a:0 frame_gauss0_2 $a:2
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "activity leaves no output when a file fails" {
+    cd $BATS_TEST_TMPDIR
+    python3 -c '
+import zipfile
+with zipfile.ZipFile("sig-gauss0-159048420000.npz", "w") as zf:
+    zf.writestr("frame_gauss0_0.npy", b"not an array")'
+    run wirecell-pcbro activity -t 1000 -o bad.npz ${sigfiles[@]} sig-gauss0-159048420000.npz
+    echo "$output"
+    [ "$status" -ne 0 ]
+    [ ! -e bad.npz ]
+}
@@ -0,0 +1,63 @@
+#!/usr/bin/env bats
+
+# Check that wirecell-pcbro starts quickly and that merely running it
+# does not import plotting or other heavy modules.  Set
+# PCBRO_HELP_MAX_MS to change the allowed mean --help latency.
+
+heavy=("matplotlib" "pylab" "scipy" "wirecell.sigproc" "numpy")
+
+loaded_modules () {
+    python3 - "$@" <<'PYEOF'
+import sys
+from wirecell.pcbro.__main__ import cli
+try:
+    cli(sys.argv[1:], standalone_mode=False, obj=dict())
+except SystemExit:
+    pass
+print("\n".join(sorted(sys.modules)))
+PYEOF
+}
+
+@test "wirecell-pcbro --help imports no heavy modules" {
+    run loaded_modules --help
+    [ "$status" -eq 0 ]
+    for mod in ${heavy[@]}
+    do
+        if echo "$output" | grep -q "^${mod}\(\.\|$\)" ; then
+            echo "--help imported $mod"
+            false
+        fi
+    done
+}
+
+@test "wirecell-pcbro subcommand --help imports no heavy modules" {
+    for cmd in $(wirecell-pcbro --help | awk '/^Commands:/{on=1;next} on{print $1}')
+    do
+        run loaded_modules "$cmd" --help
+        [ "$status" -eq 0 ]
+        for mod in ${heavy[@]}
+        do
+            if echo "$output" | grep -q "^${mod}\(\.\|$\)" ; then
+                echo "$cmd --help imported $mod"
+                false
+            fi
+        done
+    done
+}
+
+@test "wirecell-pcbro --help latency" {
+    local maxms="${PCBRO_HELP_MAX_MS:-500}"
+    local n=5
+    wirecell-pcbro --help > /dev/null # warm any caches
+    local t0=$(date +%s%N)
+    for i in $(seq $n)
+    do
+        wirecell-pcbro --help > /dev/null
+    done
+    local t1=$(date +%s%N)
+    local ms=$(( (t1 - t0) / 1000000 / n ))
+    echo "# wirecell-pcbro --help: ${ms} ms (max ${maxms} ms)" >&3
+    python3 -X importtime -c "import wirecell.pcbro.__main__" 2>&1 \
+        | sort -t'|' -k2 -n | tail -5 | sed 's/^/# /' >&3
+    [ "$ms" -le "$maxms" ]
+}
@@ -0,0 +1,53 @@
+#!/usr/bin/env bats
+
+# Check "wirecell-pcbro compile-config" against jsonnet and that its
+# cache is used until a .jsonnet file changes.  Needs jsonnet.
+
+setup () {
+    cd $BATS_TEST_TMPDIR
+    mkdir -p cfg
+    cat > cfg/lib.jsonnet <<'EOF2'
+{ number(val) :: if std.isString(val) then std.parseJson(val) else val }
+EOF2
+    cat > cfg/tpl.jsonnet <<'EOF2'
+local lib = import "lib.jsonnet";
+function(infile, outfiles, rawfile="", resp="resp.json", activity=0) [
+    {type: "Source", data: {filename: infile, activity: lib.number(activity)}},
+    {type: "FieldResponse", name: resp, data: {filename: resp}}
+] + [{type: "Sink", name: "out%d" % n, data: {filename: outfiles[n]}}
+     for n in std.range(0, std.length(outfiles)-1)]
+  + (if rawfile == "" then [] else [{type: "Sink", name: "raw", data: {filename: rawfile}}])
+  + [{edges: ["FieldResponse:" + resp]}]
+EOF2
+}
+
+# Compile tpl.jsonnet for files a and b with the cache and compare to
+# jsonnet run directly.  Extra arguments are given to compile-config.
+same_as_jsonnet () {
+    local a=$1 b=$2; shift 2
+    rm -f got.json
+    wirecell-pcbro compile-config -c cache -J cfg "$@" -o got.json \
+                   -f infile=$a.bin -F outfiles=$a.npz -F outfiles=$b.npz \
+                   -f resp=$a.json -A activity=1e6 tpl.jsonnet || return 1
+    jsonnet -J cfg --tla-str infile=$a.bin --tla-code outfiles="[\"$a.npz\",\"$b.npz\"]" \
+            --tla-str resp=$a.json --tla-str activity=1e6 cfg/tpl.jsonnet > want.json
+    python3 -c 'import json, sys; assert json.load(open("got.json")) == json.load(open("want.json"))'
+}
+
+@test "compile-config matches jsonnet" {
+    command -v jsonnet || skip "no jsonnet"
+    same_as_jsonnet a b
+    [ $(ls cache | wc -l) -eq 1 ]
+}
+
+@test "compile-config reuses its cache until cfg changes" {
+    command -v jsonnet || skip "no jsonnet"
+    same_as_jsonnet a b
+    # other file names, with jsonnet unavailable to compile-config
+    same_as_jsonnet c d --jsonnet false
+    echo "// changed" >> cfg/lib.jsonnet
+    run same_as_jsonnet c d --jsonnet false
+    [ "$status" -ne 0 ]
+    same_as_jsonnet c d
+    [ $(ls cache | wc -l) -eq 2 ]
+}
@@ -0,0 +1,252 @@
+#!/usr/bin/env bats
+
+# Check "wirecell-pcbro decode" against PcbroRawSource.  Give .bin
+# files with PCBRO_BIN_FILES (space separated) or put some in
+# data/bin/.  The cross check needs wire-cell and this package's cfg/
+# in WIRECELL_PATH.  Without any, tests run on a synthetic .bin file
+# with known ADCs as test_BinSynth makes.
+
+# Name of the synthetic file, which must parse as a .bin file path.
+synthfile=WIB00step18_FEMB_B8_1590484000.bin
+
+# Write synthfile, in the format BinSynth.h describes, with 6 triggers
+# of 200 ticks.  Every third trigger, from the first, has a pulse.
+setup () {
+    cd $BATS_TEST_TMPDIR
+    python3 - $synthfile <<'PYEOF'
+import sys
+import numpy
+from wirecell.pcbro.binfile import package_size, segments
+
+def adcs(itrig, nticks=200):
+    tick = numpy.arange(nticks).reshape(-1, 1)
+    chan = numpy.arange(128).reshape(1, -1)
+    adc = 0x200 + 0x10*(chan % 64) + (itrig*7 + tick*13 + chan*29) % 64
+    if itrig % 3 == 0:
+        adc[nticks//4:nticks//4 + 20] += 1000
+    return adc.astype(numpy.uint16)
+
+def link_words(adc):
+    words = numpy.zeros((adc.shape[0], 25), dtype=numpy.uint16)
+    words[:, 0] = 0xface
+    words[0, 0] = 0xfeed
+    for igrp, seg in enumerate(segments):
+        c = [adc[:, seg + ind].astype(numpy.uint32) for ind in range(4)]
+        words[:, 1 + 3*igrp] = (c[3] & 0x0fff) | ((c[2] & 0x000f) << 12)
+        words[:, 2 + 3*igrp] = ((c[2] & 0x0ff0) >> 4) | ((c[1] & 0x00ff) << 8)
+        words[:, 3 + 3*igrp] = ((c[1] & 0x0f00) >> 8) | ((c[0] & 0x0fff) << 4)
+    return words.reshape(-1)
+
+out = list()
+count = 1
+def header():
+    global count
+    out.extend([count >> 16, count & 0xffff, 0, 0, 0x1234, 0x5678, 0x9abc, 0])
+    count += 1
+
+for itrig in range(6):
+    adc = adcs(itrig)
+    for ilink in range(4):
+        data = link_words(adc[:, 32*ilink:32*(ilink+1)])
+        beg = 0
+        while True:
+            start = len(out)
+            header()
+            room = package_size - 8
+            if beg < data.size and beg % 25 == 0:
+                out.append(0)
+                room -= 1
+            end = min(beg + room, data.size)
+            out.extend(data[beg:end].tolist())
+            beg = end
+            if len(out) - start < package_size:
+                break
+header()
+numpy.array(out, dtype='>u2').tofile(sys.argv[1])
+numpy.save("synth-adcs.npy", numpy.array([adcs(itrig) for itrig in range(6)]))
+PYEOF
+}
+
+binfiles () {
+    if [ -n "$PCBRO_BIN_FILES" ] ; then
+        echo $PCBRO_BIN_FILES
+    elif ls $(dirname $BATS_TEST_DIRNAME)/data/bin/*.bin >/dev/null 2>&1 ; then
+        ls $(dirname $BATS_TEST_DIRNAME)/data/bin/*.bin
+    else
+        echo $BATS_TEST_TMPDIR/$synthfile
+    fi
+}
+
+# Compare frames of two NPZ files in trigger order as the two may
+# number frames differently.
+same_frames () {
+    python3 - "$@" <<'PYEOF'
+import sys
+import numpy
+from wirecell.pcbro.activity import parse_frame_key
+
+def frames(fname):
+    f = numpy.load(fname)
+    keys = [k for k in f.files if parse_frame_key(k)]
+    keys.sort(key=lambda k: parse_frame_key(k)[1])
+    return [f[k] for k in keys]
+
+got, want = frames(sys.argv[1]), frames(sys.argv[2])
+print(f'{len(got)} and {len(want)} frames')
+assert len(got) == len(want) and len(got) > 0
+for one, two in zip(got, want):
+    assert one.shape == two.shape, (one.shape, two.shape)
+    assert numpy.array_equal(one, two)
+PYEOF
+}
+
+@test "decode gives the ADCs of synthetic data" {
+    cd $BATS_TEST_TMPDIR
+    wirecell-pcbro decode -o synth.npz $synthfile
+    wirecell-pcbro decode -s 2 -t 3 -f packed12 --alias -o synth-packed.npz $synthfile
+    run python3 - <<'PYEOF'
+import numpy
+from wirecell.pcbro.binfile import chan_phy
+from wirecell.pcbro.framestore import load
+adcs = numpy.load("synth-adcs.npy")
+cols = chan_phy - 1
+for fname, idents in [("synth.npz", range(1, 7)), ("synth-packed.npz", range(2, 5))]:
+    f = load(fname)
+    assert sorted(k for k in f.keys() if k.startswith("frame_")) == sorted(f'frame__{n}' for n in idents)
+    for ident in idents:
+        frame = f[f'frame__{ident}']
+        assert frame.dtype == numpy.int16 and frame.shape == (200, 192)
+        want = adcs[ident-1]
+        assert numpy.array_equal(frame[:, cols], want)
+        # the third plane repeats the induction plane
+        assert numpy.array_equal(frame[:, 128:], frame[:, 64:128])
+PYEOF
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "decode keeps the synthetic triggers with pulses" {
+    cd $BATS_TEST_TMPDIR
+    # a pulse gives 64 channels * 20 ticks * 1000 ADC to each plane
+    wirecell-pcbro decode -a 1e6 --activity-minimum 40 -o active.npz $synthfile
+    run python3 -c '
+import numpy
+f = numpy.load("active.npz")
+assert sorted(k for k in f.files if k.startswith("frame_")) == ["frame__1", "frame__4"]'
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "decode matches PcbroRawSource" {
+    local files=( $(binfiles) )
+    [ ${#files[@]} -gt 0 ] || skip "no .bin files"
+    command -v wire-cell || skip "no wire-cell"
+
+    cd $BATS_TEST_TMPDIR
+    local infile="${files[0]}"
+    wire-cell -A infile="$infile" -A outfile=raw-wct.npz \
+              -c cli-bin-npz.jsonnet
+    # cli-bin-npz.jsonnet writes at most 50 triggers
+    wirecell-pcbro decode -t 50 -o raw-py.npz "$infile"
+    run same_frames raw-py.npz raw-wct.npz
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "decode selects triggers across files" {
+    local files=( $(binfiles) )
+    [ ${#files[@]} -gt 0 ] || skip "no .bin files"
+
+    cd $BATS_TEST_TMPDIR
+    wirecell-pcbro decode -o all.npz ${files[@]} ${files[@]}
+    wirecell-pcbro decode -n 2 -l 2,3 -o list.npz ${files[@]} ${files[@]}
+    run python3 - <<'PYEOF'
+import numpy
+a, b = numpy.load("all.npz"), numpy.load("list.npz")
+assert sorted(b.files) == sorted(f'{n}__{t}' for n in ("frame", "channels", "tickinfo") for t in (2, 3))
+for t in (2, 3):
+    assert a[f'frame__{t}'].shape[1] == 192
+    assert numpy.array_equal(a[f'frame__{t}'][:, :128], b[f'frame__{t}'])
+    assert numpy.array_equal(a[f'frame__{t}'][:, 64:128], a[f'frame__{t}'][:, 128:])
+PYEOF
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "decode compact frames read back the same" {
+    local files=( $(binfiles) )
+    [ ${#files[@]} -gt 0 ] || skip "no .bin files"
+
+    cd $BATS_TEST_TMPDIR
+    local infile="${files[0]}"
+    wirecell-pcbro decode -t 10 -o plain.npz "$infile"
+    wirecell-pcbro decode -t 10 -f packed12 --alias -o packed.npz "$infile"
+    run python3 - <<'PYEOF'
+import os
+import numpy
+from wirecell.pcbro.framestore import load
+a, b = load("plain.npz"), load("packed.npz")
+assert sorted(a.keys()) == sorted(k for k in b.keys() if not k.startswith("alias_"))
+for key in a.keys():
+    assert a[key].dtype == b[key].dtype and numpy.array_equal(a[key], b[key])
+# half of int16, a quarter of float
+assert os.path.getsize("packed.npz") < 0.55*os.path.getsize("plain.npz")
+PYEOF
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "decode matches PcbroRawNpzSink" {
+    local files=( $(binfiles) )
+    [ ${#files[@]} -gt 0 ] || skip "no .bin files"
+    command -v wire-cell || skip "no wire-cell"
+
+    cd $BATS_TEST_TMPDIR
+    local infile="${files[0]}"
+    wire-cell -A infile="$infile" -A outfile=raw-wct.npz -A format=packed12 \
+              -c cli-bin-npz.jsonnet
+    wirecell-pcbro decode -t 50 -o raw-py.npz "$infile"
+    run python3 - <<'PYEOF'
+import numpy
+from wirecell.pcbro.framestore import load
+a, b = load("raw-py.npz"), load("raw-wct.npz")
+assert sorted(a.keys()) == sorted(k for k in b.keys() if not k.startswith("alias_"))
+for key in a.keys():
+    assert numpy.array_equal(a[key], b[key]), key
+PYEOF
+    echo "$output"
+    [ "$status" -eq 0 ]
+}
+
+@test "decode drops triggers quiet in raw activity" {
+    local files=( $(binfiles) )
+    [ ${#files[@]} -gt 0 ] || skip "no .bin files"
+
+    cd $BATS_TEST_TMPDIR
+    local infile="${files[0]}"
+    wirecell-pcbro decode -t 10 -o all.npz "$infile"
+    # the median raw activity keeps about half
+    local cut=$(python3 - <<'PYEOF'
+import numpy
+from wirecell.pcbro import activity as act
+items = act.frame_items("all.npz", "")
+meas = [m for _, m in act.raw_activity(items)]
+print(numpy.median(meas))
+PYEOF
+)
+    wirecell-pcbro decode -t 10 -a $cut -o active.npz "$infile"
+    run python3 - $cut <<'PYEOF'
+import sys
+import numpy
+from wirecell.pcbro import activity as act
+cut = float(sys.argv[1])
+a, b = numpy.load("all.npz"), numpy.load("active.npz")
+want = [item[1] for item, m in act.raw_activity(act.frame_items("all.npz", "")) if m >= cut]
+got = [item[1] for item in act.frame_items("active.npz", "")]
+assert got == want and 0 < len(got) < 10
+for key in got:
+    assert numpy.array_equal(a[key], b[key])
+PYEOF
+    echo "$output"
+    [ "$status" -eq 0 ]
+}